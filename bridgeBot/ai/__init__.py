@@ -0,0 +1,12 @@
+#   ai/__init__.py
+from .solver import DoubleDummySolver, solve_deal, solve_bidding
+from .playout import greedy_playout
+from .pimc import PIMCAgent
+from .partner import PartnerRecommender, get_recommender
+from .tricktable import TrickTable, TableAgent, build_table, get_trick_table
+
+__all__ = [
+    'DoubleDummySolver', 'solve_deal', 'solve_bidding', 'greedy_playout',
+    'PIMCAgent', 'PartnerRecommender', 'get_recommender',
+    'TrickTable', 'TableAgent', 'build_table', 'get_trick_table'
+]
@@ -0,0 +1,5 @@
+#   ai/__main__.py
+from ai.tricktable import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#   ai/partner.py
+"""
+Recommendation of the partner card, ranking the cards the bid winner may
+call by the estimated success of the contract.
+
+The hidden hands are sampled: the 39 cards the bid winner does not hold are
+dealt to the three other seats, consistently with what the winner knows,
+i.e. every hand is a valid one (see `rules.MIN_HAND_VALUE`) and a seat that
+bid a suit holds at least MIN_BID_LENGTH cards of it. Each sample is played
+out greedily (see `ai.playout`) once per seat the partner may sit in, and
+every card the sample deals to that seat scores the outcome: so every sample
+scores all 39 candidate cards with three playouts.
+
+Results depend only on the hand, the contract and the suits shown, so they
+are cached under that key, and bots calling the same hand again get their
+answer at once.
+"""
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import wait
+from game import bits, rules
+from .pimc import get_pool
+from .playout import greedy_playout
+
+#   The fewest cards of a suit a seat that bid it is assumed to hold.
+MIN_BID_LENGTH = 3
+
+#   The seats, relative to the bid winner at seat 0.
+OTHERS = (1, 2, 3)
+
+
+class Recommendation:
+    """
+    The estimated outcome of calling a partner card.
+
+    Attributes:
+        card (int):         The card index.
+        success (float):    The share of samples where the contract is made.
+        tricks (float):     The mean sets taken by the declaring side.
+        samples (int):      The number of samples scored.
+        confident (bool):   False if a process of the pool did not answer
+                            in time, so fewer samples were scored.
+    """
+    __slots__ = ('card', 'success', 'tricks', 'samples', 'confident')
+
+    def __init__(self, card, success, tricks, samples, confident=True):
+        self.card = card
+        self.success = success
+        self.tricks = tricks
+        self.samples = samples
+        self.confident = confident
+
+    def __repr__(self):
+        return f'Recommendation({bits.card_name(self.card)}, ' \
+               f'{self.success:.2f}, {self.tricks:.2f})'
+
+
+
+def sample_hands(rng, hand, unseen, lengths, attempts=50):
+    """
+    Deals the `unseen` cards to the seats after the bid winner.
+
+    Arguments:
+        rng (Random):           Draws the deal.
+        hand (int):             The mask of the bid winner, at seat 0.
+        unseen (list of int):   The card indices the winner does not hold.
+        lengths (tuple):        The (seat, suit) pairs of the suits shown,
+                                held at least MIN_BID_LENGTH times.
+
+    Returns:
+        list of int: The hand of every seat. Once `attempts` deals broke the
+        constraints, the last one is returned anyway.
+    """
+    cards = list(unseen)
+    for _ in range(attempts):
+        rng.shuffle(cards)
+        hands = [hand] + [ bits.mask_of(cards[start:start + bits.N_RANKS])
+                           for start in range(0, len(cards), bits.N_RANKS) ]
+        if all( (hands[seat] & bits.SUIT_MASKS[suit]).bit_count()
+                >= MIN_BID_LENGTH for seat, suit in lengths ) and \
+                all( bits.hand_value(hands[seat]) >= rules.MIN_HAND_VALUE
+                     for seat in OTHERS ):
+            break
+    return hands
+
+
+def score_samples(task):
+    """
+    Scores every candidate partner card over samples, until a deadline.
+
+    Arguments:
+        task (tuple):   The (hand, trump, level, lengths, seed, n_samples,
+                        deadline) of the evaluation: the bid winner's mask,
+                        the trump index and level of the contract, the suits
+                        shown as for `sample_hands`, the seed of the samples,
+                        their number and the `time.monotonic` deadline.
+
+    Returns:
+        tuple: The contracts made and the sets taken with every card index
+        as the partner card, and the number of samples scored. At least one
+        sample is scored whatever the deadline.
+    """
+    hand, trump, level, lengths, seed, n_samples, deadline = task
+    rng = random.Random(seed)
+    unseen = [ card for card in range(bits.N_CARDS) if not hand >> card & 1 ]
+    need = rules.contract_targets(level)[0]
+    leader = rules.opening_leader(0, trump)
+    made = [0] * bits.N_CARDS
+    taken = [0] * bits.N_CARDS
+    done = 0
+    while done < n_samples:
+        if done and time.monotonic() > deadline:
+            break
+        hands = sample_hands(rng, hand, unseen, lengths)
+        for partner in OTHERS:
+            declarers = [ seat in (0, partner) for seat in range(4) ]
+            tricks = greedy_playout(hands, trump, leader, declarers)
+            success = tricks >= need
+            for card in bits.iter_cards(hands[partner]):
+                made[card] += success
+                taken[card] += tricks
+        done += 1
+    return made, taken, done
+
+
+
+class PartnerRecommender:
+    """
+    Ranks the partner cards of a bid winner within a time budget, sampling
+    across the process pool of `ai.pimc`, with an LRU cache of the rankings.
+    Safe to share between threads.
+
+    Attributes:
+        budget (float):     The seconds to sample per ranking.
+        n_samples (int):    The most samples per ranking.
+        workers (int):      The processes of the shared pool to sample with,
+                            by default one per CPU; 0 to sample in process.
+        cache_size (int):   The most rankings cached.
+        rng (Random):       Seeds the samples.
+        cache (OrderedDict):    The cached rankings, least recent first.
+        hits (int):         The number of rankings served from the cache.
+        misses (int):       The number of rankings sampled.
+    """
+    def __init__(self, budget=0.25, n_samples=400, workers=None,
+                 cache_size=4096, seed=None):
+        self.budget = budget
+        self.n_samples = n_samples
+        self.workers = workers
+        self.cache_size = cache_size
+        self.rng = random.Random(seed)
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def shown_lengths(auction, bidder):
+        """
+        Returns the suits shown by the other seats of an AuctionState, as
+        (seat relative to the bid winner, suit) pairs.
+        """
+        n = auction.n
+        return tuple( ((seat - bidder) % n, trump)
+                      for seat in range(n) if seat != bidder
+                      for trump in auction.shown_trumps(seat)
+                      if trump != rules.NO_TRUMP )
+
+    def rank(self, hand, trump, level, lengths=()):
+        """
+        Ranks the partner cards of a bid winner holding `hand`.
+
+        Arguments:
+            hand (int):         The card mask of the bid winner.
+            trump (int):        The trump index of the contract.
+            level (int):        The level of the contract.
+            lengths (tuple):    The suits shown by the other seats, as
+                                `shown_lengths`.
+
+        Returns:
+            list of Recommendation: Every card the winner does not hold, by
+            descending success, then mean sets taken. Rankings which are not
+            `confident` are not cached.
+        """
+        key = (hand, trump, level, lengths)
+        with self._lock:
+            ranking = self.cache.get(key)
+            if ranking is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return ranking
+        made, taken, done, confident = self._sample(hand, trump, level,
+                                                    lengths)
+        ranking = sorted(( Recommendation(card, made[card] / done,
+                                          taken[card] / done, done, confident)
+                           for card in range(bits.N_CARDS)
+                           if not hand >> card & 1 ),
+                         key=lambda r: (-r.success, -r.tricks, r.card))
+        with self._lock:
+            self.misses += 1
+            if confident:
+                self.cache[key] = ranking
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return ranking
+
+    def _sample(self, hand, trump, level, lengths):
+        """
+        Scores the cards, across the pool unless `workers` is 0. Processes
+        of the pool which do not answer in time, e.g. as they are busy
+        searching, are abandoned and the result is not confident; when none
+        answers, samples are scored in process instead for what remains of
+        the budget, at least one.
+
+        Returns:
+            tuple: The (made, taken, samples) of `score_samples`, and whether
+            the result is confident.
+        """
+        deadline = time.monotonic() + self.budget
+        seed = self.rng.getrandbits(64)
+        if self.workers == 0:
+            return score_samples((hand, trump, level, lengths, seed,
+                                  self.n_samples, deadline)) + (True,)
+        chunks = self.workers or os.cpu_count() or 1
+        pool = get_pool(chunks)
+        futures = [ pool.submit(score_samples, (
+                        hand, trump, level, lengths, seed + chunk,
+                        -(-self.n_samples // chunks), deadline))
+                    for chunk in range(chunks) ]
+        done, late = wait(futures, timeout=self.budget * 2)
+        #   Chunks not started yet are dropped, the others stop at the
+        #   deadline
+        for future in late:
+            future.cancel()
+        made = [0] * bits.N_CARDS
+        taken = [0] * bits.N_CARDS
+        count = 0
+        for future in done:
+            chunk_made, chunk_taken, chunk_count = future.result()
+            count += chunk_count
+            for card in range(bits.N_CARDS):
+                made[card] += chunk_made[card]
+                taken[card] += chunk_taken[card]
+        if not count:
+            return score_samples((hand, trump, level, lengths, seed,
+                                  max(1, self.n_samples // chunks),
+                                  deadline + self.budget)) + (False,)
+        return made, taken, count, not late
+
+    def situation(self, phase, player):
+        """
+        Returns the arguments of `rank` for the bid winner of a BiddingPhase,
+        taken at once, so ranking may go on while the game moves on.
+        """
+        state = phase.auction
+        return (player.mask, rules.trump_index(phase.trump_suit),
+                phase.numeric_bid, self.shown_lengths(state, state.bidder))
+
+    def recommend(self, phase, player):
+        """
+        Ranks the partner cards available to the bid winner of a
+        BiddingPhase.
+
+        Returns:
+            list: The (Card, Recommendation) of every available card, best
+            first.
+        """
+        cards = phase.cards
+        return [ (cards[recommendation.card], recommendation)
+                 for recommendation in self.rank(*self.situation(phase,
+                                                                 player)) ]
+
+    @staticmethod
+    def hint(ranking, cards, count=3):
+        """
+        Returns a hint naming the best `count` cards of a `rank` ranking,
+        with `cards` the canonical deck, said to be tentative if the ranking
+        is not confident.
+        """
+        prefix = 'Suggested partner cards: ' if ranking[0].confident \
+            else 'Suggested partner cards (few samples, tentative): '
+        return prefix + ', '.join(
+            f'{cards[recommendation.card]} ({recommendation.success:.0%})'
+            for recommendation in ranking[:count] ) + '.'
+
+
+
+_recommender = None
+
+def get_recommender():
+    """ Returns the process-wide PartnerRecommender, created on first use. """
+    global _recommender
+    if _recommender is None:
+        _recommender = PartnerRecommender()
+    return _recommender
+
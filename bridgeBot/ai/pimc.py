@@ -0,0 +1,343 @@
+#   ai/pimc.py
+"""
+A card-play agent using Perfect Information Monte Carlo sampling (PIMC).
+
+For every card it plays, the agent samples deals of the cards it has not
+seen that agree with what it observed: its own hand, the cards played, the
+suits a player showed out of, and the partner card, which the bid winner
+cannot hold. Each sample is then played out with every legal card, double
+dummy (see `ai.solver`) once few cards remain and with the greedy playout of
+`ai.playout` before, and the card taking the most sets for the agent's side
+on average is played.
+
+Samples still consistent with the cards played since the previous decision
+are kept for the next one, so a game draws only the samples it loses.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from game import bits, rules, RandomAgent
+from .playout import greedy_card, greedy_playout
+from .solver import DoubleDummySolver
+
+SUIT_MASKS = bits.SUIT_MASKS
+
+
+class Observation:
+    """
+    What a player knows of a game in progress.
+
+    Attributes:
+        seat (int):             The seat of the player.
+        hand (int):             The mask of their hand.
+        trump (int):            The trump index (see `game.rules`).
+        leader (int):           The seat that led to the set in progress.
+        current (list of int):  The cards played to the set in progress.
+        history (list):         The (seat, card index) of every card played.
+        counts (list of int):   The number of cards held by each seat.
+        voids (list of int):    For each seat, a bitmask of the suits it
+                                showed out of.
+        unseen (int):           The mask of the cards held by the others.
+        bidder (int):           The seat of the bid winner.
+        partner_card (int):     The partner card.
+        partner (int | None):   The seat of the partner, once known.
+    """
+    def __init__(self, game, player):
+        players = game.players
+        seats = { player: seat for seat, player in enumerate(players) }
+        self.seat = seats[player]
+        self.hand = player.mask
+        self.trump = game.trump
+        self.leader = game.leader_index
+        self.current = [ card.index for _, card in game.current_set ]
+        self.history = []
+        self.voids = [0] * len(players)
+        for cards in game.sets + [game.current_set]:
+            if not cards:
+                continue
+            led = bits.card_suit(cards[0][1].index)
+            for owner, card in cards:
+                self.history.append((seats[owner], card.index))
+                if bits.card_suit(card.index) != led:
+                    self.voids[seats[owner]] |= 1 << led
+        self.counts = [ len(other.hand) for other in players ]
+        played = bits.mask_of( card for _, card in self.history )
+        self.unseen = bits.FULL_MASK & ~played & ~self.hand
+        self.bidder = seats[game.trump_bidder]
+        self.partner_card = game.partner_card.index
+        self.partner = None
+        if self.hand >> self.partner_card & 1:
+            self.partner = self.seat
+        for seat, card in self.history:
+            if card == self.partner_card:
+                self.partner = seat
+
+    def consistent(self, hands):
+        """ Returns True if a sampled deal agrees with the voids shown. """
+        for seat, voids in enumerate(self.voids):
+            for suit in range(bits.N_SUITS):
+                if voids >> suit & 1 and hands[seat] & SUIT_MASKS[suit]:
+                    return False
+        return True
+
+
+
+def sample_deal(rng, observation, attempts=100):
+    """
+    Deals the unseen cards to the other seats at random, respecting their
+    card counts, their voids and the partner card.
+
+    Cards are dealt from the most constrained, each to a seat drawn among
+    those that may hold it in proportion to their free places.
+
+    Returns:
+        list of int: The hand of every seat, or None if no deal was found.
+    """
+    seat, bidder = observation.seat, observation.bidder
+    others = [ other for other in range(len(observation.counts))
+               if other != seat ]
+    cards = []
+    for card in bits.iter_cards(observation.unseen):
+        suit = bits.card_suit(card)
+        eligible = [ other for other in others
+                     if not observation.voids[other] >> suit & 1
+                     and not (card == observation.partner_card
+                              and other == bidder) ]
+        cards.append((len(eligible), rng.random(), card, eligible))
+    cards.sort()
+    for _ in range(attempts):
+        free = list(observation.counts)
+        hands = [0] * len(free)
+        hands[seat] = observation.hand
+        for _, _, card, eligible in cards:
+            total = sum( free[other] for other in eligible )
+            if not total:
+                break
+            pick = rng.randrange(total)
+            for other in eligible:
+                pick -= free[other]
+                if pick < 0:
+                    break
+            hands[other] |= 1 << card
+            free[other] -= 1
+        else:
+            return hands
+    return None
+
+
+def playout_value(hands, trump, leader, current, declarers):
+    """
+    Plays the set in progress to its end and the remaining sets out with the
+    greedy policy of `ai.playout`. `hands` no longer hold the `current` cards.
+
+    Returns:
+        int: The sets the declaring side takes, the set in progress included.
+    """
+    hands = list(hands)
+    current = list(current)
+    occupied = hands[0] | hands[1] | hands[2] | hands[3]
+    position = rules.set_winner(current, trump)
+    win_seat, win_card = (leader + position) & 3, current[position]
+    led = current[0] // 13
+    while len(current) < 4:
+        seat = (leader + len(current)) & 3
+        card = greedy_card(hands, seat, trump, declarers, led, win_seat,
+                           win_card, occupied)
+        hands[seat] ^= 1 << card
+        occupied ^= 1 << card
+        if rules.beats(card, win_card, trump):
+            win_seat, win_card = seat, card
+        current.append(card)
+    return declarers[win_seat] + greedy_playout(hands, trump, win_seat,
+                                                declarers)
+
+
+def solved_value(solver, leader, current):
+    """
+    As `playout_value`, with perfect play by both sides, on a
+    DoubleDummySolver holding the hands.
+    """
+    if len(current) < 4:
+        return solver.solve_partial(leader, current)
+    win_seat = (leader + rules.set_winner(current, solver.trump)) & 3
+    won = solver.declarers[win_seat]
+    return won + (solver.solve(win_seat) if solver.hands[win_seat] else 0)
+
+
+def evaluate(task):
+    """
+    Scores the candidate cards of a seat over samples, until a deadline.
+
+    Arguments:
+        task (tuple):   The (samples, observation, candidates, exact, deadline)
+                        of the evaluation: the sampled hands of every seat,
+                        the Observation of the seat to play, its candidate
+                        cards, whether to solve double dummy rather than play
+                        out greedily, and the `time.monotonic` deadline.
+
+    Returns:
+        tuple: The total sets taken by the side of the seat with every
+        candidate, and the number of samples scored. At least one sample is
+        scored whatever the deadline.
+    """
+    samples, observation, candidates, exact, deadline = task
+    seat, leader = observation.seat, observation.leader
+    trump = observation.trump
+    remaining = observation.counts[seat]
+    totals = [0] * len(candidates)
+    done = 0
+    for hands in samples:
+        if done and time.monotonic() > deadline:
+            break
+        partner = observation.partner
+        if partner is None:
+            partner = next( other for other, hand in enumerate(hands)
+                            if hand >> observation.partner_card & 1 )
+        declarers = tuple( other in (observation.bidder, partner)
+                           for other in range(len(hands)) )
+        solver = DoubleDummySolver(hands, trump, declarers) if exact else None
+        for i, card in enumerate(candidates):
+            current = observation.current + [card]
+            if exact:
+                solver.hands[seat] ^= 1 << card
+                tricks = solved_value(solver, leader, current)
+                solver.hands[seat] ^= 1 << card
+            else:
+                played = list(hands)
+                played[seat] ^= 1 << card
+                tricks = playout_value(played, trump, leader, current,
+                                       declarers)
+            totals[i] += tricks if declarers[seat] else remaining - tricks
+        done += 1
+    return totals, done
+
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(workers=None):
+    """
+    Returns the process-wide pool of searching processes with `workers`
+    processes, by default one per CPU. Pools are kept per number of
+    processes, so agents asking for different numbers share the process
+    without shutting each other's pool down.
+    """
+    workers = workers or os.cpu_count() or 1
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(workers)
+    return pool
+
+
+
+class PIMCAgent(RandomAgent):
+    """
+    Plays cards by PIMC sampling within a time budget per card, calls the
+    partner card ranked first by a PartnerRecommender (see `ai.partner`),
+    and otherwise bids as RandomAgent.
+
+    Attributes:
+        budget (float):     The seconds to search per card.
+        n_samples (int):    The number of sampled deals per decision.
+        solve_cards (int):  The most cards per hand at which samples are
+                            solved double dummy rather than played out.
+        workers (int):      The processes of the shared pool to search with,
+                            by default one per CPU; 0 to search in process.
+        recommender (PartnerRecommender):   Ranks the partner cards, by
+                            default the process-wide one.
+        samples (list):     The samples kept from the previous decision.
+    """
+    def __init__(self, seed=None, budget=0.5, n_samples=48, solve_cards=5,
+                 workers=None, recommender=None):
+        super().__init__(seed)
+        self.recommender = recommender
+        self.budget = budget
+        self.n_samples = n_samples
+        self.solve_cards = solve_cards
+        self.workers = workers
+        self.samples = []
+        self._game = None
+        self._seen = 0
+
+    def choose_partner_card(self, phase, player, available_cards):
+        if self.recommender is None:
+            from .partner import get_recommender
+            self.recommender = get_recommender()
+        return self.recommender.recommend(phase, player)[0][0]
+
+    def choose_card(self, phase, player, legal_cards):
+        if len(legal_cards) == 1:
+            return legal_cards[0]
+        deadline = time.monotonic() + self.budget
+        observation = Observation(phase, player)
+        samples = self._update_samples(phase, observation)
+        if not samples:
+            return super().choose_card(phase, player, legal_cards)
+        candidates = [ card.index for card in legal_cards ]
+        exact = observation.counts[observation.seat] <= self.solve_cards
+        totals, done = self._evaluate(samples, observation, candidates, exact,
+                                      deadline)
+        if not done:
+            return super().choose_card(phase, player, legal_cards)
+        best = max(range(len(candidates)), key=lambda i: (totals[i], -i))
+        return legal_cards[best]
+
+    def _update_samples(self, game, observation):
+        """
+        Drops the kept samples the cards played since disagree with, takes
+        those cards out of the others, and tops them up with new samples.
+        """
+        if self._game is not game:
+            self._game = game
+            self._seen = 0
+            self.samples = []
+        new = observation.history[self._seen:]
+        self._seen = len(observation.history)
+        kept = []
+        for hands in self.samples:
+            hands = list(hands)
+            for seat, card in new:
+                if not hands[seat] >> card & 1:
+                    break
+                hands[seat] ^= 1 << card
+            else:
+                if observation.consistent(hands):
+                    kept.append(hands)
+        while len(kept) < self.n_samples:
+            hands = sample_deal(self.rng, observation)
+            if hands is None:
+                break
+            kept.append(hands)
+        self.samples = kept
+        return kept
+
+    def _evaluate(self, samples, observation, candidates, exact, deadline):
+        """ Scores the candidates, across the pool unless `workers` is 0. """
+        if self.workers == 0:
+            return evaluate((samples, observation, candidates, exact,
+                             deadline))
+        workers = self.workers or os.cpu_count() or 1
+        pool = get_pool(workers)
+        chunks = max(1, min(workers, len(samples)))
+        futures = [ pool.submit(evaluate, (samples[i::chunks], observation,
+                                           candidates, exact, deadline))
+                    for i in range(chunks) ]
+        done, late = wait(futures, timeout=max(0.0,
+                                               deadline - time.monotonic())
+                          + self.budget)
+        #   Late chunks are abandoned: those not started yet are dropped, so
+        #   they do not hold up the next decisions, and the others stop at
+        #   the deadline
+        for future in late:
+            future.cancel()
+        totals = [0] * len(candidates)
+        count = 0
+        for future in done:
+            chunk_totals, chunk_count = future.result()
+            count += chunk_count
+            for i, total in enumerate(chunk_totals):
+                totals[i] += total
+        return totals, count
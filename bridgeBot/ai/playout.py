@@ -0,0 +1,115 @@
+#   ai/playout.py
+from game import bits, rules
+
+SUIT_MASKS = bits.SUIT_MASKS
+SUIT_BITS = bits.SUIT_BITS
+
+
+def _lowest(mask):
+    """ Returns the lowest card index held in `mask`. """
+    return (mask & -mask).bit_length() - 1
+
+
+def _highest(mask):
+    """ Returns the highest card index held in `mask`. """
+    return mask.bit_length() - 1
+
+
+def greedy_card(hands, seat, trump, declarers, led, win_seat, win_card,
+                occupied):
+    """
+    Chooses a card for `seat` with a simple greedy policy:
+
+    - Leading: cash the top remaining card of a suit (trumps first), or else
+      lead the lowest card of the longest side suit.
+    - Following: with the partner side winning, play low; otherwise win as
+      cheaply as possible, ruffing if void, or else play low, discarding from
+      side suits first.
+
+    Arguments:
+        hands (list of int):        The card mask of each seat.
+        seat (int):                 The seat to play.
+        trump (int):                The trump index (see `game.rules`).
+        declarers (list of bool):   For each seat, whether it is declaring.
+        led (int | None):           The suit led to the set, or None.
+        win_seat (int):             The seat winning the set, or -1.
+        win_card (int):             The card winning the set, or -1.
+        occupied (int):             The mask of all cards not yet played.
+
+    Returns:
+        int: The chosen card index.
+    """
+    hand = hands[seat]
+    if led is None:
+        order = (3, 2, 1, 0) if trump == rules.NO_TRUMP else (trump, 3, 2, 1, 0)
+        for suit in order:
+            mine = hand & SUIT_MASKS[suit]
+            if mine:
+                top = _highest(occupied & SUIT_MASKS[suit])
+                if mine >> top & 1:
+                    return top
+        best = hand
+        length = 0
+        for suit in range(4):
+            if suit == trump:
+                continue
+            mine = hand & SUIT_MASKS[suit]
+            if mine.bit_count() > length:
+                best, length = mine, mine.bit_count()
+        return _lowest(best)
+
+    following = hand & SUIT_MASKS[led]
+    legal = following or hand
+    if declarers[seat] == declarers[win_seat]:
+        return _discard(legal, trump) if not following else _lowest(legal)
+    rest = legal
+    while rest:
+        card = _lowest(rest)
+        if rules.beats(card, win_card, trump):
+            return card
+        rest &= rest - 1
+    return _discard(legal, trump) if not following else _lowest(legal)
+
+
+def _discard(legal, trump):
+    """ Returns the lowest card of `legal`, keeping trumps if possible. """
+    if trump != rules.NO_TRUMP and legal & ~SUIT_MASKS[trump]:
+        legal &= ~SUIT_MASKS[trump]
+    return _lowest(legal)
+
+
+def greedy_playout(hands, trump, leader, declarers, policy=greedy_card):
+    """
+    Plays out the remaining sets with every seat following `policy`.
+
+    Arguments:
+        hands (list of int):        The card mask of each seat.
+        trump (int):                The trump index (see `game.rules`).
+        leader (int):               The seat leading to the next set.
+        declarers (list of bool):   For each seat, whether it is declaring.
+        policy (callable):          Chooses a card, as `greedy_card`.
+
+    Returns:
+        int: The number of sets taken by the declaring side.
+    """
+    hands = list(hands)
+    occupied = hands[0] | hands[1] | hands[2] | hands[3]
+    tricks = 0
+    while hands[leader]:
+        led = None
+        win_seat = win_card = -1
+        seat = leader
+        for _ in range(4):
+            card = policy(hands, seat, trump, declarers, led, win_seat,
+                          win_card, occupied)
+            hands[seat] ^= 1 << card
+            occupied ^= 1 << card
+            if led is None:
+                led = card // 13
+                win_seat, win_card = seat, card
+            elif rules.beats(card, win_card, trump):
+                win_seat, win_card = seat, card
+            seat = (seat + 1) & 3
+        tricks += declarers[win_seat]
+        leader = win_seat
+    return tricks
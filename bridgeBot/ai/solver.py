@@ -0,0 +1,688 @@
+#   ai/solver.py
+from game import bits, rules
+from game.game import starting_player_index
+
+SUIT_MASKS = bits.SUIT_MASKS
+STRENGTH = rules.STRENGTH
+SUIT_BITS = bits.SUIT_BITS
+SHIFTS = (0, 13, 26, 39)
+
+
+class DoubleDummySolver:
+    """
+    Computes the number of sets each side takes with perfect play when all
+    four hands are known.
+
+    The solver answers "can the declaring side take at least `t` more sets?"
+    with an alpha-beta (null window) search, and binary searches `t`:
+
+    - Bounds found at the start of every set go into a transposition table.
+      Along with a result, the search returns the cards whose rank decided it
+      (the winning ranks); an entry then matches every position with the same
+      suit lengths in each hand and the same owners of the cards down to the
+      lowest winning rank of each suit, whatever the smaller cards are. An
+      entry holds the lower and upper bounds found on the sets the declaring
+      side takes, so the searches for different `t` share their work.
+    - Cards of a hand that are adjacent once played cards are ignored are
+      equivalent, and only one of them is searched.
+    - Sets the leader can cash off the top, and the sets the master trumps
+      of a side are sure to take, bound the search before any card is tried.
+      Within a set, a side that needs only the current set stops as soon as
+      it holds a card sure to win it.
+    - Moves are ordered to try cashing winners and cheap winners first, and
+      to play low when the set is already won or lost. A lead that cut the
+      search at the same depth is tried first.
+
+    Sides are arbitrary sets of seats, as partnerships in floating bridge are
+    decided by the partner card rather than by seating.
+
+    Attributes:
+        hands (list of int):        The card mask of each seat.
+        trump (int):                The trump index (see `game.rules`).
+        declarers (tuple of bool):  For each seat, whether it is on the
+                                    declaring side.
+        table (dict):               The transposition table, mapping the
+                                    shape key of a position to a dictionary
+                                    mapping a pattern of top cards to the
+                                    [lower, upper] bounds of the sets the
+                                    declaring side takes.
+        nodes (int):                The number of cards searched.
+    """
+    def __init__(self, hands, trump, declarers):
+        self.hands = list(hands)
+        self.trump = trump
+        self.declarers = tuple( bool(seat) for seat in declarers )
+        self.table = {}
+        self.nodes = 0
+        self._equivalents = {}
+        self._suits = {}
+        self._killers = {}
+
+    def solve(self, leader):
+        """
+        Solves the position with `leader` to lead to the next set.
+
+        Arguments:
+            leader (int):   The seat leading to the next set.
+
+        Returns:
+            int: The number of remaining sets the declaring side takes with
+            perfect play by both sides.
+        """
+        low, high = 0, self.hands[leader].bit_count()
+        while low < high:
+            target = (low + high + 1) // 2
+            if self.can_take(leader, target):
+                low = target
+            else:
+                high = target - 1
+        return low
+
+    def solve_partial(self, leader, played_cards):
+        """
+        Solves the position in the middle of a set.
+
+        Arguments:
+            leader (int):               The seat that led to the set.
+            played_cards (list of int): The cards played to the set so far,
+                                        from `leader` on, which are no longer
+                                        in `hands`; at most three.
+
+        Returns:
+            int: The number of remaining sets, the set in progress included,
+            the declaring side takes with perfect play by both sides.
+        """
+        if not played_cards:
+            return self.solve(leader)
+        led = played_cards[0] // 13
+        position = rules.set_winner(played_cards, self.trump)
+        win_seat, win_card = (leader + position) & 3, played_cards[position]
+        count = len(played_cards)
+        seat = (leader + count) & 3
+        played = bits.mask_of(played_cards)
+        low, high = 0, self.hands[seat].bit_count()
+        while low < high:
+            target = (low + high + 1) // 2
+            if self._play(seat, count, led, win_seat, win_card, played,
+                          target)[0]:
+                low = target
+            else:
+                high = target - 1
+        return low
+
+    def can_take(self, leader, target):
+        """
+        Returns True if the declaring side can take at least `target` of the
+        remaining sets with `leader` to lead.
+        """
+        return self._set(leader, target)[0]
+
+    def _position(self, leader):
+        """
+        Describes the position at the start of a set.
+
+        Returns:
+            tuple: The shape key (the leader and the length of every suit in
+            every hand) and, for each suit, the owners of its remaining cards
+            from the top down, packed two bits per card.
+        """
+        h0, h1, h2, h3 = self.hands
+        suits = self._suits
+        shape = leader
+        codes = []
+        for shift in SHIFTS:
+            key = (h0 >> shift & SUIT_BITS
+                   | (h1 >> shift & SUIT_BITS) << 13
+                   | (h2 >> shift & SUIT_BITS) << 26
+                   | (h3 >> shift & SUIT_BITS) << 39)
+            found = suits.get(key)
+            if found is None:
+                found = suits[key] = self._describe_suit(key)
+            shape = shape << 16 | found[0]
+            codes.append(found[1])
+        return shape, codes
+
+    @staticmethod
+    def _describe_suit(holdings):
+        """
+        Describes one suit, given the 13-bit holding of each seat packed into
+        `holdings` as by `_position`.
+
+        Returns:
+            tuple: The lengths of the four holdings packed four bits each, and
+            the owners of the cards from the top down packed two bits each.
+        """
+        subs = [ holdings >> (13 * seat) & SUIT_BITS for seat in range(4) ]
+        lengths = 0
+        for sub in subs:
+            lengths = lengths << 4 | sub.bit_count()
+        occ = subs[0] | subs[1] | subs[2] | subs[3]
+        code = 0
+        while occ:
+            top = 1 << (occ.bit_length() - 1)
+            occ ^= top
+            for seat in range(4):
+                if subs[seat] & top:
+                    code = code << 2 | seat
+                    break
+        return lengths, code
+
+    def _pattern(self, codes, relevant):
+        """
+        Returns the pattern of a position matching the positions with the
+        same owners of the cards down to the lowest rank of `relevant` in
+        every suit: for each suit, twice the number of lower cards, and the
+        code of the owners of the others.
+        """
+        hands = self.hands
+        occupied = hands[0] | hands[1] | hands[2] | hands[3]
+        pattern = []
+        for code, shift in zip(codes, SHIFTS):
+            occ = occupied >> shift & SUIT_BITS
+            ranks = relevant >> shift & SUIT_BITS
+            if ranks:
+                skip = 2 * (occ & ((ranks & -ranks) - 1)).bit_count()
+            else:
+                skip = 2 * occ.bit_count()
+            pattern.append(skip)
+            pattern.append(code >> skip)
+        return tuple(pattern)
+
+    def _top_cards(self, pattern):
+        """ Returns the cards of the current position fixed by `pattern`. """
+        hands = self.hands
+        occupied = hands[0] | hands[1] | hands[2] | hands[3]
+        cards = 0
+        for i, shift in enumerate(SHIFTS):
+            occ = occupied >> shift & SUIT_BITS
+            for _ in range(pattern[2 * i] // 2):
+                occ &= occ - 1
+            cards |= occ << shift
+        return cards
+
+    def _set(self, leader, target):
+        """
+        Searches from the start of a set.
+
+        Returns:
+            tuple: Whether the declaring side takes `target` more sets, and the
+            mask of the cards whose rank decided it.
+        """
+        if target <= 0:
+            return True, 0
+        remaining = self.hands[leader].bit_count()
+        if target > remaining:
+            return False, 0
+        if remaining == 1:
+            return self._last_set(leader)
+        shape, codes = self._position(leader)
+        entries = self.table.get(shape)
+        if entries is None:
+            entries = self.table[shape] = {}
+        else:
+            c0, c1, c2, c3 = codes
+            for pattern, bounds in entries.items():
+                low, high = bounds
+                if low < target <= high:
+                    continue
+                s0, p0, s1, p1, s2, p2, s3, p3 = pattern
+                if c0 >> s0 == p0 and c1 >> s1 == p1 and \
+                   c2 >> s2 == p2 and c3 >> s3 == p3:
+                    return low >= target, self._top_cards(pattern)
+
+        declaring = self.declarers[leader]
+        quick, cashed = self._quick_tricks(leader)
+        sure, masters = self._sure_tricks()
+        if declaring:
+            if quick >= target:
+                result, relevant = True, cashed
+            elif sure >= target:
+                result, relevant = True, masters
+            elif sure < 0 and remaining + sure < target:
+                result, relevant = False, masters
+            else:
+                result = None
+        else:
+            if remaining - quick < target:
+                result, relevant = False, cashed
+            elif sure < 0 and remaining + sure < target:
+                result, relevant = False, masters
+            elif sure >= target:
+                result, relevant = True, masters
+            else:
+                result = None
+        if result is None:
+            result, relevant = self._play(leader, 0, None, -1, -1, 0, target)
+
+        pattern = self._pattern(codes, relevant)
+        bounds = entries.get(pattern)
+        if bounds is None:
+            bounds = entries[pattern] = [0, remaining]
+        if result:
+            bounds[0] = max(bounds[0], target)
+        else:
+            bounds[1] = min(bounds[1], target - 1)
+        return result, relevant
+
+    def _last_set(self, leader):
+        """ Plays out the last set, where every seat has a single card. """
+        hands = self.hands
+        win_seat = leader
+        win_card = hands[leader].bit_length() - 1
+        led = win_card // 13
+        strength = STRENGTH[self.trump][led]
+        beaten = False
+        for offset in (1, 2, 3):
+            seat = (leader + offset) & 3
+            card = hands[seat].bit_length() - 1
+            if card // 13 == win_card // 13:
+                beaten = True
+            if strength[card] > strength[win_card]:
+                win_seat, win_card = seat, card
+        won = self.declarers[win_seat]
+        return won, (1 << win_card) if beaten else 0
+
+    def _sure_tricks(self):
+        """
+        Counts the sets the master trumps are sure to take. Every trump of the
+        run of top trumps held by one side wins the set it is played to, as
+        only a higher trump of the same side beats it, so the side takes at
+        least as many sets as one of its seats holds of the run.
+
+        Returns:
+            tuple: The sets sure to the declaring side, or minus those sure to
+            the defending side, and the mask of the run.
+        """
+        trump = self.trump
+        if trump == rules.NO_TRUMP:
+            return 0, 0
+        hands = self.hands
+        declarers = self.declarers
+        shift = SHIFTS[trump]
+        rest = (hands[0] | hands[1] | hands[2] | hands[3]) >> shift & SUIT_BITS
+        if not rest:
+            return 0, 0
+        counts = [0, 0, 0, 0]
+        side = None
+        run = 0
+        while rest:
+            top = 1 << (rest.bit_length() - 1)
+            card = top << shift
+            for seat in range(4):
+                if hands[seat] & card:
+                    break
+            if side is None:
+                side = declarers[seat]
+            elif declarers[seat] != side:
+                break
+            counts[seat] += 1
+            run |= card
+            rest ^= top
+        sure = max(counts)
+        return (sure if side else -sure), run
+
+    def _quick_tricks(self, leader):
+        """
+        Counts the sets the side of `leader` takes by cashing the top cards of
+        the leader's hand, while keeping the lead.
+
+        Once the top cards of a suit have outlasted every other hand, the rest
+        of the leader's suit is good too. Outside the trump suit, cards only
+        count while every opponent holding trumps still follows suit, unless
+        the leader's top trumps draw theirs first. If a partner of the leader
+        holds nothing but trumps, they could be forced to ruff and take over
+        the lead, so only trumps count.
+
+        Returns:
+            tuple: The number of sets and the mask of the cards cashed.
+        """
+        hands = self.hands
+        declarers = self.declarers
+        trump = self.trump
+        side = declarers[leader]
+        hand = hands[leader]
+        occupied = hands[0] | hands[1] | hands[2] | hands[3]
+        ruffers = []
+        side_suits = True
+        suits = SHIFTS
+        trump_shift = -1
+        if trump != rules.NO_TRUMP:
+            trump_mask = SUIT_MASKS[trump]
+            ruffers = [ hands[seat] for seat in range(4)
+                        if declarers[seat] != side
+                        and hands[seat] & trump_mask ]
+            for seat in range(4):
+                if seat != leader and declarers[seat] == side and \
+                   hands[seat] and not hands[seat] & ~trump_mask:
+                    side_suits = False
+            #   Cash trumps first, as they may draw those of the opponents.
+            trump_shift = SHIFTS[trump]
+            suits = (trump_shift,) + SHIFTS[:trump] + SHIFTS[trump + 1:]
+        others = [ hands[seat] for seat in range(4) if seat != leader ]
+        quick = 0
+        cashed = 0
+        for shift in suits:
+            mine = hand >> shift & SUIT_BITS
+            if not mine or (shift != trump_shift and not side_suits):
+                continue
+            rest = occupied >> shift & SUIT_BITS
+            run = 0
+            while rest:
+                top = 1 << (rest.bit_length() - 1)
+                if not top & mine:
+                    break
+                run += 1
+                rest ^= top
+                cashed |= top << shift
+            if not run:
+                continue
+            if run >= max( (other >> shift & SUIT_BITS).bit_count()
+                           for other in others ):
+                run = mine.bit_count()
+            if shift == trump_shift:
+                if all( run >= (ruffer >> shift & SUIT_BITS).bit_count()
+                        for ruffer in ruffers ):
+                    ruffers = []
+            else:
+                for ruffer in ruffers:
+                    run = min(run, (ruffer >> shift & SUIT_BITS).bit_count())
+            quick += run
+        return quick, cashed
+
+    def _moves(self, seat, led, win_seat, win_card, played):
+        """
+        Returns the cards `seat` should try, one per group of equivalent cards,
+        in search order, and the mask of the cards skipped as equivalent.
+
+        Cards on the table (`played`) still count as occupying their rank, as
+        they can still be beaten in the current set.
+        """
+        hands = self.hands
+        hand = hands[seat]
+        occupied = hands[0] | hands[1] | hands[2] | hands[3] | played
+        if led is not None:
+            following = hand & SUIT_MASKS[led]
+            if following:
+                candidates, skipped = self._suit_moves(led, following,
+                                                       occupied)
+                if len(candidates) < 2:
+                    return candidates, skipped
+                #   The cards of one suit are ordered by rank, lowest first.
+                if win_card // 13 != led:
+                    winners = []
+                    losers = candidates
+                else:
+                    for split, card in enumerate(candidates):
+                        if card > win_card:
+                            break
+                    else:
+                        split = len(candidates)
+                    winners = candidates[split:]
+                    losers = candidates[:split]
+                if self.declarers[seat] == self.declarers[win_seat]:
+                    return losers + winners, skipped
+                return winners + losers, skipped
+        candidates = []
+        skipped = 0
+        for suit in range(4):
+            if hand & SUIT_MASKS[suit]:
+                cards, dropped = self._suit_moves(suit, hand, occupied)
+                candidates += cards
+                skipped |= dropped
+        if len(candidates) == 1:
+            return candidates, skipped
+
+        if win_seat < 0:
+            return self._order_leads(seat, candidates, occupied), skipped
+
+        strength = STRENGTH[self.trump][led]
+        best = strength[win_card]
+        winners = []
+        losers = []
+        for card in candidates:
+            if strength[card] > best:
+                winners.append((strength[card], card))
+            else:
+                losers.append((card % 13, card))
+        winners.sort()
+        losers.sort()
+        winners = [ card for _, card in winners ]
+        losers = [ card for _, card in losers ]
+        if self.declarers[seat] == self.declarers[win_seat]:
+            return losers + winners, skipped
+        return winners + losers, skipped
+
+    def _suit_moves(self, suit, hand, occupied):
+        """
+        Returns the cards of `suit` in `hand` to try, lowest first, keeping
+        the top card of every run of cards adjacent once the cards missing
+        from `occupied` are ignored, and the mask of the other cards.
+        """
+        shift = SHIFTS[suit]
+        sub = hand >> shift & SUIT_BITS
+        occ = occupied >> shift & SUIT_BITS
+        key = suit | sub << 2 | occ << 15
+        found = self._equivalents.get(key)
+        if found is None:
+            cards = []
+            dropped = 0
+            rest = sub
+            while rest:
+                low = rest & -rest
+                rest ^= low
+                above = occ & ~((low << 1) - 1)
+                if above & -above & sub:
+                    dropped |= low
+                else:
+                    cards.append(shift + low.bit_length() - 1)
+            found = self._equivalents[key] = (tuple(cards), dropped << shift)
+        cards, dropped = found
+        return list(cards), dropped
+
+    def _order_leads(self, seat, candidates, occupied):
+        """
+        Orders the leads of `seat`: cash top cards and lead to a partner's top
+        card or ruff, and avoid suits an opponent can ruff or where an
+        opponent holds the top card.
+        """
+        hands = self.hands
+        declarers = self.declarers
+        side = declarers[seat]
+        hand = hands[seat]
+        partners = 0
+        opponents = []
+        for other in range(4):
+            if other == seat:
+                continue
+            if declarers[other] == side:
+                partners |= hands[other]
+            else:
+                opponents.append(hands[other])
+        trump_mask = SUIT_MASKS[self.trump] \
+            if self.trump != rules.NO_TRUMP else 0
+        partner_ruffs = partners & trump_mask
+        suit_scores = {}
+        for suit in range(4):
+            suit_mask = SUIT_MASKS[suit]
+            if not hand & suit_mask:
+                continue
+            top = (occupied & suit_mask).bit_length() - 1
+            score = -(hand & suit_mask).bit_count()
+            if trump_mask and suit_mask != trump_mask:
+                for opponent in opponents:
+                    if opponent & trump_mask and not opponent & suit_mask:
+                        score -= 40
+                if partner_ruffs and not partners & suit_mask:
+                    score += 20
+            if partners >> top & 1:
+                score += 40
+            elif not hand >> top & 1:
+                score -= 10
+            suit_scores[suit] = score, top
+
+        def score(card):
+            suit_score, top = suit_scores[card // 13]
+            return suit_score + 50 if card == top else suit_score
+
+        return sorted(candidates, key=score, reverse=True)
+
+    def _sure_winner(self, seat, count, led, win_seat, win_card):
+        """
+        Finds a card with which the side of `seat` wins the current set
+        whatever the seats after it play.
+
+        Returns:
+            int: The winning card, or -1 if the set is not sure.
+        """
+        hands = self.hands
+        declarers = self.declarers
+        side = declarers[seat]
+        strength = STRENGTH[self.trump][led]
+        trump_mask = SUIT_MASKS[self.trump] \
+            if self.trump != rules.NO_TRUMP else 0
+        led_mask = SUIT_MASKS[led]
+        if declarers[win_seat] == side:
+            ours, card, theirs = strength[win_card], win_card, -1
+        else:
+            ours, card, theirs = -1, -1, strength[win_card]
+        for offset in range(4 - count):
+            other = (seat + offset) & 3
+            hand = hands[other]
+            cards = hand & led_mask or hand & trump_mask
+            if not cards:
+                continue
+            top = cards.bit_length() - 1
+            if declarers[other] == side:
+                if strength[top] > ours:
+                    ours, card = strength[top], top
+            elif strength[top] > theirs:
+                theirs = strength[top]
+        return card if ours > theirs else -1
+
+    def _play(self, seat, count, led, win_seat, win_card, played, target):
+        """
+        Searches from the `count`-th card of a set, with `seat` to play.
+
+        Arguments:
+            seat (int):         The seat to play.
+            count (int):        The number of cards already played to the set.
+            led (int | None):   The suit led to the set.
+            win_seat (int):     The seat currently winning the set, or -1.
+            win_card (int):     The card currently winning the set, or -1.
+            played (int):       The mask of the cards played to the set.
+            target (int):       The number of sets the declaring side needs.
+
+        Returns:
+            tuple: Whether the declaring side takes `target` more sets, and the
+            mask of the cards whose rank decided it.
+        """
+        hands = self.hands
+        declarers = self.declarers
+        maximizing = declarers[seat]
+        next_seat = (seat + 1) & 3
+        #   When the side to play needs the current set, a set it is sure to
+        #   win decides the search.
+        if (count == 1 or count == 2) and \
+           (target <= 1 if maximizing else target >= hands[seat].bit_count()):
+            card = self._sure_winner(seat, count, led, win_seat, win_card)
+            if card >= 0:
+                return maximizing, 1 << card
+        moves, skipped = self._moves(seat, led, win_seat, win_card, played)
+        self.nodes += len(moves)
+        #   Try first the lead that last cut a search at this depth.
+        killer_key = hands[seat].bit_count() * 4 + seat
+        if count == 0 and len(moves) > 1:
+            killer = self._killers.get(killer_key)
+            if killer is not None and killer != moves[0] and killer in moves:
+                moves.remove(killer)
+                moves.insert(0, killer)
+        relevant = 0
+        strength = STRENGTH[self.trump][led] if count else None
+        smalls = 0
+        for card in moves:
+            bit = 1 << card
+            if bit & smalls:
+                continue
+            hands[seat] ^= bit
+            if count == 0:
+                result, cards = self._play(next_seat, 1, card // 13, seat,
+                                           card, bit, target)
+            else:
+                if strength[card] > strength[win_card]:
+                    new_seat, new_card = seat, card
+                else:
+                    new_seat, new_card = win_seat, win_card
+                if count == 3:
+                    result, cards = self._set(new_seat,
+                                              target - declarers[new_seat])
+                    #   The rank of the winning card decided the set if it
+                    #   beat another card of its suit.
+                    beaten = (played | bit) & SUIT_MASKS[new_card // 13]
+                    if beaten & (beaten - 1):
+                        cards |= 1 << new_card
+                else:
+                    result, cards = self._play(next_seat, count + 1, led,
+                                               new_seat, new_card,
+                                               played | bit, target)
+            hands[seat] ^= bit
+            if result == maximizing:
+                if count == 0:
+                    self._killers[killer_key] = card
+                return result, cards
+            relevant |= cards
+            #   A card below every deciding rank of its suit gives the same
+            #   result as any other such card of the hand. Otherwise the
+            #   skipped equivalent cards failed too, but they are only
+            #   equivalent while no other card sits between them.
+            suit_mask = SUIT_MASKS[card // 13]
+            above = cards & suit_mask
+            lowest = above & -above
+            if not above:
+                smalls |= suit_mask
+            elif lowest > bit:
+                smalls |= suit_mask & (lowest - 1)
+            else:
+                relevant |= skipped & suit_mask
+        return not maximizing, relevant
+
+
+def solve_deal(hands, trump, leader, declarers):
+    """
+    Solves a deal double dummy.
+
+    Arguments:
+        hands (list of int):        The card mask of each seat.
+        trump (int):                The trump index (see `game.rules`).
+        leader (int):               The seat leading to the first set.
+        declarers (list of bool):   For each seat, whether it is on the
+                                    declaring side.
+
+    Returns:
+        tuple: The number of sets taken by the declaring side and by the
+        defending side with perfect play.
+    """
+    total = hands[leader].bit_count()
+    tricks = DoubleDummySolver(hands, trump, declarers).solve(leader)
+    return tricks, total - tricks
+
+
+def solve_bidding(bidding_phase):
+    """
+    Solves the deal of a finished BiddingPhase double dummy, with the trump
+    suit, opening leader and partnership it settled.
+
+    Arguments:
+        bidding_phase (BiddingPhase):   A bidding phase after `select_partner`.
+
+    Returns:
+        tuple: The number of sets taken by the side of the bid winner and by
+        the other side with perfect play.
+    """
+    players = bidding_phase.players
+    bidder = bidding_phase.trump_bidder
+    partner = bidding_phase.partnership[bidder]
+    trump = rules.trump_index(bidding_phase.trump_suit)
+    leader = starting_player_index(players, bidding_phase.trump_suit, bidder)
+    declarers = [ player is bidder or player is partner for player in players ]
+    return solve_deal([ player.mask for player in players ], trump, leader,
+                      declarers)
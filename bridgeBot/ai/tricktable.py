@@ -0,0 +1,333 @@
+#   ai/tricktable.py
+"""
+Expected sets taken by a declaring hand, tabulated by the hand's suit
+lengths, its value (as `Player.hand_value` measures it) and the trump suit.
+
+The table is built offline by simulating deals, and saved as a flat binary
+file: a fixed header followed by a float32 array of means and a uint32 array
+of sample counts. `TrickTable.open` memory-maps the file, so a lookup is one
+array read and processes sharing the file share its pages.
+"""
+import argparse
+import struct
+from multiprocessing import Pool
+import os
+import numpy as np
+from numpy.random import SeedSequence
+from game import bits, rules, RandomAgent
+from game.dealer import DealGenerator
+from utils import Config
+from .playout import greedy_playout
+
+MAGIC = b'SGBTRICK'
+VERSION = 1
+#   magic, version, number of shapes, value buckets, trump options, samples
+HEADER = struct.Struct('<8sHHHHQ')
+
+#   Every (clubs, diamonds, hearts, spades) length tuple of a 13 card hand.
+SHAPES = tuple( (c, d, h, 13 - c - d - h)
+                for c in range(14) for d in range(14 - c)
+                for h in range(14 - c - d) )
+SHAPE_INDEX = { shape: i for i, shape in enumerate(SHAPES) }
+N_VALUES = 41           #   Hand values 0 .. 40; no hand is worth more.
+N_TRUMPS = len(rules.TRUMP_NAMES)
+#   The fewest hands behind the means given to a shape never sampled.
+MIN_FILL_SAMPLES = 20
+
+
+def partner_seat(hands, declarer, trump):
+    """
+    Returns the seat holding the partner card the declarer would typically
+    call: the highest card of the trump suit it does not hold, or the highest
+    missing card of the highest suit for No Trump.
+
+    Arguments:
+        hands (list of int):    The card mask of each seat.
+        declarer (int):         The seat of the bid winner.
+        trump (int):            The trump index (see `game.rules`).
+    """
+    missing = bits.FULL_MASK & ~hands[declarer]
+    if trump != rules.NO_TRUMP and missing & bits.SUIT_MASKS[trump]:
+        missing &= bits.SUIT_MASKS[trump]
+    card = missing.bit_length() - 1
+    for seat, hand in enumerate(hands):
+        if hand >> card & 1:
+            return seat
+
+
+def declarer_tricks(hands, declarer, trump, playout=greedy_playout):
+    """
+    Estimates the sets taken by the side of `declarer` with trump `trump`,
+    with the opening lead and partner of a floating bridge game.
+
+    Arguments:
+        hands (list of int):    The card mask of each seat.
+        declarer (int):         The seat of the bid winner.
+        trump (int):            The trump index (see `game.rules`).
+        playout (callable):     Plays the deal out as `greedy_playout`.
+
+    Returns:
+        int: The number of sets taken by the declaring side.
+    """
+    partner = partner_seat(hands, declarer, trump)
+    declarers = [ seat in (declarer, partner) for seat in range(4) ]
+    leader = rules.opening_leader(declarer, trump)
+    return playout(hands, trump, leader, declarers)
+
+
+def hand_key(mask):
+    """ Returns the (shape index, value) table key of a hand mask. """
+    return SHAPE_INDEX[bits.suit_lengths(mask)], bits.hand_value(mask)
+
+
+def build_chunk(task):
+    """
+    Simulates one chunk of deals in a worker process.
+
+    Arguments:
+        task (tuple):   The (seed, chunk index, number of deals) of the chunk.
+
+    Returns:
+        tuple: The (sums, counts) arrays of the chunk, of shapes
+        (shapes, values, trumps) and (shapes, values).
+    """
+    seed, index, n_deals = task
+    deal_seed = int(SeedSequence([seed, index]).generate_state(1)[0])
+    dealer = DealGenerator(deal_seed)
+    sums = np.zeros((len(SHAPES), N_VALUES, N_TRUMPS), dtype=np.float64)
+    counts = np.zeros((len(SHAPES), N_VALUES), dtype=np.uint32)
+    for deal in dealer.generate(n_deals):
+        hands = [ bits.mask_of(deal[seat::4].tolist()) for seat in range(4) ]
+        for declarer in range(4):
+            shape, value = hand_key(hands[declarer])
+            counts[shape, value] += 1
+            cell = sums[shape, value]
+            for trump in range(N_TRUMPS):
+                cell[trump] += declarer_tricks(hands, declarer, trump)
+    return sums, counts
+
+
+def _longest_suit(shape):
+    """ Returns the longest suit of a shape, the highest one on a tie. """
+    return max(range(bits.N_SUITS), key=lambda suit: (shape[suit], suit))
+
+
+def _fill_gaps(means, counts):
+    """
+    Fills cells without samples, so every lookup returns a number: from the
+    nearest value of the same shape that has some, or for shapes never seen,
+    from the sampled shapes with the same longest suit, as the trump a hand
+    plays best follows that suit. Those are pooled nearest first (by suit
+    lengths) until they hold MIN_FILL_SAMPLES hands, and their cells averaged
+    by sample count, as such shapes are rare and their cells noisy.
+    """
+    seen = counts > 0
+    sampled = [ shape for shape in range(len(SHAPES)) if seen[shape].any() ]
+    lengths = np.array(SHAPES)
+    for shape in range(len(SHAPES)):
+        values = np.flatnonzero(seen[shape])
+        if values.size:
+            for value in np.flatnonzero(~seen[shape]):
+                nearest = values[np.abs(values - value).argmin()]
+                means[shape, value] = means[shape, nearest]
+            continue
+        longest = _longest_suit(SHAPES[shape])
+        near = [ other for other in sampled
+                 if SHAPES[other][longest] == max(SHAPES[other]) ] or sampled
+        near.sort(key=lambda other: np.abs(lengths[other] -
+                                           lengths[shape]).sum())
+        total = np.zeros(N_TRUMPS)
+        weight = 0
+        for other in near:
+            cells = seen[other]
+            weights = counts[other, cells].astype(np.float64)
+            total += weights @ means[other, cells]
+            weight += weights.sum()
+            if weight >= MIN_FILL_SAMPLES:
+                break
+        if weight:
+            means[shape] = total / weight
+
+
+def build_table(path, n_deals, seed=0, workers=None, chunk_size=2000):
+    """
+    Simulates `n_deals` valid deals across a process pool and writes the
+    table to `path`. Each deal gives a sample for every seat as declarer.
+
+    Chunks are seeded from (`seed`, chunk index), so the file only depends on
+    `seed`, `n_deals` and `chunk_size`.
+
+    Returns:
+        TrickTable: The table written, memory-mapped from `path`.
+    """
+    workers = workers or os.cpu_count()
+    tasks = [ (seed, index, min(chunk_size, n_deals - start))
+              for index, start in enumerate(range(0, n_deals, chunk_size)) ]
+    sums = np.zeros((len(SHAPES), N_VALUES, N_TRUMPS), dtype=np.float64)
+    counts = np.zeros((len(SHAPES), N_VALUES), dtype=np.uint64)
+    if workers == 1:
+        for chunk_sums, chunk_counts in map(build_chunk, tasks):
+            sums += chunk_sums
+            counts += chunk_counts
+    else:
+        with Pool(workers) as pool:
+            for chunk_sums, chunk_counts in pool.imap_unordered(build_chunk,
+                                                                tasks):
+                sums += chunk_sums
+                counts += chunk_counts
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts[:, :, None]
+    _fill_gaps(means, counts)
+    write_table(path, means, counts, n_deals * 4)
+    return TrickTable.open(path)
+
+
+def write_table(path, means, counts, samples):
+    """ Writes a table file from its (shapes, values, trumps) means. """
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(SHAPES), N_VALUES,
+                               N_TRUMPS, samples))
+        file.write(means.astype('<f4').tobytes())
+        file.write(np.minimum(counts, 2**32 - 1).astype('<u4').tobytes())
+
+
+
+class TrickTable:
+    """
+    A memory-mapped table of expected sets.
+
+    Attributes:
+        means (ndarray):    The (shapes, values, trumps) float32 expected sets
+                            of the declaring side.
+        counts (ndarray):   The (shapes, values) uint32 number of samples
+                            behind each mean. Cells without samples hold the
+                            mean of the nearest sampled cell (see
+                            `_fill_gaps`).
+        samples (int):      The total number of hands simulated.
+    """
+    def __init__(self, means, counts, samples):
+        self.means = means
+        self.counts = counts
+        self.samples = samples
+
+    @classmethod
+    def open(cls, path):
+        """ Memory-maps a table file written by `build_table`. """
+        with open(path, 'rb') as file:
+            header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f'{path} is not a trick table.')
+        magic, version, n_shapes, n_values, n_trumps, samples = \
+            HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} trick table.')
+        if (n_shapes, n_values, n_trumps) != (len(SHAPES), N_VALUES, N_TRUMPS):
+            raise ValueError(f'{path} has an unexpected table layout.')
+        offset = HEADER.size
+        means = np.memmap(path, dtype='<f4', mode='r', offset=offset,
+                          shape=(n_shapes, n_values, n_trumps))
+        offset += means.nbytes
+        counts = np.memmap(path, dtype='<u4', mode='r', offset=offset,
+                           shape=(n_shapes, n_values))
+        return cls(means, counts, samples)
+
+    def expected_tricks(self, mask, trump_suit):
+        """
+        Returns the expected sets taken by the side of a bid winner holding
+        `mask` with `trump_suit` ('Clubs', ..., 'No Trump') as trump.
+        """
+        shape, value = hand_key(mask)
+        return float(self.means[shape, min(value, N_VALUES - 1),
+                                rules.trump_index(trump_suit)])
+
+    def expected_by_trump(self, mask):
+        """ Returns a dict of the expected sets for every trump option. """
+        shape, value = hand_key(mask)
+        row = self.means[shape, min(value, N_VALUES - 1)]
+        return { trump: float(row[t])
+                 for t, trump in enumerate(rules.TRUMP_NAMES) }
+
+    def best_contract(self, mask):
+        """
+        Returns the (trump suit, expected sets) with the most expected sets
+        for a hand.
+        """
+        return max(self.expected_by_trump(mask).items(),
+                   key=lambda item: item[1])
+
+    def suggest_bid(self, mask, available_bids):
+        """
+        Suggests a bid for a hand: of the available bids the hand expects to
+        make, the one with the most expected sets to spare, the cheapest on a
+        tie. Passes when it expects to make none of them.
+
+        Arguments:
+            mask (int):                     The hand of the bidder.
+            available_bids (list of str):   The legal bids, as
+                                            `BiddingPhase.calculate_available_bids`.
+
+        Returns:
+            str: One of `available_bids`.
+        """
+        expected = self.expected_by_trump(mask)
+        best, margin = None, 0.0
+        for bid in available_bids:
+            if bid == 'Pass':
+                continue
+            level, trump_suit = bid.split(' ', 1)
+            spare = expected[trump_suit] - (int(level) + 6)
+            if spare >= margin and (best is None or spare > margin):
+                best, margin = bid, spare
+        if best is None:
+            return 'Pass' if 'Pass' in available_bids else available_bids[0]
+        return best
+
+
+
+class TableAgent(RandomAgent):
+    """
+    Bids with `TrickTable.suggest_bid`, and otherwise plays as RandomAgent.
+
+    Attributes:
+        table (TrickTable): The table consulted, by default the process-wide
+                            table of `get_trick_table`.
+    """
+    def __init__(self, seed=None, table=None):
+        super().__init__(seed)
+        self.table = table
+
+    def choose_bid(self, phase, player, available_bids):
+        table = self.table or get_trick_table()
+        return table.suggest_bid(player.mask, available_bids)
+
+
+
+_table = None
+
+def get_trick_table():
+    """
+    Returns the process-wide table, memory-mapping `Config.TRICK_TABLE_PATH`
+    the first time it is needed.
+    """
+    global _table
+    if _table is None:
+        _table = TrickTable.open(Config.TRICK_TABLE_PATH)
+    return _table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the trick '
+                                     'expectation table by simulating deals.')
+    parser.add_argument('--deals', type=int, default=100000)
+    parser.add_argument('--out', default='trick_table.bin')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    table = build_table(args.out, args.deals, args.seed, args.workers,
+                        args.chunk_size)
+    filled = int((table.counts > 0).sum())
+    print(f'Wrote {args.out}: {table.samples} hands, {filled} of '
+          f'{table.counts.size} cells sampled.')
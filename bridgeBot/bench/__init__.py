@@ -0,0 +1,8 @@
+#   bench/__init__.py
+from .core import BenchResult, measure, compare
+from .runner import run_suite, use_stand_in
+
+__all__ = [
+    'BenchResult', 'measure', 'compare',
+    'run_suite', 'use_stand_in'
+]
@@ -0,0 +1,5 @@
+#   bench/__main__.py
+from bench.runner import main
+
+if __name__ == '__main__':
+    main()
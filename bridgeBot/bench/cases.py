@@ -0,0 +1,163 @@
+#   bench/cases.py
+"""
+The benchmark cases. Each case is a factory taking the suite seed and
+returning `(run, ops_per_call)`, where `run` performs `ops_per_call`
+operations from state prepared by the factory, so only the hot path is
+timed.
+"""
+import random
+import numpy as np
+from game import Deck, Player, SetupPhase, BiddingPhase, GamePhase, \
+    RandomAgent, bits, rules
+from game import dealindex
+from game.dealer import DealGenerator
+from game.engine import DEFAULT_PLAYER_NAMES, run_game
+from models import CardModel
+
+CASES = {}
+
+def case(name):
+    """ Registers a case factory under `name`. """
+    def register(factory):
+        CASES[name] = factory
+        return factory
+    return register
+
+
+def _agents(seed):
+    return [ RandomAgent(seed + seat) for seat in range(4) ]
+
+
+@case('deck_shuffle_deal')
+def deck_shuffle_deal(seed):
+    random.seed(seed)
+    deck = Deck(list(CardModel.get_canonical_deck()))
+
+    def run():
+        deck.shuffle()
+        deck.deal()
+    return run, 1
+
+
+@case('setup_phase')
+def setup_phase(seed):
+    dealer = DealGenerator(seed)
+    agents = _agents(seed)
+
+    def run():
+        for _ in range(10):
+            SetupPhase(DEFAULT_PLAYER_NAMES, agents, dealer=dealer)
+    return run, 10
+
+
+@case('deal_index')
+def deal_index(seed):
+    deals = [ deal.tolist() for deal in DealGenerator(seed).generate(64) ]
+
+    def run():
+        for deal in deals:
+            dealindex.unrank_hands(dealindex.rank_order(deal))
+    return run, len(deals)
+
+
+@case('hand_value')
+def hand_value(seed):
+    deals = DealGenerator(seed).generate(64)
+    players = []
+    for deal in deals:
+        for seat in range(4):
+            player = Player(None, seat + 1)
+            player.receive_hand([ CardModel.get_canonical_deck()[i]
+                                  for i in deal[seat::4] ])
+            players.append(player)
+
+    def run():
+        for player in players:
+            player.hand_value()
+    return run, len(players)
+
+
+@case('sort_deck')
+def sort_deck(seed):
+    rng = np.random.default_rng(seed)
+    deck = CardModel.get_canonical_deck()
+    hands = [ [ deck[i] for i in rng.permutation(52)[:13] ]
+              for _ in range(64) ]
+
+    def run():
+        for hand in hands:
+            Deck.sort_deck(list(hand))
+    return run, len(hands)
+
+
+@case('auction')
+def auction(seed):
+    setup = SetupPhase(DEFAULT_PLAYER_NAMES, _agents(seed),
+                       dealer=DealGenerator(seed))
+
+    def run():
+        for _ in range(10):
+            BiddingPhase(setup).start_bidding()
+    return run, 10
+
+
+@case('set_resolution')
+def set_resolution(seed):
+    rng = np.random.default_rng(seed)
+    sets = [ (rng.permutation(52)[:4].tolist(), int(rng.integers(5)))
+             for _ in range(256) ]
+    set_winner = rules.set_winner
+
+    def run():
+        for cards, trump in sets:
+            set_winner(cards, trump)
+    return run, len(sets)
+
+
+@case('full_game')
+def full_game(seed):
+    dealer = DealGenerator(seed)
+    agents = _agents(seed)
+
+    def run():
+        for _ in range(10):
+            run_game(agents, dealer=dealer)
+    return run, 10
+
+
+@case('position_branch')
+def position_branch(seed):
+    #   The opening positions of a few games, searched one set (four cards) deep
+    dealer = DealGenerator(seed)
+    positions = []
+    while len(positions) < 4:
+        setup = SetupPhase(DEFAULT_PLAYER_NAMES, _agents(seed), dealer=dealer)
+        bidding = BiddingPhase(setup)
+        bidding.start_bidding()
+        if bidding.trump_bidder is not None:
+            bidding.select_partner(bidding.trump_bidder)
+            positions.append(GamePhase(bidding).position())
+
+    def search(position, depth):
+        if not depth:
+            return 1
+        nodes = 1
+        for card in bits.iter_cards(position.legal_mask()):
+            position.make(card)
+            nodes += search(position, depth - 1)
+            position.unmake()
+        return nodes
+
+    nodes = sum( search(position, 4) for position in positions )
+
+    def run():
+        for position in positions:
+            search(position, 4)
+    return run, nodes
+
+
+@case('card_model_load')
+def card_model_load(seed):
+    def run():
+        CardModel.refresh_canonical_deck()
+    return run, 1
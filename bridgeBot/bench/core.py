@@ -0,0 +1,121 @@
+#   bench/core.py
+import gc
+import time
+import tracemalloc
+
+class BenchResult:
+    """
+    The measurements of one benchmark case.
+
+    Attributes:
+        name (str):             The name of the case.
+        ops (int):              The number of operations timed.
+        ops_per_call (int):     The number of operations of one call.
+        ops_per_sec (float):    The throughput over all timed calls.
+        call_p50_us (float):    The median time of a call, in µs.
+        call_p99_us (float):    The 99th percentile time of a call, in µs.
+        peak_kib (float):       The peak memory allocated by one call, in KiB.
+    """
+    def __init__(self, name, ops, ops_per_call, ops_per_sec, call_p50_us,
+                 call_p99_us, peak_kib):
+        self.name = name
+        self.ops = ops
+        self.ops_per_call = ops_per_call
+        self.ops_per_sec = ops_per_sec
+        self.call_p50_us = call_p50_us
+        self.call_p99_us = call_p99_us
+        self.peak_kib = peak_kib
+
+    def to_dict(self):
+        """ Returns the result as a JSON-serializable dictionary. """
+        return {
+            'ops': self.ops,
+            'ops_per_call': self.ops_per_call,
+            'ops_per_sec': round(self.ops_per_sec, 1),
+            'call_p50_us': round(self.call_p50_us, 3),
+            'call_p99_us': round(self.call_p99_us, 3),
+            'peak_kib': round(self.peak_kib, 1),
+        }
+
+
+def percentile(samples, fraction):
+    """ Returns the `fraction` percentile of sorted `samples`. """
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(name, run, ops_per_call, calls=200, warmup=10):
+    """
+    Times a benchmark case.
+
+    `run` is called `warmup` times untimed, then `calls` times with each call
+    timed on its own. The percentiles are of whole calls: the operations of
+    a call are not timed one by one, as the clock would cost more than the
+    fastest of them.
+    One more call runs under tracemalloc for the peak memory, apart from the
+    timed calls so tracing does not slow them down. The garbage collector is
+    paused while timing.
+
+    Arguments:
+        name (str):         The name of the case.
+        run (callable):     Performs `ops_per_call` operations per call.
+        ops_per_call (int): The number of operations performed by `run`.
+        calls (int):        The number of timed calls.
+        warmup (int):       The number of untimed calls first.
+
+    Returns:
+        BenchResult: The measurements.
+    """
+    for _ in range(warmup):
+        run()
+    samples = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        clock = time.perf_counter_ns
+        for _ in range(calls):
+            start = clock()
+            run()
+            samples.append(clock() - start)
+    finally:
+        if enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(samples)
+    per_call = sorted( sample / 1000 for sample in samples )
+    return BenchResult(name, calls * ops_per_call, ops_per_call,
+                       calls * ops_per_call / (total / 1e9),
+                       percentile(per_call, 0.5), percentile(per_call, 0.99),
+                       peak / 1024)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compares results to a baseline.
+
+    Arguments:
+        results (dict):     The 'results' of a run, by case name.
+        baseline (dict):    The 'results' of the baseline run, by case name.
+        tolerance (float):  The fraction of throughput a case may lose.
+
+    Returns:
+        list of str: A description of every regression; empty if none.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        floor = reference['ops_per_sec'] * (1 - tolerance)
+        if result['ops_per_sec'] < floor:
+            change = result['ops_per_sec'] / reference['ops_per_sec'] - 1
+            regressions.append(f"{name}: {result['ops_per_sec']:.1f} ops/s "
+                               f"vs {reference['ops_per_sec']:.1f} baseline "
+                               f'({change:+.0%})')
+    return regressions
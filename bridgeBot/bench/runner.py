@@ -0,0 +1,102 @@
+#   bench/runner.py
+import argparse
+import json
+import os
+import platform
+import sys
+from utils import Config, use_client
+from .core import measure, compare
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def use_stand_in():
+    """
+    Points the process at an in-memory MongoDB stand-in, so the suite never
+    touches a real server.
+
+    Returns:
+        bool: False if mongomock is not installed, in which case the
+        configured server is used.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        return False
+    use_client(mongomock.MongoClient(Config.MONGO_URI))
+    return True
+
+
+def run_suite(seed=0, calls=200, names=None):
+    """
+    Runs the benchmark cases.
+
+    Arguments:
+        seed (int):             Seeds every case, so runs are reproducible.
+        calls (int):            The number of timed calls per case.
+        names (list of str):    The cases to run, by default all of them.
+
+    Returns:
+        dict: The report, with the 'results' of every case by name.
+    """
+    from .cases import CASES
+    results = {}
+    for name in names or CASES:
+        run, ops_per_call = CASES[name](seed)
+        results[name] = measure(name, run, ops_per_call, calls).to_dict()
+    return {
+        'seed': seed,
+        'calls': calls,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the hot paths of '
+                                     'the game and compares them to a '
+                                     'baseline.')
+    parser.add_argument('cases', nargs='*',
+                        help='The cases to run, by default all of them.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='The baseline report to compare against; '
+                        'without one, the run fails unless it saves it.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='The fraction of throughput a case may lose '
+                        'before it counts as a regression.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write this run as the new baseline.')
+    parser.add_argument('--live-db', action='store_true',
+                        help='Use the configured MongoDB server instead of '
+                        'an in-memory stand-in.')
+    args = parser.parse_args()
+
+    if not args.live_db and not use_stand_in():
+        print('mongomock is not installed; using the configured MongoDB '
+              'server.', file=sys.stderr)
+    report = run_suite(args.seed, args.calls, args.cases)
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        return
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --save-baseline to '
+              'record one.', file=sys.stderr)
+        sys.exit(2)
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get('seed') != args.seed:
+        print(f"The baseline was run with seed {baseline.get('seed')}, not "
+              f'{args.seed}.', file=sys.stderr)
+    regressions = compare(report['results'], baseline['results'],
+                          args.tolerance)
+    if regressions:
+        print('REGRESSIONS:', file=sys.stderr)
+        for regression in regressions:
+            print('  ' + regression, file=sys.stderr)
+        sys.exit(1)
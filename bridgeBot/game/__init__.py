@@ -1,11 +1,22 @@
 #   game/__init__.py
 from .core import Card, Deck, Player
+from .state import GameState
 from .setup import BaseGame, SetupPhase
+from .auction import AuctionState
 from .bidding import BiddingPhase
 from .game import GamePhase
+from .position import Position
+from .agents import Agent, ConsoleAgent, RandomAgent, ScriptedAgent
+from .events import ConsolePrinter, EventRecorder
+from .engine import run_game
+from .record import GameRecord, RecordCollector, RecordReader, RecordWriter
 
 __all__ = [
     'Card', 'Deck', 'Player',
     'BaseGame', 'SetupPhase',
-    'BiddingPhase', 'GamePhase'
+    'AuctionState', 'BiddingPhase', 'GamePhase', 'Position',
+    'Agent', 'ConsoleAgent', 'RandomAgent', 'ScriptedAgent',
+    'ConsolePrinter', 'EventRecorder',
+    'run_game',
+    'GameRecord', 'RecordCollector', 'RecordReader', 'RecordWriter'
 ]
@@ -0,0 +1,173 @@
+#   game/agents.py
+import random
+
+class Agent:
+    """
+    Makes the decisions of a player. The phases ask the agent of the player to
+    act for a bid, a partner card or a card to play, always passing the phase
+    itself so the agent can inspect the state of the game.
+    """
+    def choose_bid(self, phase, player, available_bids):
+        """
+        Chooses a bid.
+
+        Arguments:
+            phase (BiddingPhase):           The bidding phase in progress.
+            player (Player):                The player to bid.
+            available_bids (tuple of str):  The legal bids, e.g. ('Pass',
+                                            '1 Clubs', ...).
+
+        Returns:
+            str: One of `available_bids`.
+        """
+        raise NotImplementedError
+
+    def choose_partner_card(self, phase, player, available_cards):
+        """
+        Chooses the card whose owner becomes the partner of the bid winner.
+
+        Arguments:
+            phase (BiddingPhase):           The bidding phase in progress.
+            player (Player):                The player who won the bid.
+            available_cards (list of Card): The sorted cards held by the other
+                                            players.
+
+        Returns:
+            Card: One of `available_cards`.
+        """
+        raise NotImplementedError
+
+    def choose_card(self, phase, player, legal_cards):
+        """
+        Chooses a card to play to the current set.
+
+        Arguments:
+            phase (GamePhase):              The game phase in progress.
+            player (Player):                The player to play.
+            legal_cards (list of Card):     The sorted cards the player may
+                                            legally play.
+
+        Returns:
+            Card: One of `legal_cards`.
+        """
+        raise NotImplementedError
+
+
+
+class ConsoleAgent(Agent):
+    """ Prompts a human at the terminal for every decision. """
+    def choose_bid(self, phase, player, available_bids):
+        bid = input(f'\n{player.name} (Player {player.order}) bidding.\n\
+Available bids: {available_bids}\nEnter your bid: ')
+        return bid.title()  #   Capitalizes first letter and after every
+                            #   whitespace
+
+    def choose_partner_card(self, phase, player, available_cards):
+        print(f'\n{player.name} won the bid with {phase.trump_suit}.\n\
+Select a partner card:')
+
+        # Display the sorted cards with enumeration
+        i = 0
+        for idx, card in enumerate(available_cards, 1):
+            print(f"{idx}: {card}".ljust(25), end='')
+            if i == 2:
+                print('')
+                i = 0
+            else:
+                print(', ', end='')
+                i += 1
+
+        # Input selection of the card index
+        partner_card_index = int(input('\nEnter the number of the card to ' \
+                                       "select as your partner's card: ")) - 1
+        return available_cards[partner_card_index]
+
+    def choose_card(self, phase, player, legal_cards):
+        # Display the legal cards for player to choose from
+        print(f"\n{player.name}'s turn to play. Legal cards to play:")
+        for index, card in enumerate(legal_cards, start=1):
+            print(f'{index}: {card}')
+
+        # Get player input for card selection
+        card_index = int(input('Enter the number of the card you choose to ' \
+                               'play: ')) - 1
+        return legal_cards[card_index]
+
+
+
+class RandomAgent(Agent):
+    """
+    Makes a uniformly random legal choice for every decision, except that it
+    passes with a fixed probability whenever passing is legal, so auctions do
+    not all climb to 7 No Trump.
+
+    Attributes:
+        rng (Random):       The random number generator of the agent.
+        pass_rate (float):  The probability of passing when passing is legal.
+    """
+    def __init__(self, seed=None, pass_rate=0.75):
+        self.rng = random.Random(seed)
+        self.pass_rate = pass_rate
+
+    def choose_bid(self, phase, player, available_bids):
+        if available_bids[0] == 'Pass' and (len(available_bids) == 1
+                                            or self.rng.random()
+                                            < self.pass_rate):
+            return 'Pass'
+        start = 1 if available_bids[0] == 'Pass' else 0
+        return available_bids[self.rng.randrange(start, len(available_bids))]
+
+    def choose_partner_card(self, phase, player, available_cards):
+        return available_cards[self.rng.randrange(len(available_cards))]
+
+    def choose_card(self, phase, player, legal_cards):
+        return legal_cards[self.rng.randrange(len(legal_cards))]
+
+
+
+class ScriptedAgent(Agent):
+    """
+    Replays a fixed script of decisions, e.g. for tests and reproductions.
+
+    Bids are given as bid strings ('Pass', '2 Hearts'), cards as card names
+    ('Ace of Spades'). A decision outside of the legal choices raises a
+    ValueError, as does running out of script.
+
+    Attributes:
+        bids (iterator of str):             The remaining bids.
+        partner_cards (iterator of str):    The remaining partner card names.
+        cards (iterator of str):            The remaining card names to play.
+    """
+    def __init__(self, bids=(), partner_cards=(), cards=()):
+        self.bids = iter(bids)
+        self.partner_cards = iter(partner_cards)
+        self.cards = iter(cards)
+
+    @staticmethod
+    def _next(script, what, player):
+        try:
+            return next(script)
+        except StopIteration:
+            raise ValueError(f'No scripted {what} left for {player.name}.') \
+                from None
+
+    @staticmethod
+    def _pick(name, cards):
+        for card in cards:
+            if repr(card) == name:
+                return card
+        raise ValueError(f'{name} is not one of {cards}.')
+
+    def choose_bid(self, phase, player, available_bids):
+        bid = self._next(self.bids, 'bid', player)
+        if bid not in available_bids:
+            raise ValueError(f'{bid} is not one of {available_bids}.')
+        return bid
+
+    def choose_partner_card(self, phase, player, available_cards):
+        name = self._next(self.partner_cards, 'partner card', player)
+        return self._pick(name, available_cards)
+
+    def choose_card(self, phase, player, legal_cards):
+        name = self._next(self.cards, 'card', player)
+        return self._pick(name, legal_cards)
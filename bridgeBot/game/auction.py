@@ -0,0 +1,170 @@
+#   game/auction.py
+"""
+The auction on integer bid ids.
+
+Bid id 0 is a pass; ids 1 to 35 climb the ladder '1 Clubs', '1 Diamonds',
+..., '1 No Trump', '2 Clubs', ..., '7 No Trump', so a higher id is a higher
+bid and the bids available over the highest bid `h` are the ids above `h`.
+Display strings are built once, in `BIDS`.
+"""
+from . import rules
+
+PASS = 0
+N_TRUMPS = len(rules.TRUMP_NAMES)
+N_BIDS = 7 * N_TRUMPS       #   Not counting the pass
+
+BIDS = ('Pass',) + tuple( f'{level} {trump}' for level in range(1, 8)
+                          for trump in rules.TRUMP_NAMES )
+BID_ID = { bid: i for i, bid in enumerate(BIDS) }
+
+#   AVAILABLE_IDS[pass allowed][highest bid id]: the legal bid ids, and
+#   AVAILABLE[...] their display strings, as returned by
+#   `BiddingPhase.calculate_available_bids`.
+AVAILABLE_IDS = tuple(
+    tuple( ((PASS,) if allowed else ()) + tuple(range(highest + 1, N_BIDS + 1))
+           for highest in range(N_BIDS + 1) )
+    for allowed in (False, True)
+)
+AVAILABLE = tuple( tuple( tuple( BIDS[bid] for bid in bids ) for bids in row )
+                   for row in AVAILABLE_IDS )
+
+
+def bid_level(bid):
+    """ Returns the level of a bid id, e.g. 3 for '3 Hearts'. """
+    return (bid - 1) // N_TRUMPS + 1
+
+
+def bid_trump(bid):
+    """ Returns the trump index of a bid id (see `game.rules`). """
+    return (bid - 1) % N_TRUMPS
+
+
+def make_bid_id(level, trump):
+    """ Returns the bid id of a level and a trump index. """
+    return (level - 1) * N_TRUMPS + trump + 1
+
+
+#   NEXT_SEAT[n][active][seat]: the first active seat after `seat` among `n`
+#   players, whose active seats are the bits of `active`; -1 if none.
+NEXT_SEAT = { n: tuple(
+    tuple( next(( (seat + offset) % n for offset in range(1, n + 1)
+                  if active >> ((seat + offset) % n) & 1 ), -1)
+           for seat in range(n) )
+    for active in range(1 << n) ) for n in range(2, 9) }
+
+
+
+class AuctionState:
+    """
+    The state of an auction: players bid in seat order, skipping those who
+    passed, until all but one player have passed after a bid. If every player
+    passes before any bid, the deal is passed out.
+
+    Attributes:
+        n (int):        The number of players.
+        highest (int):  The highest bid id, or PASS before any bid.
+        bidder (int):   The seat of the highest bid, or -1.
+        active (int):   A bitmask of the seats that have not passed.
+        passes (int):   The number of passes.
+        turn (int):     The seat to bid next.
+        count (int):    The number of bids made, passes included.
+        shown (int):    A bitmask of the trumps each seat bid, N_TRUMPS bits
+                        per seat (see `shown_trumps`).
+    """
+    __slots__ = ('n', 'highest', 'bidder', 'active', 'passes', 'turn',
+                 'count', 'shown')
+
+    def __init__(self, n=4, turn=0):
+        self.n = n
+        self.highest = PASS
+        self.bidder = -1
+        self.active = (1 << n) - 1
+        self.passes = 0
+        self.turn = turn
+        self.count = 0
+        self.shown = 0
+
+    def shown_trumps(self, seat):
+        """ Returns the trump indices bid by a seat, in ascending order. """
+        shown = self.shown >> (seat * N_TRUMPS)
+        return [ trump for trump in range(N_TRUMPS) if shown >> trump & 1 ]
+
+    @property
+    def done(self):
+        """ True once all but one player passed after a bid, or all passed. """
+        return self.passes >= self.n or \
+            (self.passes == self.n - 1 and self.bidder >= 0)
+
+    def can_pass(self):
+        """ Returns True if passing is legal, i.e. until the auction is over. """
+        return not self.done
+
+    def is_legal(self, bid):
+        """ Returns True if bid id `bid` may be made now. """
+        if bid == PASS:
+            return self.can_pass()
+        return self.highest < bid <= N_BIDS
+
+    def available(self):
+        """ Returns the legal bid ids, from the ladder. """
+        return AVAILABLE_IDS[self.can_pass()][self.highest]
+
+    def available_names(self):
+        """ Returns the display strings of the legal bids, from the ladder. """
+        return AVAILABLE[self.can_pass()][self.highest]
+
+    def apply(self, bid):
+        """
+        Makes bid id `bid` for the seat to bid, and moves the turn on. The bid
+        is not checked; see `is_legal`.
+
+        Returns:
+            bool: True if the auction is over.
+        """
+        self.count += 1
+        if bid == PASS:
+            self.active &= ~(1 << self.turn)
+            self.passes += 1
+        else:
+            self.highest = bid
+            self.bidder = self.turn
+            self.shown |= 1 << (self.turn * N_TRUMPS + bid_trump(bid))
+        if self.done:
+            return True
+        self.turn = NEXT_SEAT[self.n][self.active][self.turn]
+        return False
+
+
+
+def run_auction(choose, n=4, turn=0):
+    """
+    Runs one auction with integer bids only.
+
+    Arguments:
+        choose (callable):  Called as `choose(state)` to get the bid id of
+                            `state.turn`; it must be legal.
+        n (int):            The number of players.
+        turn (int):         The seat to bid first.
+
+    Returns:
+        AuctionState: The finished auction.
+    """
+    state = AuctionState(n, turn)
+    apply = state.apply
+    while not apply(choose(state)):
+        pass
+    return state
+
+
+def run_auctions(count, choose, n=4):
+    """
+    Runs `count` auctions back to back, e.g. to simulate bidding bots.
+
+    Returns:
+        list of tuple: The (highest bid id, bidder seat) of every auction.
+    """
+    results = []
+    for _ in range(count):
+        state = run_auction(choose, n)
+        results.append((state.highest, state.bidder))
+    return results
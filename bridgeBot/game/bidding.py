@@ -1,6 +1,9 @@
 #   game/bidding.py
-from .core import Deck
+from . import auction, bits, events, rules
+from .auction import AuctionState
 from .setup import BaseGame
+from .state import shared
+from utils import metrics
 
 class BiddingPhase(BaseGame):
     """
@@ -8,37 +11,103 @@ class BiddingPhase(BaseGame):
     determining the winning bid and the trump suit for the gameplay phase.
 
     Attributes:
+        auction (AuctionState): The state of the auction on bid ids (see
+                                `game.auction`).
+        partnership (dict):     A dictionary mapping (Player: Player) each
+                                player to their partner.
+        partner_card (Card):    The card announced by the bid winner to
+                                select their partner, or None.
+
+    The other attributes are read from `auction`:
         active (dict):          A dictionary mapping (Player: Bool) indicating
                                 if they are active bidders.
         pass_count (int):       The number of players who passed
-        numeric_bid (int):      The highest numeric bid value made.
+        numeric_bid (int):      The level of the highest bid, 0 before a bid.
         trump_suit (str):       The trump suit.
-        highest_bid (int):      The highest computed bid value (bid + suit). 
-        trump_bidder (Player):  The layer who made the winning bid.
-        partnership (dict):     A dictionary mapping (Player: Player) each
-                                player to their partner.
+        highest_bid (int):      The highest bid id.
+        trump_bidder (Player):  The player who made the winning bid.
+        turn (int):             The index of the player to bid next.
+
+    The bidding can be driven by the agents with `start_bidding` and
+    `select_partner`, or one action at a time with `make_bid` and
+    `choose_partner`, e.g. by a server waiting on its players.
+
+    The phase takes over the GameState of the setup phase.
     """
+    __slots__ = ()
+
+    auction = shared('auction')
+    partnership = shared('partnership')
+    partner_card = shared('partner_card')
+
     def __init__(self, setupPhase):
-        self.deck = setupPhase.deck
-        self.players = setupPhase.players
-        self.active = { player: True for player in self.players }
-        self.pass_count = 0
-        self.numeric_bid = 0
-        self.trump_suit = None
-        self.highest_bid = 0
-        self.trump_bidder = None
-        self.partnership = {}
+        state = self.state = setupPhase.state
+        state.auction = AuctionState(len(state.players))
+        state.partnership = {}
+        state.partner_card = None
+
+    @property
+    def active(self):
+        return { player: bool(self.auction.active >> seat & 1)
+                 for seat, player in enumerate(self.players) }
+
+    @property
+    def pass_count(self):
+        return self.auction.passes
+
+    @property
+    def highest_bid(self):
+        return self.auction.highest
+
+    @property
+    def numeric_bid(self):
+        highest = self.auction.highest
+        return auction.bid_level(highest) if highest != auction.PASS else 0
+
+    @property
+    def trump_suit(self):
+        highest = self.auction.highest
+        if highest == auction.PASS:
+            return None
+        return rules.TRUMP_NAMES[auction.bid_trump(highest)]
+
+    @property
+    def trump_bidder(self):
+        bidder = self.auction.bidder
+        return self.players[bidder] if bidder >= 0 else None
+
+    @property
+    def turn(self):
+        return self.auction.turn
+
+    @property
+    def bidding_over(self):
+        """
+        True once three players have passed after a bid, or everyone passed.
+        """
+        return self.auction.done
+
+    @property
+    def partner_selected(self):
+        """ True once the bid winner has selected the partner card. """
+        return bool(self.partnership)
+
+    @property
+    def to_act(self):
+        """
+        The player to act next: the next active bidder during the bidding, then
+        the bid winner until the partner card is selected, otherwise None.
+        """
+        if not self.auction.done:
+            return self.players[self.auction.turn]
+        if self.auction.bidder >= 0 and not self.partner_selected:
+            return self.players[self.auction.bidder]
+        return None
 
     def start_bidding(self):
         """ Executes the bidding process until three players have passed. """
-        while self.pass_count < 3:
-            for player in self.players:
-                if self.active[player]:
-                    if self.trump_bidder and self.pass_count == 3:
-                        print(f'Bidding ended early.\nWinner: \
-{self.trump_bidder.name}  with {self.trump_suit} at {self.numeric_bid} bids.')
-                        return None
-                    self.collect_bid(player)
+        while not self.bidding_over:
+            self.collect_bid(self.to_act)
 
     def collect_bid(self, player):
         """
@@ -47,114 +116,106 @@ class BiddingPhase(BaseGame):
         their active status is set to False.
         """
         available_bids = self.calculate_available_bids()
-        bid = input(f'\n{player.name} (Player {player.order}) bidding.\n\
-Available bids: {available_bids}\nEnter your bid: ')
-        bid = bid.title()   #   Capitalizes first letter and after every
-                            #   whitespace
-        if bid == 'Pass':
-            self.active[player] = False
-            self.pass_count += 1
-        else:
-            bid_number, bid_suit = bid.split(maxsplit=1)
-            bid_number = int(bid_number)
-            self.numeric_bid = bid_number
-            self.trump_suit = bid_suit
-            self.highest_bid = self.calculate_bid_value(bid_number, bid_suit)
-            self.trump_bidder = player
+        bid = player.agent.choose_bid(self, player, available_bids)
+        self.make_bid(player, bid)
 
-    def calculate_available_bids(self):
+    def make_bid(self, player, bid):
         """
-        Calculates and returns the list of available bids based on the current
-        highest bid.
+        Applies one bid and advances the turn to the next active bidder, so the
+        bidding can be driven one action at a time.
 
-        Full truncated list: ['Pass', '1 Clubs', '1 Diamonds', '1 Hearts',
-                              '1 Spades', '1 No Trump', '2 Clubs', ...,
-                              '7 Spades', '7 No Trump'].
+        Raises:
+            ValueError: If it is not the turn of `player` or `bid` is not one
+                        of the available bids.
+        """
+        state = self.auction
+        if state.done or player is not self.players[state.turn]:
+            raise ValueError(f'It is not the turn of {player.name} to bid.')
+        bid_id = auction.BID_ID.get(bid)
+        if bid_id is None or not state.is_legal(bid_id):
+            raise ValueError(f'{bid} is not an available bid.')
+        self.emit(events.BID, player=player, bid=bid)
+        if state.apply(bid_id):
+            if metrics.enabled:
+                metrics.observe('auction_bids', state.count)
+            self.emit(events.BIDDING_ENDED, player=self.trump_bidder,
+                      trump_suit=self.trump_suit, numeric_bid=self.numeric_bid)
+
+    def calculate_available_bids(self):
+        """
+        Returns the available bids as a slice of the precomputed ladder, e.g.
+        ('Pass', '1 Clubs', '1 Diamonds', '1 Hearts', '1 Spades',
+         '1 No Trump', '2 Clubs', ..., '7 Spades', '7 No Trump').
         If a bid for e.g. '1 Hearts' was made, any bids lower than or equal in
         value to '1 Hearts' will no longer be available for subsequent bids.
         """
-        bids = ['Pass'] if self.pass_count < 3 else []
-        #   Sets minimum bid amount of 1
-        current_level = max(self.numeric_bid // 10, 1)
-        for i in range(current_level, 8):
-            for suit in Deck.SUITS + ["No Trump"]:
-                bid_value = self.calculate_bid_value(i, suit)
-                if bid_value > self.highest_bid:
-                    bids.append(f"{i} {suit}")
-        return bids
+        return self.auction.available_names()
 
     def calculate_bid_value(self, bid_number, bid_suit):
         """
-        Calculates a unique numeric value for a bid.
-
-        For simplicity, adopt the score weightages:
-        Bid set count:
-        1 - 10 pts         Clubs - 1 pts
-        2 - 20 pts      Diamonds - 2 pts
-        3 - 30 pts        Hearts - 3 pts
-        4 - 40 pts        Spades - 4 pts
-        5 - 50 pts      No Trump - 5 pts
-        6 - 60 pts
-        7 - 70 pts
-        """
-        score = {
-            'Clubs': 1,
-            'Diamonds': 2,
-            'Hearts': 3,
-            'Spades': 4,
-            'No Trump': 5,
-        }
-        return bid_number * 10 + score[bid_suit]
+        Returns the bid id of a bid, which orders bids by value: by level,
+        then Clubs < Diamonds < Hearts < Spades < No Trump.
+        """
+        return auction.make_bid_id(bid_number, rules.trump_index(bid_suit))
 
     def select_partner(self, bidding_player):
         """
         Allows the bidding winner to select a partner based on a specific card
         from other players' hands.
         """
-        print(f'\n{bidding_player.name} won the bid with {self.trump_suit}.\n\
-Select a partner card:')
-
-        available_cards = Deck.sort_deck([ card for player in self.players
-                                          if player != bidding_player
-                                          for card in player.hand ])
-
-        # Display the sorted cards with enumeration
-        i = 0
-        for idx, card in enumerate(available_cards, 1):
-            print(f"{idx}: {card}".ljust(25), end='')
-            if i == 2:
-                print('')
-                i = 0
-            else:
-                print(', ', end='')
-                i += 1
-
-        # Input selection of the card index
-        partner_card_index = int(input('\nEnter the number of the card to ' \
-                                       "select as your partner's card: ")) - 1
-        partner_card = available_cards[partner_card_index]
-
-        # Display the chosen partner card
-        print(f'You have selected {partner_card}. The owner of {partner_card} \
-will be your partner!\n')
+        available_cards = self.available_partner_cards(bidding_player)
+        partner_card = bidding_player.agent.choose_partner_card(
+            self, bidding_player, available_cards)
+        self.choose_partner(bidding_player, partner_card)
+
+    def available_partner_cards(self, bidding_player):
+        """ Returns the sorted cards held by the players other than the bidder. """
+        mask = 0
+        for player in self.players:
+            if player != bidding_player:
+                mask |= player.mask
+        cards = self.cards
+        return [ cards[index] for index in bits.iter_cards(mask) ]
+
+    def choose_partner(self, bidding_player, partner_card):
+        """
+        Makes the owner of `partner_card` the partner of the bid winner and sets
+        the number of sets each side needs.
+
+        Raises:
+            ValueError: If the auction is not over or no bid won it,
+                        `bidding_player` is not the bid winner, the partner
+                        is already selected, or `partner_card` is held by the
+                        bid winner.
+        """
+        if not self.auction.done or self.trump_bidder is None:
+            raise ValueError('No bid has won the auction yet.')
+        if bidding_player is not self.trump_bidder or self.partner_selected:
+            raise ValueError(f'{bidding_player.name} may not select a partner.')
+        if bidding_player.holds(partner_card):
+            raise ValueError(f'{partner_card} is held by {bidding_player.name}.')
+        self.partner_card = partner_card
+        self.emit(events.PARTNER_SELECTED, player=bidding_player,
+                  card=partner_card)
 
         # Find the owner of the partner card and establish partnership
         partner_player = None
         for player in self.players:
-            if partner_card in player.hand:
+            if player.holds(partner_card):
                 partner_player = player
                 break
 
         team_1 = [bidding_player, partner_player]
+        declarer_need, defender_need = rules.contract_targets(self.numeric_bid)
 
         for player in team_1:
-            player.sets_threshold = self.numeric_bid + 6
+            player.sets_threshold = declarer_need
 
         # Set the partnership for the other two players
         team_2 = [ player for player in self.players if player not in team_1 ]
 
         for player in team_2:
-            player.sets_threshold = 8 - self.numeric_bid
+            player.sets_threshold = defender_need
 
         self.partnership.update({
             bidding_player: partner_player,
@@ -0,0 +1,134 @@
+#   game/bits.py
+"""
+Compact integer representation of cards and hands.
+
+A card is an integer in [0, 52): `suit * 13 + rank`, where `suit` indexes
+`SUITS` (Clubs -> 0, ..., Spades -> 3) and `rank` indexes `RANKS` ('2' -> 0,
+..., 'Ace' -> 12). A hand is a 52-bit mask with bit `i` set if card `i` is
+held, so the 13-bit sub-mask of a suit is `(mask >> suit * 13) & SUIT_BITS`.
+
+Ascending card index is also the display order used by `Deck.sort_deck`, so
+iterating the set bits of a mask yields a sorted hand.
+"""
+
+SUITS = ('Clubs', 'Diamonds', 'Hearts', 'Spades')
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'Jack', 'Queen', 'King',
+         'Ace')
+
+N_SUITS = 4
+N_RANKS = 13
+N_CARDS = 52
+
+SUIT_INDEX = { suit: i for i, suit in enumerate(SUITS) }
+RANK_INDEX = { rank: i for i, rank in enumerate(RANKS) }
+
+SUIT_BITS = (1 << N_RANKS) - 1
+FULL_MASK = (1 << N_CARDS) - 1
+SUIT_MASKS = tuple( SUIT_BITS << (suit * N_RANKS) for suit in range(N_SUITS) )
+
+#   High card points per rank index (Jack -> 1, ..., Ace -> 4).
+RANK_POINTS = (0,) * 9 + (1, 2, 3, 4)
+
+#   Value of a 13-bit suit sub-mask: its high card points plus a point if it
+#   holds 5 or more cards. Indexed by the sub-mask itself.
+SUIT_VALUE = tuple(
+    sum( RANK_POINTS[rank] for rank in range(N_RANKS) if sub >> rank & 1 )
+    + (sub.bit_count() >= 5)
+    for sub in range(1 << N_RANKS)
+)
+
+
+def card_index(suit, rank):
+    """
+    Returns the integer index of a card.
+
+    Arguments:
+        suit (str):     The suit of the card.
+        rank (str):     The rank of the card.
+
+    Returns:
+        int: The card index in [0, 52).
+    """
+    return SUIT_INDEX[suit] * N_RANKS + RANK_INDEX[rank]
+
+
+def card_suit(index):
+    """ Returns the suit index of a card index. """
+    return index // N_RANKS
+
+
+def card_rank(index):
+    """ Returns the rank index of a card index. """
+    return index % N_RANKS
+
+
+def card_name(index):
+    """ Returns the display name of a card index, e.g. 'Ace of Spades'. """
+    return f'{RANKS[index % N_RANKS]} of {SUITS[index // N_RANKS]}'
+
+
+def mask_of(indices):
+    """ Returns the mask holding every card index in `indices`. """
+    mask = 0
+    for index in indices:
+        mask |= 1 << index
+    return mask
+
+
+def iter_cards(mask):
+    """ Yields the card indices held in `mask` in ascending (sorted) order. """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def holds(mask, index):
+    """ Returns True if card `index` is held in `mask`. """
+    return mask >> index & 1 == 1
+
+
+def suit_mask(mask, suit):
+    """ Returns the 13-bit sub-mask of suit index `suit` within `mask`. """
+    return mask >> (suit * N_RANKS) & SUIT_BITS
+
+
+def suit_lengths(mask):
+    """ Returns a tuple of the number of cards held in each suit. """
+    return tuple( (mask >> (suit * N_RANKS) & SUIT_BITS).bit_count()
+                  for suit in range(N_SUITS) )
+
+
+def high_card_points(mask):
+    """ Returns the high card points (A=4, K=3, Q=2, J=1) held in `mask`. """
+    return sum( SUIT_VALUE[mask >> (suit * N_RANKS) & SUIT_BITS & 0x1e00]
+                for suit in range(N_SUITS) )
+
+
+def hand_value(mask):
+    """
+    Returns the value of a hand as measured by `Player.hand_value`: high card
+    points plus a point for every suit holding 5 or more cards.
+    """
+    return (SUIT_VALUE[mask & SUIT_BITS]
+            + SUIT_VALUE[mask >> 13 & SUIT_BITS]
+            + SUIT_VALUE[mask >> 26 & SUIT_BITS]
+            + SUIT_VALUE[mask >> 39 & SUIT_BITS])
+
+
+def follow_mask(mask, led_suit):
+    """
+    Returns the cards of `mask` that may legally be played to a set.
+
+    Arguments:
+        mask (int):             The hand of the player.
+        led_suit (int | None):  The suit index led to the set, or None if the
+                                player is leading.
+
+    Returns:
+        int: The cards of the led suit if any are held, otherwise `mask`.
+    """
+    if led_suit is None:
+        return mask
+    following = mask & SUIT_MASKS[led_suit]
+    return following if following else mask
@@ -1,20 +1,31 @@
 #   game/core.py
 import random
+from operator import attrgetter
+from . import bits
 
 class Card:
     """
     Represents a single playing card with its MongoDB `_id`, a suit and a rank.
+    Cards are immutable, as one set of them is shared by every game in the
+    process.
 
     Attributes:
         id (str):       The MongoDB `_id` field of the document containing the
                         card.
         suit (str):     The suit of the card.
         rank (str):     The rank of the card.
+        index (int):    The compact card index in [0, 52) (see `game.bits`).
     """
+    __slots__ = ('id', 'suit', 'rank', 'index')
+
     def __init__(self, card_id, suit, rank):
-        self.id = card_id
-        self.suit = suit
-        self.rank = rank
+        object.__setattr__(self, 'id', card_id)
+        object.__setattr__(self, 'suit', suit)
+        object.__setattr__(self, 'rank', rank)
+        object.__setattr__(self, 'index', bits.card_index(suit, rank))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
 
     def __repr__(self):
         """ Returns a string representation of the card. """
@@ -45,6 +56,16 @@ class Deck:
         """ Shuffles the deck in place. """
         random.shuffle(self.cards)
 
+    def arrange(self, order):
+        """
+        Reorders the deck to match a sequence of card indices.
+
+        Arguments:
+            order (iterable of int):    The card indices in their new order.
+        """
+        by_index = { card.index: card for card in self.cards }
+        self.cards = [ by_index[index] for index in order ]
+
     def deal(self, n_hands=4):
         """
         Deals the cards into a specified number of hands.
@@ -69,9 +90,7 @@ class Deck:
         Returns:
             The sorted deck of cards.
         """
-        sort_fn = lambda card: (cls.SUITS.index(card.suit),
-                                cls.RANKS.index(card.rank))
-        cards.sort(key=sort_fn)
+        cards.sort(key=attrgetter('index'))
         return cards
 
 
@@ -87,38 +106,49 @@ class Player:
                                             (1st -> 1, 2nd -> 2, etc.).
         hand (list of Card):                The cards currently held by the
                                             player.
+        mask (int):                         The 52-bit mask of the card indices
+                                            in `hand`.
         sets_won (list of list of Card):    List of card sets won by the player.
         sets_threshold (int):               The number of sets to possess to win
                                             the game.
+        agent (Agent):                      The agent making the decisions of
+                                            the player.
     """
-    def __init__(self, telegram_id, order):
+    def __init__(self, telegram_id, order, agent=None):
         self.name = None
         self.telegram_id = telegram_id
         self.order = order
         self.hand = []
+        self.mask = 0
         self.sets_won = []
         self.sets_threshold = None
+        self.agent = agent
 
     def receive_hand(self, cards):
         """ Receives a list of cards as the player's hand. """
         self.hand = cards
+        self.mask = bits.mask_of( card.index for card in cards )
+
+    def remove_card(self, card):
+        """ Removes a card from the player's hand. """
+        self.hand.remove(card)
+        self.mask &= ~(1 << card.index)
+
+    def holds(self, card):
+        """ Returns True if the player holds the given card. """
+        return self.mask >> card.index & 1 == 1
+
+    def suit_mask(self, suit):
+        """ Returns the 13-bit sub-mask of the player's cards in `suit`. """
+        return bits.suit_mask(self.mask, bits.SUIT_INDEX[suit])
 
     def hand_value(self):
         """
-        Calculates the value of the player's hand.
-        
+        Calculates the value of the player's hand: high card points (Ace 4,
+        King 3, Queen 2, Jack 1) plus a point for any suit with 5 or more
+        cards.
+
         Returns:
             The value of the player's hand
         """
-        value_dict = {
-            'Ace': 4,
-            'King': 3,
-            'Queen': 2,
-            'Jack': 1,
-        }
-        value = sum( value_dict.get(card.rank, 0) for card in self.hand )
-        suit_counts = { suit: 0 for suit in Deck.SUITS }
-        for card in self.hand:
-            suit_counts[card.suit] += 1
-        #   Adds a point for any suit with 5 or more cards.
-        return value + sum( 1 for count in suit_counts.values() if count >= 5 )
+        return bits.hand_value(self.mask)
@@ -0,0 +1,155 @@
+#   game/dealer.py
+import numpy as np
+from . import bits, rules
+
+#   Per-card lookups indexed by card index (see `game.bits`).
+CARD_POINTS = np.array([ bits.RANK_POINTS[bits.card_rank(i)]
+                         for i in range(bits.N_CARDS) ], dtype=np.int8)
+CARD_SUITS = np.array([ bits.card_suit(i) for i in range(bits.N_CARDS) ],
+                      dtype=np.int8)
+
+
+def score_deals(deals, n_hands=4):
+    """
+    Scores a batch of deals with the same measure as `Player.hand_value`.
+
+    Arguments:
+        deals (ndarray):    An (n, 52) array of shuffled card indices, dealt
+                            round-robin as by `Deck.deal`.
+        n_hands (int):      The number of hands dealt.
+
+    Returns:
+        ndarray: An (n, n_hands) array of hand values.
+    """
+    n = deals.shape[0]
+    #   (n, 13, n_hands) -> hand `h` holds deck positions h, h + n_hands, ...
+    hands = deals.reshape(n, -1, n_hands)
+    points = CARD_POINTS[hands].sum(axis=1, dtype=np.int16)
+    suits = CARD_SUITS[hands]
+    for suit in range(bits.N_SUITS):
+        points += (suits == suit).sum(axis=1) >= 5
+    return points
+
+
+
+class DealGenerator:
+    """
+    Generates valid deals, i.e. deals where every hand is worth at least
+    `min_value`, by shuffling and scoring many decks at once.
+
+    A deal is an array of the 52 card indices in dealing order, so hand `h`
+    is `deal[h::n_hands]` as with `Deck.deal`.
+
+    Attributes:
+        rng (Generator):    The NumPy random generator used to shuffle.
+        batch_size (int):   The number of decks shuffled per batch.
+        min_value (int):    The minimum value of every hand in a valid deal.
+        n_hands (int):      The number of hands dealt.
+        dealt (int):        The total number of decks shuffled and scored.
+        accepted (int):     The total number of valid deals produced.
+        redeals (int):      The number of invalid deals discarded before the
+                            most recently produced deal.
+    """
+    def __init__(self, seed=None, batch_size=256,
+                 min_value=rules.MIN_HAND_VALUE, n_hands=4):
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.min_value = min_value
+        self.n_hands = n_hands
+        self.dealt = 0
+        self.accepted = 0
+        self.redeals = 0
+        self._pending = None
+        self._pending_redeals = None
+        self._cursor = 0
+        self._carry = 0
+        self._base = np.tile(np.arange(bits.N_CARDS, dtype=np.int8),
+                             (batch_size, 1))
+
+    def shuffle_batch(self):
+        """ Returns a (batch_size, 52) array of shuffled decks. """
+        self.dealt += self.batch_size
+        return self.rng.permuted(self._base, axis=1)
+
+    def valid_batch(self):
+        """
+        Shuffles and scores one batch of decks.
+
+        Returns:
+            tuple: The (k, 52) array of valid deals in the batch and the (k,)
+            array of invalid deals discarded before each of them.
+        """
+        deals = self.shuffle_batch()
+        values = score_deals(deals, self.n_hands)
+        valid = (values >= self.min_value).all(axis=1)
+        positions = np.flatnonzero(valid)
+        redeals = np.diff(positions, prepend=-1) - 1
+        if positions.size:
+            redeals[0] += self._carry
+            self._carry = self.batch_size - 1 - int(positions[-1])
+        else:
+            self._carry += self.batch_size
+        return deals[positions], redeals
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """ Returns the next valid deal. """
+        while self._pending is None or self._cursor >= len(self._pending):
+            self._pending, self._pending_redeals = self.valid_batch()
+            self._cursor = 0
+        deal = self._pending[self._cursor]
+        self.redeals = int(self._pending_redeals[self._cursor])
+        self._cursor += 1
+        self.accepted += 1
+        return deal
+
+    def generate(self, n):
+        """
+        Generates `n` valid deals.
+
+        Arguments:
+            n (int):    The number of deals to generate.
+
+        Returns:
+            ndarray: An (n, 52) array of valid deals.
+        """
+        chunks = []
+        count = 0
+        while count < n:
+            if self._pending is None or self._cursor >= len(self._pending):
+                self._pending, self._pending_redeals = self.valid_batch()
+                self._cursor = 0
+            chunk = self._pending[self._cursor:self._cursor + n - count]
+            self._cursor += len(chunk)
+            chunks.append(chunk)
+            count += len(chunk)
+        self.accepted += n
+        if not chunks:
+            return np.empty((0, bits.N_CARDS), dtype=np.int8)
+        return np.concatenate(chunks)
+
+
+
+class FixedDealer:
+    """
+    Deals a given sequence of deals, e.g. to replay recorded games through
+    `SetupPhase`.
+
+    Attributes:
+        deals (iterator):   The remaining deals, each a sequence of the 52
+                            card indices in dealing order.
+        redeals (int):      The redeals reported for every deal, e.g. as
+                            recorded; 0 by default.
+    """
+    def __init__(self, deals, redeals=0):
+        self.deals = iter(deals)
+        self.redeals = redeals
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """ Returns the next deal as an array of card indices. """
+        return np.asarray(next(self.deals), dtype=np.int8)
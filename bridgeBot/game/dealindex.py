@@ -0,0 +1,172 @@
+#   game/dealindex.py
+"""
+A bijection between deals and integers, the deal numbers.
+
+A deal (four hands of 13 cards, by seat) is numbered in [0, N_DEALS), with
+N_DEALS = 52! / 13!^4, about 5.4e28, so a deal number fits in 12 bytes. It is
+ranked seat by seat: the hand of seat 0 among the 52 cards, of seat 1 among
+the 39 cards left, of seat 2 among the 26 left (seat 3 takes the rest), each
+as the colexicographic rank of a 13-card combination, so
+
+    number = (rank_0 * C(39, 13) + rank_1) * C(26, 13) + rank_2
+
+Deal numbers identify deals across tables and processes, e.g. to skip
+duplicate deals, share one deal between tables or key analysis results.
+"""
+import random
+import numpy as np
+from . import bits, rules
+
+def _binomials(n_max, k_max):
+    rows = [ (1,) + (0,) * k_max ]
+    for _ in range(n_max):
+        row = rows[-1]
+        rows.append((1,) + tuple( row[k - 1] + row[k]
+                                  for k in range(1, k_max + 1) ))
+    return tuple(rows)
+
+#   BINOMIAL[n][k] = C(n, k) for n <= 52 and k <= 13.
+BINOMIAL = _binomials(bits.N_CARDS, bits.N_RANKS)
+
+HANDS = tuple( BINOMIAL[n][bits.N_RANKS] for n in (52, 39, 26) )
+N_DEALS = HANDS[0] * HANDS[1] * HANDS[2]
+DEAL_BYTES = (N_DEALS.bit_length() + 7) // 8
+
+
+def rank_hands(hands):
+    """
+    Returns the deal number of a deal.
+
+    Arguments:
+        hands (list of int):    The card mask of each of the four seats; the
+                                last one is implied by the other three.
+
+    Returns:
+        int: The deal number, in [0, N_DEALS).
+    """
+    number = 0
+    remaining = bits.FULL_MASK
+    for seat in range(3):
+        rank = 0
+        k = 1
+        mask = hands[seat]
+        while mask:
+            low = mask & -mask
+            rank += BINOMIAL[(remaining & (low - 1)).bit_count()][k]
+            k += 1
+            mask ^= low
+        number = number * HANDS[seat] + rank
+        remaining &= ~hands[seat]
+    return number
+
+
+def unrank_hands(number):
+    """
+    Returns the deal numbered `number`.
+
+    Returns:
+        tuple of int: The card mask of each of the four seats.
+    """
+    if not 0 <= number < N_DEALS:
+        raise ValueError(f'Deal number {number} is out of range.')
+    ranks = []
+    for size in reversed(HANDS[1:]):
+        number, rank = divmod(number, size)
+        ranks.append(rank)
+    ranks.append(number)
+    ranks.reverse()
+
+    hands = []
+    remaining = list(range(bits.N_CARDS))
+    for rank in ranks:
+        mask = 0
+        position = len(remaining)
+        for k in range(bits.N_RANKS, 0, -1):
+            position -= 1
+            while BINOMIAL[position][k] > rank:
+                position -= 1
+            rank -= BINOMIAL[position][k]
+            mask |= 1 << remaining[position]
+        hands.append(mask)
+        remaining = [ card for card in remaining if not mask >> card & 1 ]
+    hands.append(bits.mask_of(remaining))
+    return tuple(hands)
+
+
+def rank_order(order, n_hands=4):
+    """
+    Returns the deal number of a deck order, whose position `i` goes to seat
+    `i % 4` as with `Deck.deal`.
+    """
+    return rank_hands([ bits.mask_of(order[seat::n_hands])
+                        for seat in range(n_hands) ])
+
+
+def deal_order(number):
+    """
+    Returns a deck order dealing the deal numbered `number`, for `Deck.arrange`
+    or `FixedDealer`: deck position `i` goes to seat `i % 4`, and each hand is
+    dealt in ascending card order.
+    """
+    dealt = [ list(bits.iter_cards(hand)) for hand in unrank_hands(number) ]
+    return [ card for cards in zip(*dealt) for card in cards ]
+
+
+def to_bytes(number):
+    """ Returns the DEAL_BYTES big-endian bytes of a deal number. """
+    return number.to_bytes(DEAL_BYTES, 'big')
+
+
+def from_bytes(data):
+    """ Returns the deal number stored by `to_bytes`. """
+    return int.from_bytes(data, 'big')
+
+
+def is_valid(hands, min_value=rules.MIN_HAND_VALUE):
+    """ Returns True if every hand is worth at least `min_value`. """
+    return all( bits.hand_value(hand) >= min_value for hand in hands )
+
+
+
+class NumberedDealer:
+    """
+    Deals valid deals drawn uniformly by deal number, so every deal dealt is
+    known by its number, e.g. to skip deals already played.
+
+    Attributes:
+        rng (Random):       Draws the deal numbers.
+        min_value (int):    The minimum value of every hand in a valid deal.
+        number (int):       The deal number of the most recent deal.
+        redeals (int):      The number of invalid deals discarded before the
+                            most recent deal.
+    """
+    def __init__(self, seed=None, min_value=rules.MIN_HAND_VALUE):
+        self.rng = random.Random(seed)
+        self.min_value = min_value
+        self.number = None
+        self.redeals = 0
+
+    def __iter__(self):
+        return self
+
+    def next_number(self):
+        """ Draws the number of the next valid deal. """
+        self.redeals = 0
+        while True:
+            number = self.rng.randrange(N_DEALS)
+            if is_valid(unrank_hands(number), self.min_value):
+                self.number = number
+                return number
+            self.redeals += 1
+
+    def __next__(self):
+        """ Returns the next valid deal as an array of card indices. """
+        return np.asarray(deal_order(self.next_number()), dtype=np.int8)
+
+
+def seeded_deal_number(seed, min_value=rules.MIN_HAND_VALUE):
+    """
+    Returns the number of the valid deal chosen by `seed`, e.g. a date for a
+    deal of the day shared by every table.
+    """
+    return NumberedDealer(seed, min_value).next_number()
@@ -0,0 +1,34 @@
+#   game/engine.py
+from .setup import SetupPhase
+from .bidding import BiddingPhase
+from .game import GamePhase
+
+DEFAULT_PLAYER_NAMES = ('Player 1', 'Player 2', 'Player 3', 'Player 4')
+
+def run_game(agents, listeners=(), player_names=DEFAULT_PLAYER_NAMES,
+             dealer=None):
+    """
+    Plays a full game, from the deal through the bidding to the last set,
+    without any terminal interaction.
+
+    Arguments:
+        agents (list of Agent):     The agent of each player, in seat order.
+        listeners (iterable):       The callables receiving game events.
+        player_names (list of str): The names of the players, in seat order.
+        dealer (DealGenerator):     The generator to deal from, by default
+                                    `SetupPhase.DEALER`.
+
+    Returns:
+        GamePhase: The finished game phase, or None if nobody won the bid.
+    """
+    setup_game = SetupPhase(player_names, agents, listeners, dealer)
+
+    bidding_game = BiddingPhase(setup_game)
+    bidding_game.start_bidding()
+    if bidding_game.trump_bidder is None:
+        return None
+    bidding_game.select_partner(bidding_game.trump_bidder)
+
+    game_phase = GamePhase(bidding_game)
+    game_phase.play_game()
+    return game_phase
@@ -0,0 +1,74 @@
+#   game/events.py
+"""
+Events emitted by the phases as the game progresses. A listener is any
+callable taking `(event, data)`, where `event` is one of the names below and
+`data` is a dict of its fields:
+
+    deal                players, order (list of int card indices), redeals
+    bid                 player, bid
+    bidding_ended       player, trump_suit, numeric_bid (player is None
+                        if everyone passed)
+    partner_selected    player, card
+    card_played         player, card
+    set_won             player, cards (list of (Player, Card))
+    score               scores (list of (Player, int sets, int threshold))
+    game_over           player, partner
+"""
+
+DEAL = 'deal'
+BID = 'bid'
+BIDDING_ENDED = 'bidding_ended'
+PARTNER_SELECTED = 'partner_selected'
+CARD_PLAYED = 'card_played'
+SET_WON = 'set_won'
+SCORE = 'score'
+GAME_OVER = 'game_over'
+
+
+class EventRecorder:
+    """
+    Listener that keeps every event it receives, in order.
+
+    Attributes:
+        events (list of tuple):     The (event, data) pairs received.
+    """
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, data):
+        self.events.append((event, data))
+
+
+
+class ConsolePrinter:
+    """ Listener that prints the progress of the game to the terminal. """
+    def __call__(self, event, data):
+        handler = getattr(self, f'on_{event}', None)
+        if handler:
+            handler(**data)
+
+    def on_bidding_ended(self, player, trump_suit, numeric_bid):
+        if player is None:
+            print('Bidding ended.\nEveryone passed, the deal is passed out.')
+            return
+        print(f'Bidding ended.\nWinner: {player.name}  with '
+              f'{trump_suit} at {numeric_bid} bids.')
+
+    def on_partner_selected(self, player, card):
+        print(f'You have selected {card}. The owner of {card} will be your '
+              'partner!\n')
+
+    def on_card_played(self, player, card):
+        print(f'{player.name} plays {card}')
+
+    def on_set_won(self, player, cards):
+        pairs = [ f'{pair[0].name, pair[1]}' for pair in cards ]
+        print(f'\n{player.name} wins the set with {pairs}\n')
+
+    def on_score(self, scores):
+        for player, sets, threshold in scores:
+            print(f'{player.name}: {sets}/{threshold}', end='\t')
+        print('\n\n' + '-' * 10 + '\n')
+
+    def on_game_over(self, player, partner):
+        print(f'{player.name} and {partner.name} has won!')
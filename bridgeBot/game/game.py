@@ -1,6 +1,19 @@
 #   game/game.py
-from .core import Deck
+import time
+from . import auction, bits, events, rules
+from .position import Position
 from .setup import BaseGame
+from .state import shared
+from utils import metrics
+
+def starting_player_index(players, trump_suit, trump_bidder):
+    """
+    Determines the index of the player leading the first set.
+
+    If there is a trump suit, the first player will be the player right in front of the trump bidder (clockwise).
+    If there is no trump suit, the bid winner will be the first player.
+    """
+    return rules.opening_leader(players.index(trump_bidder), rules.trump_index(trump_suit), len(players))
 
 class RoundSet():
     """
@@ -18,8 +31,26 @@ class GamePhase(BaseGame):
     """
     Manages the gameplay phase of the Bridge game, handling the rounds, scoring, and determining the game winner based on the contract.
     
-    Inherits from BaseGame and initializes using data from BiddingPhase.
+    Inherits from BaseGame and takes over the GameState of the BiddingPhase, so starting the game copies nothing.
+
+    The game can be driven by the agents with `play_game`, or one card at a time with `play_card`, e.g. by a server
+    waiting on its players.
     """
+    __slots__ = ()
+
+    partnership = shared('partnership')
+    partner_card = shared('partner_card')
+    trump = shared('trump')
+    declarers = shared('declarers')
+    counter = shared('counter')
+    sets = shared('sets')
+    current_set = shared('current_set')
+    leader_index = shared('leader_index')
+    set_winner = shared('set_winner')
+    finished = shared('finished')
+    started_at = shared('started_at')
+    set_started_at = shared('set_started_at')
+
     def __init__(self, biddingPhaseObj):
         """
         Initializes the GamePhase with data from the bidding phase.
@@ -27,18 +58,45 @@ class GamePhase(BaseGame):
         Args:
             biddingPhaseObj (BiddingPhase): The BiddingPhase object containing relevant game state information.
         """
-        # Initialize the base game state using the player list from BiddingPhase
-        super().__init__([ player.name for player in biddingPhaseObj.players ])
-
-        # Use existing players from BiddingPhase to ensure continuity of state such as hand and order
-        self.players = biddingPhaseObj.players
-
-        # Set up game properties from the bidding phase results
-        self.trump_suit = biddingPhaseObj.trump_suit
-        self.trump_bidder = biddingPhaseObj.trump_bidder
-        self.partnership = biddingPhaseObj.partnership
-        self.sets = []                  # List to store the outcome of each set
-        self.set_winner = None     # To store the winner of the previous set
+        # Take over the state of the bidding phase, including the hands and order of the players
+        state = self.state = biddingPhaseObj.state
+        bid = state.auction.highest
+        bidder = state.players[state.auction.bidder]
+
+        state.trump = auction.bid_trump(bid)
+        state.sets = []                 # List to store the outcome of each set
+        state.set_winner = None         # To store the winner of the previous set
+
+        # Sets won by each side, settling the contract as soon as it is certain
+        state.declarers = { bidder, state.partnership[bidder] }
+        state.counter = rules.ContractCounter(auction.bid_level(bid))
+
+        # The set in progress, led by the player at `leader_index`
+        state.leader_index = rules.opening_leader(state.auction.bidder, state.trump, len(state.players))
+        state.current_set = []
+        state.finished = self.is_game_over()
+
+        # Wall clock starts of the game and of the set in progress, if timed
+        state.started_at = state.set_started_at = time.perf_counter() if metrics.enabled else None
+
+    @property
+    def trump_suit(self):
+        """ The name of the trump suit, e.g. 'Hearts' or 'No Trump'. """
+        return rules.TRUMP_NAMES[self.state.trump]
+
+    @property
+    def trump_bidder(self):
+        """ The player who won the bid. """
+        return self.state.players[self.state.auction.bidder]
+
+    @property
+    def to_act(self):
+        """ The player to play the next card, or None once the game is over. """
+        state = self.state
+        if state.finished:
+            return None
+        players = state.players
+        return players[(state.leader_index + len(state.current_set)) % len(players)]
 
     def play_game(self):
         """
@@ -47,44 +105,34 @@ class GamePhase(BaseGame):
         If there is a trump suit, the first player will be the player right in front of the trump bidder (clockwise).
         If there is no trump suit, the bid winner will be the first player.
         """
-        if self.trump_suit in Deck.SUITS:   # If there is a trump suit
-            starting_player_index = (self.players.index(self.trump_bidder) + 2) % len(self.players)  # Player right in front of the trump bidder
-        else:  # If there is no trump suit
-            starting_player_index = self.players.index(self.trump_bidder)  # The bid winner starts
-
         # Play sets until the game is over
-        current_leader_index = starting_player_index
+        while not self.finished:
+            self.play_round()
 
-        while not self.is_game_over():
-            self.play_round(current_leader_index)
-            current_leader_index = self.players.index(self.set_winner)  # Update leader to the winner of the last set
+    def play_round(self):
+        """ Conducts a round, with each player playing a card in turn starting from the leader. """
+        for _ in range(len(self.players)):
+            current_player = self.to_act
+            self.play_card(current_player, self.prompt_player_for_card(current_player, self.current_set))
 
-        print(f'{self.set_winner.name} and {self.partnership[self.set_winner].name} has won!')
-
-    def play_round(self, leader_index):
+    def legal_mask(self, player):
         """
-        Conducts a round, with each player playing a card in turn starting from the leader.
-
-        Args:
-            leader_index (int): Index of the player who leads the set.
+        Returns the mask of the cards the player may play to the current set: the cards of the leading suit if they
+        hold any, otherwise their whole hand.
         """
-        current_set = []
-        for offset in range(len(self.players)):
-            current_player = self.players[(leader_index + offset) % len(self.players)]
-            card_played = self.prompt_player_for_card(current_player, current_set)
-            current_set.append((current_player, card_played))
-            print(f'{current_player.name} plays {card_played}')
-
-        self.set_winner = self.resolve_set(current_set)
-        self.sets.append(current_set)
-        current_player.sets_won.append(current_set)
-        print(f'\n{self.set_winner.name} wins the set with {[ f'{pair[0].name, pair[1]}' for pair in current_set ]}\n')
-        #   Display card that won the set
+        current_set = self.state.current_set
+        if current_set:
+            return rules.legal_mask(player.mask, bits.card_suit(current_set[0][1].index))
+        return player.mask
 
+    def legal_cards(self, player):
+        """ Returns the sorted cards of `legal_mask`. """
+        cards = self.state.cards
+        return [ cards[index] for index in bits.iter_cards(self.legal_mask(player)) ]
 
     def prompt_player_for_card(self, player, current_set):
         """
-        Prompts the player to choose a card to play based on the rules of following suit. If the player cannot follow suit,
+        Asks the player's agent to choose a card to play based on the rules of following suit. If the player cannot follow suit,
         they may play a trump card, or any card if no trump or suit-matching cards are available.
 
         Args:
@@ -94,38 +142,56 @@ class GamePhase(BaseGame):
         Returns:
             Card: The card chosen by the player to play.
         """
-        if current_set:
-            leading_suit = current_set[0][1].suit
-        else:
-            leading_suit = None
-
-        # Mapping ranks to values for sorting purposes
-        rank_value = { str(num): num for num in range(2, 11) }
-        rank_value.update({
-            'Jack': 11,
-            'Queen': 12,
-            'King': 13,
-            'Ace': 14
-        })
-
-        # Determine the available cards to play based on the leading suit
-        suit_hand = [ card for card in player.hand if card.suit == leading_suit ] if leading_suit else player.hand
-
-        hand = sorted(suit_hand if suit_hand else player.hand, key=lambda card: (Deck.SUITS.index(card.suit), rank_value[card.rank]))
+        return player.agent.choose_card(self, player, self.legal_cards(player))
 
-        # Display the legal cards for player to choose from
-        print(f"\n{player.name}'s turn to play. Legal cards to play:")
-        for index, card in enumerate(hand, start=1):
-            print(f'{index}: {card}')
-
-        # Get player input for card selection
-        card_index = int(input('Enter the number of the card you choose to play: ')) - 1
-        chosen_card = hand[card_index]
-
-        # Remove the chosen card from player's hand
-        player.hand.remove(chosen_card)
+    def play_card(self, player, card):
+        """
+        Plays one card and advances the game, so it can be driven one action at a time. Completing a set resolves it
+        and checks whether the game is over.
 
-        return chosen_card
+        Raises:
+            ValueError: If it is not the turn of `player` or `card` may not be played.
+        """
+        if player is not self.to_act:
+            raise ValueError(f'It is not the turn of {player.name} to play.')
+        if not self.legal_mask(player) >> card.index & 1:
+            raise ValueError(f'{card} may not be played by {player.name}.')
+
+        state = self.state
+        player.remove_card(card)
+        current_set = state.current_set
+        current_set.append((player, card))
+        self.emit(events.CARD_PLAYED, player=player, card=card)
+        if len(current_set) < len(state.players):
+            return
+        if state.started_at is not None:
+            self._record_set_time()
+
+        state.current_set = []
+        winner = state.set_winner = self.resolve_set(current_set)
+        state.sets.append(current_set)
+        winner.sets_won.append(current_set)
+        state.counter.add(winner in state.declarers)
+        self.emit(events.SET_WON, player=winner, cards=current_set)
+
+        state.leader_index = state.players.index(winner)  # The winner of the set leads the next one
+        state.finished = self.is_game_over()
+        if state.finished:
+            if state.started_at is not None:
+                metrics.observe('game_seconds', time.perf_counter() - state.started_at)
+                metrics.observe('game_sets', len(state.sets))
+                metrics.inc('games_total', result=state.counter.result)
+            self.emit(events.GAME_OVER, player=winner, partner=state.partnership[winner])
+
+    def position(self):
+        """ Returns the Position of the game as it stands, to search from. """
+        return Position.from_game(self)
+
+    def _record_set_time(self):
+        """ Observes the wall time of the set just completed, from the end of the previous one. """
+        now = time.perf_counter()
+        metrics.observe('set_seconds', now - self.set_started_at)
+        self.set_started_at = now
 
     def resolve_set(self, current_set):
         """
@@ -137,41 +203,21 @@ class GamePhase(BaseGame):
         Returns:
             Player: The player who wins the set.
         """
-        highest_card = None
-        set_winner = None
-
-        #   Assess the highest card based on the trump and leading suits
-        for player, card in current_set:
-            if highest_card is None:
-                #   Initialize the highest card and winner with the first card and player
-                highest_card = card
-                set_winner = player
-            elif card.suit == self.trump_suit and (highest_card.suit != self.trump_suit or card.rank > highest_card.rank):
-                #   A trump card beats any non-trump card or a lower trump card
-                highest_card = card
-                set_winner = player
-            elif card.suit == highest_card.suit and card.rank > highest_card.rank and highest_card.suit != self.trump_suit:
-                # A higher card in the leading suit, when no higher trump card has been played
-                highest_card = card
-                set_winner = player
-
-        return set_winner
+        position = rules.set_winner([ card.index for _, card in current_set ], self.state.trump)
+        return current_set[position][0]
 
     def is_game_over(self):
         """
         Checks if the game is over, which occurs when one team achieves the contract or it becomes impossible for the other team to prevent this.
+        The sets of each side are counted incrementally by `counter`, so this is O(1) without listeners.
 
         Returns:
             bool: True if the game is over, otherwise False.
         """
-        for player in self.players:
-            print(f'{player.name}: {len(player.sets_won) + len(self.partnership[player].sets_won)}/{player.sets_threshold}', end='\t')
-        
-        print('\n\n' + '-' * 10 + '\n')
-
-        for player in self.players:
-            if len(player.sets_won) + len(self.partnership[player].sets_won) == player.sets_threshold:
-                return True
+        state = self.state
+        if state.listeners:
+            partnership = state.partnership
+            self.emit(events.SCORE, scores=[ (player, len(player.sets_won) + len(partnership[player].sets_won), player.sets_threshold)
+                                             for player in state.players ])
 
-        return all(len(player.hand) == 0 for player in self.players)
-        #   Terminate when the threshold set has been reached
\ No newline at end of file
+        return state.counter.result is not None
@@ -0,0 +1,195 @@
+#   game/position.py
+"""
+A compact position of the card play, for search.
+
+A Position holds the card play of a game on card indices and masks (see
+`game.bits`): the hands of the seats, the mask of the cards played, the cards
+of the set in progress, its leader and winner so far, and the sets won by
+each side. Bots and analysis tools branch on it with `make` and roll back
+with `unmake`, both O(1), rather than copying the players of a GamePhase;
+`snapshot` freezes a position into a tuple, cheap to hand to worker threads
+or processes.
+"""
+from . import auction, bits, rules
+
+#   Seats of a game.
+N_SEATS = 4
+
+#   Indices of the side counters: the defending side, then the declaring one,
+#   so `sets[declarers[seat]]` counts the side of a seat.
+DEFENDERS = 0
+DECLARERS = 1
+
+
+class Position:
+    """
+    The card play of a game, from any point to its end.
+
+    Attributes:
+        hands (list of int):        The card mask held by each seat.
+        trump (int):                The trump index (see `game.rules`).
+        declarers (tuple of bool):  Whether each seat is on the declaring side.
+        needs (tuple of int):       The sets the defending and the declaring
+                                    side need, as `rules.contract_targets`.
+        played (int):               The mask of the cards played.
+        trick (list of int):        The cards of the set in progress, in the
+                                    order they were played.
+        leader (int):               The seat leading the set in progress.
+        win_seat (int):             The seat winning the set in progress, or
+                                    the leader before its first card.
+        win_card (int):             The card winning the set in progress, or
+                                    None before its first card.
+        sets (list of int):         The sets won by the defending and the
+                                    declaring side.
+        history (list):             The undo records of the moves made.
+    """
+    __slots__ = ('hands', 'trump', 'declarers', 'needs', 'played', 'trick',
+                 'leader', 'win_seat', 'win_card', 'sets', 'history')
+
+    def __init__(self, hands, trump, leader, declarers, level):
+        """
+        Starts a position at the opening lead.
+
+        Arguments:
+            hands (list of int):        The card mask of each seat.
+            trump (int):                The trump index.
+            leader (int):               The seat leading the first set.
+            declarers (iterable):       Whether each seat declares.
+            level (int):                The level of the contract.
+        """
+        declarer_need, defender_need = rules.contract_targets(level)
+        self.hands = list(hands)
+        self.trump = trump
+        self.declarers = tuple( bool(declarer) for declarer in declarers )
+        self.needs = (defender_need, declarer_need)
+        self.played = 0
+        self.trick = []
+        self.leader = leader
+        self.win_seat = leader
+        self.win_card = None
+        self.sets = [0, 0]
+        self.history = []
+
+    @classmethod
+    def from_game(cls, game):
+        """ Returns the position of a GamePhase, as it stands. """
+        state = game.state
+        players = state.players
+        counter = state.counter
+        position = cls([ player.mask for player in players ], state.trump,
+                       state.leader_index,
+                       [ player in state.declarers for player in players ],
+                       auction.bid_level(state.auction.highest))
+        played = 0
+        for cards in state.sets:
+            for _, card in cards:
+                played |= 1 << card.index
+        position.played = played
+        position.sets = [counter.defender_sets, counter.declarer_sets]
+        for _, card in state.current_set:
+            position._add_to_trick(card.index)
+        return position
+
+    @property
+    def to_act(self):
+        """ The seat to play the next card. """
+        return (self.leader + len(self.trick)) % N_SEATS
+
+    @property
+    def result(self):
+        """ MADE, DEFEATED, or None while undecided, as ContractCounter. """
+        if self.sets[DECLARERS] >= self.needs[DECLARERS]:
+            return rules.MADE
+        if self.sets[DEFENDERS] >= self.needs[DEFENDERS]:
+            return rules.DEFEATED
+        return None
+
+    @property
+    def finished(self):
+        """ Whether the contract is settled. """
+        return self.result is not None
+
+    def legal_mask(self):
+        """ Returns the mask of the cards the seat to act may play. """
+        trick = self.trick
+        led = trick[0] // bits.N_RANKS if trick else None
+        return rules.legal_mask(self.hands[self.to_act], led)
+
+    def legal_moves(self):
+        """ Returns the cards the seat to act may play, in ascending order. """
+        return list(bits.iter_cards(self.legal_mask()))
+
+    def _add_to_trick(self, card):
+        """ Plays a card to the set in progress, without completing it. """
+        seat = (self.leader + len(self.trick)) % N_SEATS
+        self.hands[seat] &= ~(1 << card)
+        self.played |= 1 << card
+        if not self.trick or rules.beats(card, self.win_card, self.trump):
+            self.win_seat, self.win_card = seat, card
+        self.trick.append(card)
+
+    def make(self, card):
+        """
+        Plays a card of the seat to act, which must be legal, completing the
+        set after the fourth card: its winner's side counts it and leads the
+        next one.
+        """
+        trick = self.trick
+        seat = (self.leader + len(trick)) % N_SEATS
+        bit = 1 << card
+        self.hands[seat] ^= bit
+        self.played |= bit
+        win_seat, win_card = self.win_seat, self.win_card
+        if not trick or rules.beats(card, win_card, self.trump):
+            self.win_seat, self.win_card = seat, card
+        trick.append(card)
+        if len(trick) < N_SEATS:
+            self.history.append((seat, card, win_seat, win_card, None, None))
+            return
+        self.history.append((seat, card, win_seat, win_card, trick,
+                             self.leader))
+        self.sets[self.declarers[self.win_seat]] += 1
+        self.leader = self.win_seat
+        self.win_card = None
+        self.trick = []
+
+    def unmake(self):
+        """ Takes back the last card played. """
+        seat, card, win_seat, win_card, trick, leader = self.history.pop()
+        if trick is not None:
+            #   The winner of the completed set leads
+            self.sets[self.declarers[self.leader]] -= 1
+            self.trick = trick
+            self.leader = leader
+        self.trick.pop()
+        bit = 1 << card
+        self.hands[seat] |= bit
+        self.played ^= bit
+        self.win_seat, self.win_card = win_seat, win_card
+
+    def snapshot(self):
+        """
+        Returns the position as a tuple of immutable values, e.g. to hand to
+        a worker thread or process; see `from_snapshot`. The history is not
+        kept.
+        """
+        return (tuple(self.hands), self.trump, self.declarers, self.needs,
+                self.played, tuple(self.trick), self.leader, self.win_seat,
+                self.win_card, tuple(self.sets))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """ Returns a new Position from a `snapshot`. """
+        position = cls.__new__(cls)
+        (hands, position.trump, position.declarers, position.needs,
+         position.played, trick, position.leader, position.win_seat,
+         position.win_card, sets) = snapshot
+        position.hands = list(hands)
+        position.trick = list(trick)
+        position.sets = list(sets)
+        position.history = []
+        return position
+
+    def copy(self):
+        """ Returns an independent copy of the position, without history. """
+        return Position.from_snapshot(self.snapshot())
@@ -0,0 +1,303 @@
+#   game/record.py
+"""
+Compact binary records of whole games.
+
+A record holds the deal, the auction, the partner card and the cards played,
+packed as:
+
+    version             1 byte
+    deal                13 bytes, the seat of every card in 2 bits
+    number of bids      1 byte
+    bids                6 bits per bid id (see `game.auction`), padded to a byte
+    partner card        1 byte, a card index, or 0xff if none was selected
+    number of plays     1 byte
+    plays               6 bits per card index, padded to a byte
+
+so a complete game takes at most 86 bytes. Who made each bid and play is not
+stored: the rules decide it, and replaying the record through the phases
+checks it.
+
+A record file is a header followed by records, each prefixed by its length
+in one byte. `RecordReader` reads files through a memory map and hands out
+records as memoryview slices of it, so nothing is copied until a record is
+decoded.
+"""
+import mmap
+from . import bits, events
+from .auction import AuctionState, BIDS, BID_ID
+from .bidding import BiddingPhase
+from .dealer import FixedDealer
+from .game import GamePhase
+from .setup import SetupPhase
+
+VERSION = 1
+FILE_MAGIC = b'SGBREC1\n'
+NO_CARD = 0xff
+DEAL_BYTES = 13
+
+
+
+def _pack6(values):
+    """ Packs integers below 64 into 6 bits each. """
+    packed = 0
+    for i, value in enumerate(values):
+        packed |= value << (6 * i)
+    return packed.to_bytes((6 * len(values) + 7) // 8, 'little')
+
+
+def _unpack6(buffer, count):
+    """ Unpacks `count` 6-bit integers packed by `_pack6`. """
+    packed = int.from_bytes(buffer, 'little')
+    return [ packed >> (6 * i) & 63 for i in range(count) ]
+
+
+
+class GameRecord:
+    """
+    The decisions of one game.
+
+    Attributes:
+        hands (list of int):    The card mask dealt to each seat.
+        bids (list of str):     The bids, in order.
+        partner (int | None):   The index of the partner card, if selected.
+        plays (list of int):    The indices of the cards played, in order.
+    """
+    __slots__ = ('hands', 'bids', 'partner', 'plays')
+
+    def __init__(self, hands, bids=(), partner=None, plays=()):
+        self.hands = list(hands)
+        self.bids = list(bids)
+        self.partner = partner
+        self.plays = list(plays)
+
+    def encode(self):
+        """ Returns the record packed as bytes. """
+        seats = 0
+        for seat, hand in enumerate(self.hands):
+            for card in bits.iter_cards(hand):
+                seats |= seat << (2 * card)
+        return b''.join((
+            bytes((VERSION,)),
+            seats.to_bytes(DEAL_BYTES, 'little'),
+            bytes((len(self.bids),)),
+            _pack6([ BID_ID[bid] for bid in self.bids ]),
+            bytes((NO_CARD if self.partner is None else self.partner,
+                   len(self.plays))),
+            _pack6(self.plays),
+        ))
+
+    @classmethod
+    def decode(cls, buffer):
+        """
+        Unpacks a record from bytes, or from a memoryview without copying it.
+
+        Raises:
+            ValueError: If the record is of another version or malformed: the
+                        deal or a card index is invalid, a bid is illegal, or
+                        the partner card or plays follow an auction no bid
+                        won.
+        """
+        if not buffer or buffer[0] != VERSION:
+            raise ValueError(f'Not a version {VERSION} game record.')
+        seats = int.from_bytes(buffer[1:1 + DEAL_BYTES], 'little')
+        hands = [0, 0, 0, 0]
+        for card in range(bits.N_CARDS):
+            hands[seats >> (2 * card) & 3] |= 1 << card
+        offset = 1 + DEAL_BYTES
+        if len(buffer) < offset + 1:
+            raise ValueError('Malformed game record.')
+        n_bids = buffer[offset]
+        end = offset + 1 + (6 * n_bids + 7) // 8
+        if len(buffer) < end + 2:
+            raise ValueError('Malformed game record.')
+        bid_ids = _unpack6(buffer[offset + 1:end], n_bids)
+        partner, n_plays = buffer[end], buffer[end + 1]
+        plays = _unpack6(buffer[end + 2:end + 2 + (6 * n_plays + 7) // 8],
+                         n_plays)
+        if len(buffer) != end + 2 + (6 * n_plays + 7) // 8 or \
+                any(hand.bit_count() != bits.N_RANKS for hand in hands) or \
+                partner != NO_CARD and partner >= bits.N_CARDS or \
+                any(card >= bits.N_CARDS for card in plays):
+            raise ValueError('Malformed game record.')
+        auction = AuctionState(len(hands))
+        for i in bid_ids:
+            if auction.done or not auction.is_legal(i):
+                raise ValueError('Malformed game record.')
+            auction.apply(i)
+        if (partner != NO_CARD or plays) and \
+                (not auction.done or auction.bidder < 0) or \
+                partner == NO_CARD and plays:
+            raise ValueError('Malformed game record.')
+        bids = [ BIDS[i] for i in bid_ids ]
+        return cls(hands, bids, None if partner == NO_CARD else partner, plays)
+
+    def deal_order(self):
+        """
+        Returns a deck order dealing `hands`, for `FixedDealer`: deck position
+        `i` goes to seat `i % 4`, as with `Deck.deal`.
+        """
+        dealt = [ list(bits.iter_cards(hand)) for hand in self.hands ]
+        return [ card for cards in zip(*dealt) for card in cards ]
+
+
+
+class RecordCollector:
+    """
+    Listener building the GameRecord of the game it listens to.
+
+    Attributes:
+        record (GameRecord):    The record so far, None before the deal.
+    """
+    def __init__(self):
+        self.record = None
+
+    def __call__(self, event, data):
+        if event == events.DEAL:
+            self.record = GameRecord([ player.mask
+                                       for player in data['players'] ])
+        elif event == events.BID:
+            self.record.bids.append(data['bid'])
+        elif event == events.PARTNER_SELECTED:
+            self.record.partner = data['card'].index
+        elif event == events.CARD_PLAYED:
+            self.record.plays.append(data['card'].index)
+
+
+
+class RecordWriter:
+    """
+    Writes records to a binary file object, e.g. `open(path, 'wb')`.
+
+    Attributes:
+        file:           The file object written to.
+        count (int):    The number of records written.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+        file.write(FILE_MAGIC)
+
+    def write(self, record):
+        """ Appends a GameRecord, or an already encoded record. """
+        data = record if isinstance(record, bytes) else record.encode()
+        self.file.write(bytes((len(data),)))
+        self.file.write(data)
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+
+class RecordReader:
+    """
+    Iterates the records of a record file, or of any buffer holding one.
+
+    Iterating yields each record as a memoryview of the buffer; `records`
+    decodes them as it goes, so files of any size are read in constant
+    memory.
+
+    Attributes:
+        view (memoryview):  The records of the file, after its header.
+    """
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if view[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError('Not a game record file.')
+        self.view = view[len(FILE_MAGIC):]
+        self._base = view
+        self._mmap = None
+        self._file = None
+
+    @classmethod
+    def open(cls, path):
+        """ Memory-maps a record file. """
+        file = open(path, 'rb')
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            file.close()    #   Empty files cannot be mapped
+            raise ValueError(f'{path} is not a game record file.') from None
+        reader = cls(mapped)
+        reader._mmap, reader._file = mapped, file
+        return reader
+
+    def __iter__(self):
+        view = self.view
+        offset = 0
+        while offset < len(view):
+            length = view[offset]
+            yield view[offset + 1:offset + 1 + length]
+            offset += 1 + length
+
+    def records(self):
+        """ Yields every record, decoded as a GameRecord. """
+        for data in self:
+            yield GameRecord.decode(data)
+
+    def close(self):
+        """
+        Releases the view and the memory map, if any. Record views handed out
+        must be released first.
+        """
+        self.view.release()
+        self._base.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+def replay_record(record, player_names, agents=None, listeners=(),
+                  player_ids=None):
+    """
+    Rebuilds the state of a game by replaying a record through the phases.
+
+    Arguments:
+        record (GameRecord):        The record to replay.
+        player_names (list of str): The names of the players, in seat order.
+        agents (list of Agent):     The agents of the rebuilt players.
+        listeners (iterable):       The listeners of the rebuilt phases.
+        player_ids (list):          The ids of the players, if any.
+
+    Returns:
+        tuple: The (SetupPhase, BiddingPhase, GamePhase) of the game; the game
+        phase is None until the partner card was selected.
+
+    Raises:
+        ValueError: If the record breaks the rules.
+    """
+    setup = SetupPhase(player_names, agents, listeners,
+                       FixedDealer([record.deal_order()]), player_ids)
+    cards = setup.cards
+
+    def card(index):
+        if not 0 <= index < bits.N_CARDS:
+            raise ValueError(f'{index} is not a card index.')
+        return cards[index]
+
+    bidding = BiddingPhase(setup)
+    for bid in record.bids:
+        bidding.make_bid(bidding.to_act, bid)
+    if record.partner is None:
+        if record.plays:
+            raise ValueError('Cards are played before the partner card was '
+                             'selected.')
+        return setup, bidding, None
+    if not bidding.bidding_over:
+        raise ValueError('The partner card is selected before the auction '
+                         'is over.')
+    bidding.choose_partner(bidding.trump_bidder, card(record.partner))
+    game = GamePhase(bidding)
+    for index in record.plays:
+        game.play_card(game.to_act, card(index))
+    return setup, bidding, game
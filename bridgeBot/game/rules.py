@@ -0,0 +1,136 @@
+#   game/rules.py
+"""
+The rules of floating bridge on card indices (see `game.bits`), shared by
+the phases, the simulations and the bots.
+
+Trump options are indexed as suits, with NO_TRUMP (4) for No Trump.
+"""
+from . import bits
+
+NO_TRUMP = 4
+TRUMP_NAMES = bits.SUITS + ('No Trump',)
+TRUMP_INDEX = { name: i for i, name in enumerate(TRUMP_NAMES) }
+
+#   The minimum `Player.hand_value` of every hand of a valid deal.
+MIN_HAND_VALUE = 5
+
+#   Outcomes of a contract.
+MADE = 'made'
+DEFEATED = 'defeated'
+
+#   STRENGTH[trump][led][card] orders the cards played to a set: trumps beat
+#   cards of the led suit, which beat the other suits (-1), and cards of the
+#   same suit go by rank.
+STRENGTH = tuple(
+    tuple(
+        tuple( bits.N_RANKS + card % bits.N_RANKS if card // bits.N_RANKS == trump
+               else card % bits.N_RANKS if card // bits.N_RANKS == led
+               else -1
+               for card in range(bits.N_CARDS) )
+        for led in range(bits.N_SUITS)
+    )
+    for trump in range(NO_TRUMP + 1)
+)
+
+
+def trump_index(trump_suit):
+    """ Returns the trump index of a trump suit name, e.g. 'No Trump' -> 4. """
+    return TRUMP_INDEX[trump_suit]
+
+
+def legal_mask(hand, led_suit):
+    """
+    Returns the cards of `hand` that may be played to a set: the cards of the
+    led suit if any are held, otherwise the whole hand.
+
+    Arguments:
+        hand (int):             The card mask of the player.
+        led_suit (int | None):  The suit index led, or None when leading.
+    """
+    return bits.follow_mask(hand, led_suit)
+
+
+def beats(card, win_card, trump):
+    """
+    Returns True if `card` beats `win_card`, the card winning a set so far.
+
+    Arguments:
+        card (int):     The card index played.
+        win_card (int): The card index winning the set.
+        trump (int):    The trump index.
+    """
+    strength = STRENGTH[trump][win_card // bits.N_RANKS]
+    return strength[card] > strength[win_card]
+
+
+def set_winner(cards, trump):
+    """
+    Returns the position in `cards`, the card indices of a set in the order
+    they were played, of the card winning the set.
+    """
+    strength = STRENGTH[trump][cards[0] // bits.N_RANKS]
+    best = 0
+    for position in range(1, len(cards)):
+        if strength[cards[position]] > strength[cards[best]]:
+            best = position
+    return best
+
+
+def opening_leader(bidder, trump, n_players=4):
+    """
+    Returns the seat leading the first set: with a trump suit, the player
+    across from the bid winner; with No Trump, the bid winner.
+    """
+    if trump == NO_TRUMP:
+        return bidder
+    return (bidder + 2) % n_players
+
+
+def contract_targets(level):
+    """
+    Returns the number of sets the declaring side and the defending side
+    need to win for a bid at `level`. They always add up to 14, so exactly
+    one side gets there.
+    """
+    return level + 6, 8 - level
+
+
+
+class ContractCounter:
+    """
+    Counts the sets of each side and settles the contract as soon as either
+    side reaches its target, which is when the outcome becomes certain.
+
+    Attributes:
+        declarer_need (int):    The sets the declaring side needs.
+        defender_need (int):    The sets the defending side needs.
+        declarer_sets (int):    The sets won by the declaring side.
+        defender_sets (int):    The sets won by the defending side.
+        result (str | None):    MADE, DEFEATED, or None while undecided.
+    """
+    __slots__ = ('declarer_need', 'defender_need', 'declarer_sets',
+                 'defender_sets', 'result')
+
+    def __init__(self, level):
+        self.declarer_need, self.defender_need = contract_targets(level)
+        self.declarer_sets = 0
+        self.defender_sets = 0
+        self.result = None
+
+    def add(self, declarer_won):
+        """
+        Counts a set won by the declaring side if `declarer_won`, otherwise by
+        the defending side.
+
+        Returns:
+            str | None: The result, once decided.
+        """
+        if declarer_won:
+            self.declarer_sets += 1
+            if self.declarer_sets >= self.declarer_need:
+                self.result = MADE
+        else:
+            self.defender_sets += 1
+            if self.defender_sets >= self.defender_need:
+                self.result = DEFEATED
+        return self.result
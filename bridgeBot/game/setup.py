@@ -1,45 +1,147 @@
 #   game/setup.py
 from models import CardModel
+from utils import metrics
+from . import dealindex, events
+from .agents import ConsoleAgent
 from .core import Deck, Player
+from .dealer import DealGenerator
+from .state import GameState, shared
 
 class BaseGame:
     """
     Represents the base class for a Bridge game instance, managing the deck and
     players.
 
+    Decisions are delegated to the `agent` of each player and progress is
+    reported to `listeners` as events (see `game.events`), so a game can be
+    played at the terminal or headless.
+
+    A phase holds nothing but the GameState of its game (see `game.state`),
+    which it hands over to the next phase.
+
     Attributes:
-        deck (Deck):                The deck of cards used in the game.
+        state (GameState):          The state of the game.
+        cards (tuple of Card):      The canonical deck, by card index.
         players (list of Player):   The list of players in the game.
+        listeners (list):           The callables receiving game events.
     """
-    def __init__(self, player_names):
-        cards = CardModel.get_all_cards()
-        self.deck = Deck(cards)
-        self.players = [ Player(name, i + 1)
-                        for i, name in enumerate(player_names) ]
+    __slots__ = ('state',)
+
+    cards = shared('cards')
+    players = shared('players')
+    listeners = shared('listeners')
+
+    def __init__(self, player_names, agents=None, listeners=(),
+                 player_ids=None):
+        if player_ids is None:
+            player_ids = player_names
+        players = [ Player(player_id, i + 1)
+                    for i, player_id in enumerate(player_ids) ]
+        for player, name in zip(players, player_names):
+            player.name = name
+        if agents is None:
+            agents = [ ConsoleAgent() for _ in players ]
+        for player, agent in zip(players, agents):
+            player.agent = agent
+        self.state = GameState(CardModel.get_canonical_deck(), players,
+                               list(listeners))
+
+    @property
+    def deck(self):
+        """ A Deck of the cards in dealing order, built on demand. """
+        order = self.state.order
+        cards = self.state.cards
+        return Deck(list(cards) if order is None else
+                    [ cards[index] for index in order ])
+
+    def emit(self, event, **data):
+        """ Reports an event to every listener. """
+        for listener in self.state.listeners:
+            listener(event, data)
 
 
 
 class SetupPhase(BaseGame):
     """
     Manages the setup phase of the game, ensuring each player has a valid hand.
+
+    Constants:
+        DEALER (DealGenerator):     The process-wide generator of valid deals.
+
+    Attributes:
+        dealer (DealGenerator):     The generator of valid deals used, by
+                                    default `DEALER`.
+        redeals (int):              The number of invalid deals discarded
+                                    before the deal in play.
+        order (list of int):        The deck order of the deal in play.
     """
-    def __init__(self, player_names):
-        super().__init__(player_names)
-        self.setup()
+    __slots__ = ('dealer',)
 
-    def setup(self):
+    DEALER = DealGenerator()
+
+    redeals = shared('redeals')
+    order = shared('order')
+
+    def __init__(self, player_names, agents=None, listeners=(), dealer=None,
+                 player_ids=None, deal_number=None, seed=None):
+        super().__init__(player_names, agents, listeners, player_ids)
+        self.dealer = dealer if dealer is not None else self.DEALER
+        if deal_number is None and seed is not None:
+            deal_number = dealindex.seeded_deal_number(seed)
+        self.setup(deal_number)
+
+    @property
+    def deal_number(self):
+        """ The deal number of the deal in play (see `game.dealindex`). """
+        state = self.state
+        if state.deal_number is None:
+            state.deal_number = dealindex.rank_order(state.order)
+        return state.deal_number
+
+    def setup(self, deal_number=None):
         """
-        Sets up the game by shuffling and dealing the cards until each player
-        has a minimum hand value.
+        Sets up the game by dealing a deal in which each player has a minimum
+        hand value of 5, drawn from the batched `dealer`.
+
+        Arguments:
+            deal_number (int):  The deal number of a deal to deal instead, as
+                                is; see `game.dealindex`.
         """
-        self.shuffle_and_deal()
-        for player in self.players:
-            while player.hand_value() < 5:
-                self.shuffle_and_deal()
+        state = self.state
+        if deal_number is None:
+            order = next(self.dealer).tolist()
+            state.redeals = self.dealer.redeals
+        else:
+            order = dealindex.deal_order(deal_number)
+            state.redeals = 0
+        state.deal_number = deal_number
+        if metrics.enabled:
+            metrics.inc('deals_total')
+            metrics.inc('redeals_total', state.redeals)
+            metrics.observe('redeals_per_deal', state.redeals)
+        self.deal(order)
+        self.emit(events.DEAL, players=state.players, order=order,
+                  redeals=state.redeals)
 
     def shuffle_and_deal(self):
         """Shuffles the deck and deals the cards to all players."""
-        self.deck.shuffle()
-        hands = self.deck.deal()
-        for player, hand in zip(self.players, hands):
-            player.receive_hand(hand)
+        deck = self.deck
+        deck.shuffle()
+        self.state.deal_number = None
+        self.deal([ card.index for card in deck.cards ])
+
+    def deal(self, order=None):
+        """
+        Deals the cards of the deck to all players, in the deck order `order`,
+        by default the order of the deal in play; deck position `i` goes to
+        seat `i % 4`.
+        """
+        state = self.state
+        if order is None:
+            order = state.order
+        state.order = order
+        cards = state.cards
+        n_hands = len(state.players)
+        for seat, player in enumerate(state.players):
+            player.receive_hand([ cards[index]
+                                  for index in order[seat::n_hands] ])
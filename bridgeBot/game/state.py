@@ -0,0 +1,79 @@
+#   game/state.py
+"""
+The state of one game, shared by its phases.
+
+A game is one GameState: `SetupPhase` creates it, and `BiddingPhase` and
+`GamePhase` take it over from the previous phase as it is, so moving to the
+next phase copies nothing. The phases only hold a reference to the state and
+read and write its fields through the properties made by `shared`.
+"""
+from operator import attrgetter
+
+class GameState:
+    """
+    Everything one game needs, from the deal to the last set.
+
+    Attributes:
+        cards (tuple of Card):      The process-wide canonical deck, where the
+                                    card at position `i` has card index `i`.
+        players (list of Player):   The players, in seat order.
+        listeners (list):           The callables receiving game events.
+        order (list of int):        The deck order of the deal.
+        redeals (int):              The invalid deals discarded before it.
+        deal_number (int):          The deal number of the deal (see
+                                    `game.dealindex`), or None until needed.
+        auction (AuctionState):     The auction, once the bidding started.
+        partnership (dict):         A dictionary mapping (Player: Player) each
+                                    player to their partner.
+        partner_card (Card):        The card announced by the bid winner.
+        trump (int):                The trump index of the contract (see
+                                    `game.rules`).
+        declarers (set of Player):  The bid winner and their partner.
+        counter (ContractCounter):  The sets won by each side.
+        sets (list of list):        The completed sets, as (Player, Card).
+        current_set (list):         The set in progress, as (Player, Card).
+        leader_index (int):         The seat leading the set in progress.
+        set_winner (Player):        The winner of the last completed set.
+        finished (bool):            Whether the game is over.
+        started_at (float):         The wall clock start of the game, if
+                                    timed.
+        set_started_at (float):     The wall clock start of the set in
+                                    progress, if timed.
+    """
+    __slots__ = ('cards', 'players', 'listeners', 'order', 'redeals',
+                 'deal_number', 'auction', 'partnership', 'partner_card',
+                 'trump', 'declarers', 'counter', 'sets', 'current_set',
+                 'leader_index', 'set_winner', 'finished', 'started_at',
+                 'set_started_at')
+
+    def __init__(self, cards, players, listeners):
+        self.cards = cards
+        self.players = players
+        self.listeners = listeners
+        self.order = None
+        self.redeals = 0
+        self.deal_number = None
+        self.auction = None
+        self.partnership = {}
+        self.partner_card = None
+        self.trump = None
+        self.declarers = None
+        self.counter = None
+        self.sets = []
+        self.current_set = []
+        self.leader_index = 0
+        self.set_winner = None
+        self.finished = False
+        self.started_at = None
+        self.set_started_at = None
+
+
+def shared(name):
+    """
+    Returns a property reading and writing the field `name` of the `state`
+    of a phase, so phases keep their attributes without copying them.
+    """
+    def set(phase, value):
+        setattr(phase.state, name, value)
+    return property(attrgetter(f'state.{name}'), set,
+                    doc=f'The {name} of the game state.')
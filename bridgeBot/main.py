@@ -1,12 +1,11 @@
 #   main.py
-from game import SetupPhase, BiddingPhase, GamePhase
+from game import SetupPhase, BiddingPhase, GamePhase, ConsolePrinter
 
 def main():
     player_names = ['Alice', 'Bob', 'Charlie', 'Diana']
     
     #   Initialize the Setup Phase and deal cards
-    setup_game = SetupPhase(player_names)
-    setup_game.shuffle_and_deal()
+    setup_game = SetupPhase(player_names, listeners=[ConsolePrinter()])
 
     #   Initialize the Bidding Phase using the setup phase results
     bidding_game = BiddingPhase(setup_game)
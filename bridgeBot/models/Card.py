@@ -1,24 +1,50 @@
 #   models/Card.py
 from bson.objectid import ObjectId
-from utils import get_collection
-from game import Card, Deck
+from pymongo import ASCENDING, UpdateOne
+from utils import get_collection, metrics
+from game import Card, Deck, bits
 
 class CardModelMeta(type):
     """
-    Metaclass to handle database initialization and collection setup.
+    Metaclass to handle lazy database initialization and collection setup.
+
+    The collection is only retrieved, indexed and seeded on first access, so
+    defining or importing `CardModel` never touches the network.
 
     Attribute:
         collection (Collection):    The retrieved MongoDB collection.
     """
     def __init__(cls, name, bases, dct):
         super().__init__(name, bases, dct)
-        cls.collection = get_collection('cards')
-        if cls.collection.count_documents({}) == 0:
+        cls._collection = None
+
+    @property
+    def collection(cls):
+        if cls._collection is None:
+            collection = get_collection('cards')
+            with metrics.timer('mongo_seconds', collection='cards',
+                               op='create_index'):
+                collection.create_index([ ('suit', ASCENDING),
+                                          ('rank', ASCENDING) ],
+                                        name=cls.SUIT_RANK_INDEX, unique=True)
+            cls._collection = collection
             cls.initialize_deck()
+        return cls._collection
 
 
 
 class CardModel(metaclass=CardModelMeta):
+    """
+    Provides access to the card documents of the collection.
+
+    The 52 cards never change, so they are loaded once per process into a
+    shared canonical deck (see `get_canonical_deck`) that games build their
+    decks from without further database calls.
+    """
+    SUIT_RANK_INDEX = 'suit_rank'
+
+    _canonical_deck = None
+
     def __init__(self):
         pass
 
@@ -35,18 +61,27 @@ class CardModel(metaclass=CardModelMeta):
             'suit': suit,
             'rank': rank
         }
-        cls.collection.insert_one(card)
+        with metrics.timer('mongo_seconds', collection='cards',
+                           op='insert_one'):
+            cls.collection.insert_one(card)
 
     @classmethod
     def initialize_deck(cls):
         """
-        Initializes the deck with 52 cards if the collection is empty.
+        Seeds the collection with the 52 cards in a single bulk upsert.
 
-        This method is called during initialization if the collection is empty.
+        Cards already present are left untouched, so this is safe to call on
+        every start-up; it is called when the collection is first accessed.
         """
-        for suit in Deck.SUITS:
-            for rank in Deck.RANKS:
-                cls.create_card(suit, rank)
+        requests = [
+            UpdateOne({'suit': suit, 'rank': rank},
+                      {'$setOnInsert': {'suit': suit, 'rank': rank}},
+                      upsert=True)
+            for suit in Deck.SUITS for rank in Deck.RANKS
+        ]
+        with metrics.timer('mongo_seconds', collection='cards',
+                           op='bulk_write'):
+            cls.collection.bulk_write(requests, ordered=False)
 
     @classmethod
     def get_all_cards(cls):
@@ -56,7 +91,8 @@ class CardModel(metaclass=CardModelMeta):
         Returns:
             A list of Card objects of each card document.
         """
-        cards = cls.collection.find({})
+        with metrics.timer('mongo_seconds', collection='cards', op='find'):
+            cards = list(cls.collection.find({}))
         return [ Card(card['_id'], card['suit'], card['rank'])
                 for card in cards ]
 
@@ -71,9 +107,11 @@ class CardModel(metaclass=CardModelMeta):
         Returns:
             The Card object or None if not found.
         """
-        card = cls.collection.find_one({'_id': ObjectId(card_id)})
+        with metrics.timer('mongo_seconds', collection='cards',
+                           op='find_one'):
+            card = cls.collection.find_one({'_id': ObjectId(card_id)})
         if card:
-            return Card(card['suit'], card['rank'], card['_id'])
+            return Card(card['_id'], card['suit'], card['rank'])
         return None
 
     @classmethod
@@ -88,7 +126,47 @@ class CardModel(metaclass=CardModelMeta):
         Returns:
             The Card object or None if not found.
         """
-        card = cls.collection.find_one({'suit': suit, 'rank': rank})
+        #   Served by the unique (suit, rank) index.
+        with metrics.timer('mongo_seconds', collection='cards',
+                           op='find_one'):
+            card = cls.collection.find_one({'suit': suit, 'rank': rank})
         if card:
-            return Card(card['suit'], card['rank'], card['_id'])
+            return Card(card['_id'], card['suit'], card['rank'])
         return None
+
+    @classmethod
+    def get_canonical_deck(cls):
+        """
+        Retrieves the process-wide canonical deck, loading it from the
+        collection on first use.
+
+        Returns:
+            A tuple of the 52 Card objects, where the card at position `i` has
+            card index `i`.
+        """
+        if cls._canonical_deck is None:
+            cards = Deck.sort_deck(cls.get_all_cards())
+            if [ card.index for card in cards ] != list(range(bits.N_CARDS)):
+                raise ValueError('The cards collection does not hold exactly '
+                                 'one of each of the 52 cards.')
+            cls._canonical_deck = tuple(cards)
+        return cls._canonical_deck
+
+    @classmethod
+    def invalidate_canonical_deck(cls):
+        """
+        Drops the cached canonical deck so the next `get_canonical_deck` call
+        reloads it from the collection.
+        """
+        cls._canonical_deck = None
+
+    @classmethod
+    def refresh_canonical_deck(cls):
+        """
+        Reloads the canonical deck from the collection.
+
+        Returns:
+            The reloaded tuple of 52 Card objects.
+        """
+        cls.invalidate_canonical_deck()
+        return cls.get_canonical_deck()
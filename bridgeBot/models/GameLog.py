@@ -0,0 +1,233 @@
+#   models/GameLog.py
+import atexit
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+from utils import Config, get_collection, metrics
+from utils.buffer import WriteBehindBuffer
+from game import events
+from game.dealer import FixedDealer
+from .Card import CardModel
+
+#   MongoDB error code of a duplicate key.
+DUPLICATE_KEY = 11000
+
+
+class GameLogModelMeta(type):
+    """
+    Metaclass to handle lazy collection setup, as `CardModelMeta`.
+
+    Attribute:
+        collection (Collection):    The retrieved MongoDB collection.
+    """
+    def __init__(cls, name, bases, dct):
+        super().__init__(name, bases, dct)
+        cls._collection = None
+        cls._buffer = None
+
+    @property
+    def collection(cls):
+        if cls._collection is None:
+            collection = get_collection('game_events')
+            collection.create_index([ ('game_id', ASCENDING),
+                                      ('seq', ASCENDING) ],
+                                    name=cls.GAME_SEQ_INDEX, unique=True)
+            #   The game summaries, claimed and read by `models.Report`
+            collection.create_index(
+                [ ('type', ASCENDING), ('reported', ASCENDING) ],
+                name=cls.GAME_OVER_INDEX,
+                partialFilterExpression={ 'type': events.GAME_OVER })
+            cls._collection = collection
+        return cls._collection
+
+
+
+class GameLogModel(metaclass=GameLogModelMeta):
+    """
+    Provides access to the append-only log of game events.
+
+    A game is logged as one document per decision, numbered by `seq` from 0:
+    the deal, then every bid, the partner card and every card played. The
+    other events follow from these, so any game can be rebuilt by replaying
+    its documents in order (see `replay`).
+
+    Documents are written through the process-wide write-behind buffer of
+    `buffer`, which flushes with `insert_many`.
+    """
+    GAME_SEQ_INDEX = 'game_seq'
+    GAME_OVER_INDEX = 'game_over_reported'
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def buffer(cls):
+        """
+        Returns the process-wide buffer of event documents, started on first
+        use and flushed at exit.
+        """
+        if cls._buffer is None:
+            cls._buffer = WriteBehindBuffer(cls.insert_events,
+                                            Config.EVENT_FLUSH_SIZE,
+                                            Config.EVENT_FLUSH_SECONDS).start()
+            atexit.register(cls._buffer.close)
+        return cls._buffer
+
+    @classmethod
+    def insert_events(cls, documents):
+        """
+        Inserts a batch of event documents with a single unordered
+        `insert_many`. Documents already stored, e.g. by a retried batch, are
+        skipped thanks to the unique (game_id, seq) index.
+        """
+        try:
+            with metrics.timer('mongo_seconds', collection='game_events',
+                               op='insert_many'):
+                cls.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as error:
+            if any(e['code'] != DUPLICATE_KEY
+                   for e in error.details['writeErrors']):
+                raise
+
+    @classmethod
+    def get_events(cls, game_id):
+        """ Retrieves the event documents of a game, in order. """
+        #   Served by the unique (game_id, seq) index.
+        with metrics.timer('mongo_seconds', collection='game_events',
+                           op='find'):
+            return list(cls.collection.find({'game_id': game_id},
+                                            {'_id': False})
+                        .sort('seq', ASCENDING))
+
+    @classmethod
+    def rebuild(cls, game_id, agents=None, listeners=()):
+        """ Rebuilds the phases of a logged game, as `replay`. """
+        documents = cls.get_events(game_id)
+        if not documents:
+            raise ValueError(f'No events are logged for game {game_id}.')
+        return replay(documents, agents, listeners)
+
+
+
+class GameLogger:
+    """
+    Listener appending the decisions of one game to an event log.
+
+    Once the game is over, a 'game_over' document summarizes it for the
+    reports of `models.Report`: the contract, the declaring seats, the sets
+    won by every seat, the winning seats, the players and the redeals.
+
+    Attributes:
+        game_id (str):              The id of the game in the log.
+        buffer (WriteBehindBuffer): Receives the documents, by default
+                                    `GameLogModel.buffer()`.
+        seq (int):                  The sequence number of the next document.
+        logged (int):               The documents already in the log, e.g. of
+                                    a replayed game, which are followed but
+                                    not written again.
+    """
+    def __init__(self, game_id, buffer=None, seq=0, logged=0):
+        self.game_id = game_id
+        self.buffer = buffer if buffer is not None else GameLogModel.buffer()
+        self.seq = seq
+        self.logged = logged
+        self._summary = None
+        self._order = None
+
+    def __call__(self, event, data):
+        if event == events.DEAL:
+            document = {
+                'type': event,
+                'order': data['order'],
+                'redeals': data['redeals'],
+                'players': [ { 'name': player.name,
+                               'telegram_id': player.telegram_id }
+                             for player in data['players'] ],
+            }
+            self._order = data['order']
+            self._summary = {
+                'players': [ player.telegram_id for player in data['players'] ],
+                'redeals': data['redeals'],
+                'sets': [0] * len(data['players']),
+            }
+        elif event == events.BID:
+            document = { 'type': event, 'bid': data['bid'] }
+        elif event in (events.PARTNER_SELECTED, events.CARD_PLAYED):
+            document = { 'type': event, 'card': data['card'].index }
+            if event == events.PARTNER_SELECTED:
+                #   The owner of the partner card, from the deal order
+                self._summary['partner'] = \
+                    self._order.index(data['card'].index) % \
+                    len(self._summary['players'])
+        elif event == events.BIDDING_ENDED:
+            if data['player'] is not None:
+                self._summary.update(level=data['numeric_bid'],
+                                     trump=data['trump_suit'],
+                                     declarer=data['player'].order - 1)
+            return
+        elif event == events.SET_WON:
+            self._summary['sets'][data['player'].order - 1] += 1
+            return
+        elif event == events.GAME_OVER:
+            document = self.game_over(data)
+        else:
+            return
+        if 'player' in data:
+            document['seat'] = data['player'].order - 1
+        document['game_id'] = self.game_id
+        document['seq'] = self.seq
+        self.seq += 1
+        if document['seq'] >= self.logged:
+            self.buffer.add(document)
+
+    def game_over(self, data):
+        """ Returns the 'game_over' document summarizing the game. """
+        summary = self._summary
+        winners = sorted((data['player'].order - 1, data['partner'].order - 1))
+        sets = summary['sets']
+        return dict(summary, type=events.GAME_OVER, winners=winners,
+                    made=summary['declarer'] in winners,
+                    declarer_sets=sets[summary['declarer']] +
+                    sets[summary['partner']])
+
+
+
+def replay(documents, agents=None, listeners=()):
+    """
+    Rebuilds the state of a game from its event documents by replaying its
+    decisions through the phases.
+
+    Arguments:
+        documents (list of dict):   The event documents of the game, in order.
+        agents (list of Agent):     The agents of the rebuilt players.
+        listeners (iterable):       The listeners of the rebuilt phases. They
+                                    receive the replayed events.
+
+    Returns:
+        tuple: The (SetupPhase, BiddingPhase, GamePhase) of the game; the game
+        phase is None until the partner card was selected.
+    """
+    #   Imported here, as `game` imports `models` while it is initialized
+    from game import SetupPhase, BiddingPhase, GamePhase
+
+    deal = documents[0]
+    if deal['type'] != events.DEAL:
+        raise ValueError('The events of a game must start with its deal.')
+    deck = CardModel.get_canonical_deck()
+    setup = SetupPhase([ player['name'] for player in deal['players'] ],
+                       agents, listeners,
+                       FixedDealer([deal['order']], deal.get('redeals', 0)),
+                       [ player['telegram_id'] for player in deal['players'] ])
+    bidding = BiddingPhase(setup)
+    game = None
+    for document in documents[1:]:
+        player = setup.players[document['seat']]
+        if document['type'] == events.BID:
+            bidding.make_bid(player, document['bid'])
+        elif document['type'] == events.PARTNER_SELECTED:
+            bidding.choose_partner(player, deck[document['card']])
+            game = GamePhase(bidding)
+        elif document['type'] == events.CARD_PLAYED:
+            game.play_card(player, deck[document['card']])
+        elif document['type'] != events.GAME_OVER:
+            raise ValueError(f"Unknown event {document['type']!r}.")
+    return setup, bidding, game
@@ -1 +1,307 @@
 #   models/Player.py
+import atexit
+import threading
+from collections import OrderedDict
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from utils import Config, get_collection, metrics
+from utils.buffer import WriteBehindBuffer
+from game import rules
+
+#   The rating of a new player, and the most it moves in one game.
+INITIAL_RATING = 1500
+K_FACTOR = 24
+
+#   The counters of a profile, added up across games.
+COUNTERS = ('games', 'wins', 'declared', 'made', 'defended', 'defeated',
+            'sets', 'points')
+
+
+class PlayerModelMeta(type):
+    """
+    Metaclass to handle lazy collection setup, as `CardModelMeta`.
+
+    Attribute:
+        collection (Collection):    The retrieved MongoDB collection.
+    """
+    def __init__(cls, name, bases, dct):
+        super().__init__(name, bases, dct)
+        cls._collection = None
+        cls._buffer = None
+        cls._cache = OrderedDict()
+        cls._pending = {}
+        cls._writing = set()
+        cls._lock = threading.Lock()
+
+    @property
+    def collection(cls):
+        if cls._collection is None:
+            cls._collection = get_collection('players')
+        return cls._collection
+
+
+
+class PlayerModel(metaclass=PlayerModelMeta):
+    """
+    Provides the profiles of the players across games: their rating and
+    their record of games and contracts.
+
+    A profile document has the telegram id of the player as _id, their
+    latest name and the COUNTERS:
+
+        games       The games played.
+        wins        The games won.
+        declared    The games played on the declaring side.
+        made        The contracts made among them.
+        defended    The games played on the defending side.
+        defeated    The contracts defeated among them.
+        sets        The sets won.
+        points      The rating won and lost, from INITIAL_RATING.
+
+    Profiles are served from a process-wide LRU cache of up to
+    `Config.PLAYER_CACHE_SIZE` players, and the players missing from it are
+    read with one query, so a table looks its four players up with one round
+    trip at most (see `get_players`). The result of a game updates the cached
+    profiles at once, and is merged per player into pending increments which
+    the write-behind buffer of `buffer` flushes as one unordered `bulk_write`
+    of `$inc` upserts. Profiles with increments not written yet stay cached,
+    so a profile is never read back without them. Increments commute, so processes sharing the
+    collection never overwrite each other's results.
+
+    Profiles returned are dicts with the telegram_id, name, rating and
+    COUNTERS of the player, owned by the cache: they must not be modified.
+
+    Attributes:
+        hits (int):         The number of profiles served from the cache.
+        misses (int):       The number of profiles read from the collection.
+        queries (int):      The number of queries reading profiles.
+    """
+    hits = 0
+    misses = 0
+    queries = 0
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def buffer(cls):
+        """
+        Returns the process-wide buffer of updated players, started on first
+        use and flushed at exit.
+        """
+        with cls._lock:
+            #   Games finish in worker threads too
+            if cls._buffer is None:
+                cls._buffer = WriteBehindBuffer(
+                    cls.write_updates, Config.PLAYER_FLUSH_SIZE,
+                    Config.PLAYER_FLUSH_SECONDS).start()
+                atexit.register(cls._buffer.close)
+        return cls._buffer
+
+    @staticmethod
+    def new_profile(telegram_id, name=None):
+        """ Returns the profile of a player who never played. """
+        profile = dict.fromkeys(COUNTERS, 0)
+        profile.update(telegram_id=telegram_id, name=name,
+                       rating=INITIAL_RATING)
+        return profile
+
+    @staticmethod
+    def _apply(profile, increments, name=None):
+        for field, value in increments.items():
+            profile[field] += value
+        profile['rating'] = INITIAL_RATING + profile['points']
+        if name is not None:
+            profile['name'] = name
+
+    @classmethod
+    def get_players(cls, telegram_ids):
+        """
+        Returns the profiles of players, with a single query for those not
+        cached. Players never seen get a new profile, which is not stored
+        until they finish a game.
+
+        Arguments:
+            telegram_ids (list):    The telegram ids of the players.
+
+        Returns:
+            list of dict: The profile of every player, in order.
+        """
+        with cls._lock:
+            missing = [ telegram_id for telegram_id in dict.fromkeys(
+                            telegram_ids) if telegram_id not in cls._cache ]
+        if missing:
+            with metrics.timer('mongo_seconds', collection='players',
+                               op='find'):
+                documents = { document['_id']: document for document in
+                              cls.collection.find({ '_id': {
+                                  '$in': missing } }) }
+            with cls._lock:
+                cls.queries += 1
+                cls.misses += len(missing)
+                for telegram_id in missing:
+                    if telegram_id in cls._cache:
+                        continue    #   Loaded by another thread meanwhile
+                    document = documents.get(telegram_id, {})
+                    profile = cls.new_profile(telegram_id,
+                                              document.get('name'))
+                    cls._apply(profile, { field: document.get(field, 0)
+                                          for field in COUNTERS })
+                    cls._cache[telegram_id] = profile
+        with cls._lock:
+            profiles = []
+            for telegram_id in telegram_ids:
+                profile = cls._cache[telegram_id]
+                cls._cache.move_to_end(telegram_id)
+                profiles.append(profile)
+            cls.hits += len(telegram_ids) - len(missing)
+            cls._evict(Config.PLAYER_CACHE_SIZE)
+        return profiles
+
+    @classmethod
+    def _evict(cls, size):
+        """
+        Drops the least recently used profiles beyond `size`, but keeps those
+        with increments not written yet, which their documents lack.
+        """
+        excess = len(cls._cache) - size
+        if excess <= 0:
+            return
+        for telegram_id in list(cls._cache):
+            if telegram_id not in cls._pending and \
+                    telegram_id not in cls._writing:
+                del cls._cache[telegram_id]
+                excess -= 1
+                if not excess:
+                    break
+
+    @classmethod
+    def get_player(cls, telegram_id):
+        """ Returns the profile of one player, as `get_players`. """
+        return cls.get_players([telegram_id])[0]
+
+    @classmethod
+    def record_game(cls, game, rated=None):
+        """
+        Counts a finished game into the profiles of its players, and queues
+        the increments to write. Only the players missing from the cache,
+        if any, are read.
+
+        The two sides are rated as teams, by the mean rating of their
+        players, with the Elo expected score.
+
+        Arguments:
+            game (GamePhase):   The finished game.
+            rated:              An optional callable telling whether the
+                                player of a telegram id has a profile, e.g. to
+                                leave bots out. Unrated players count as
+                                INITIAL_RATING.
+        """
+        state = game.state
+        players = state.players
+        ids = [ player.telegram_id if rated is None or
+                rated(player.telegram_id) else None for player in players ]
+        known = [ telegram_id for telegram_id in ids if telegram_id is not None ]
+        profiles = dict(zip(known, cls.get_players(known)))
+        made = state.counter.result == rules.MADE
+        declaring = [ player in state.declarers for player in players ]
+        ratings = [ INITIAL_RATING if telegram_id is None
+                    else profiles[telegram_id]['rating'] for telegram_id in ids ]
+        defenders, declarers = ( [ rating for rating, declarer in
+                                   zip(ratings, declaring) if declarer == side ]
+                                 for side in (False, True) )
+        expected = 1 / (1 + 10 ** ((sum(defenders) / len(defenders) -
+                                    sum(declarers) / len(declarers)) / 400))
+        change = round(K_FACTOR * (made - expected))
+
+        updates = {}
+        for player, telegram_id, declarer in zip(players, ids, declaring):
+            if telegram_id is None:
+                continue
+            won = declarer == made
+            updates[telegram_id] = (player.name, {
+                'games': 1,
+                'wins': int(won),
+                'declared': int(declarer),
+                'made': int(declarer and made),
+                'defended': int(not declarer),
+                'defeated': int(not declarer and not made),
+                'sets': len(player.sets_won),
+                'points': change if declarer else -change,
+            })
+        with cls._lock:
+            for telegram_id, (name, increments) in updates.items():
+                profile = cls._cache.setdefault(telegram_id,
+                                                profiles[telegram_id])
+                cls._apply(profile, increments, name)
+                cls._merge(telegram_id, name, increments)
+        buffer = cls.buffer()
+        for telegram_id in updates:
+            buffer.add(telegram_id)
+
+    @classmethod
+    def _merge(cls, telegram_id, name, increments):
+        """ Adds increments to the pending ones of a player. """
+        pending = cls._pending.get(telegram_id)
+        if pending is None:
+            cls._pending[telegram_id] = (name, dict(increments))
+            return
+        merged = pending[1]
+        for field, value in increments.items():
+            merged[field] = merged.get(field, 0) + value
+        cls._pending[telegram_id] = (name or pending[0], merged)
+
+    @classmethod
+    def write_updates(cls, telegram_ids):
+        """
+        Writes the pending increments of players with one unordered
+        `bulk_write` of upserts. The increments of the failed upserts are
+        merged back into the pending ones, to be written by the next flush:
+        those reported in the `writeErrors` of a BulkWriteError only, as the
+        others were applied, or all of them if the write failed otherwise.
+        """
+        with cls._lock:
+            updates = { telegram_id: cls._pending.pop(telegram_id)
+                        for telegram_id in dict.fromkeys(telegram_ids)
+                        if telegram_id in cls._pending }
+            cls._writing.update(updates)
+        if not updates:
+            return
+        requests = [ UpdateOne({ '_id': telegram_id },
+                               { '$inc': increments,
+                                 **({ '$set': { 'name': name } }
+                                    if name is not None else {}) },
+                               upsert=True)
+                     for telegram_id, (name, increments) in updates.items() ]
+        try:
+            with metrics.timer('mongo_seconds', collection='players',
+                               op='bulk_write'):
+                cls.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as error:
+            failed = { e['index'] for e in error.details['writeErrors'] }
+            with cls._lock:
+                for index, (telegram_id, (name, increments)) in \
+                        enumerate(updates.items()):
+                    if index in failed:
+                        cls._merge(telegram_id, name, increments)
+            raise
+        except Exception:
+            with cls._lock:
+                for telegram_id, (name, increments) in updates.items():
+                    cls._merge(telegram_id, name, increments)
+            raise
+        finally:
+            with cls._lock:
+                cls._writing.difference_update(updates)
+
+    @classmethod
+    def flush(cls):
+        """ Writes the pending increments now. """
+        if cls._buffer is not None:
+            cls._buffer.flush()
+
+    @classmethod
+    def clear_cache(cls):
+        """ Empties the cache, but for the profiles not written yet. """
+        with cls._lock:
+            cls._evict(0)
@@ -0,0 +1,264 @@
+#   models/Report.py
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from utils import get_collection, metrics
+from game import events
+from .GameLog import GameLogModel, DUPLICATE_KEY
+
+#   The `reported` value of the game summaries counted.
+REPORTED = True
+
+
+class ReportModelMeta(type):
+    """
+    Metaclass to handle lazy collection setup, as `CardModelMeta`.
+
+    Attribute:
+        collection (Collection):    The retrieved MongoDB collection.
+    """
+    def __init__(cls, name, bases, dct):
+        super().__init__(name, bases, dct)
+        cls._collection = None
+
+    @property
+    def collection(cls):
+        if cls._collection is None:
+            cls._collection = get_collection('game_reports')
+        return cls._collection
+
+
+
+class ReportModel(metaclass=ReportModelMeta):
+    """
+    Provides statistics over every logged game, from materialized summary
+    documents kept up to date by `update`.
+
+    The statistics are computed from the 'game_over' documents of the event
+    log (see `GameLogger`) by aggregation pipelines grouping them in MongoDB,
+    so no game is loaded into Python. Each pipeline returns one row per group
+    (contract, player, ...), read as a batched cursor and merged into the
+    summaries with `$inc` upserts.
+
+    Every update counts the 'game_over' documents not reported yet, whatever
+    their _id and whenever they were written, in batches: a batch is claimed
+    by setting the `reported` field of its documents to a new batch id, then
+    counted, then marked REPORTED. A document is claimed by one batch only,
+    and the increments of a batch are applied to a summary only if its recent
+    `batches` lack the batch id, so a batch left claimed by an interrupted
+    update is counted once by the next one. Claims are served by a partial
+    index of the event log.
+
+    Summary documents have a string _id and a 'kind':
+
+        contract    level, trump, games, made
+        player      player (telegram id), games, wins
+        redeals     games, redeals
+        tricks      declarer_sets, games
+    """
+    BATCH_SIZE = 1000
+
+    #   The batch ids kept by every summary, to skip a batch counted twice.
+    RECENT_BATCHES = 64
+
+    #   Every pipeline starts with the match of the new games, then groups
+    #   them into (_id, fields to add) rows.
+    PIPELINES = {
+        'contract': [
+            { '$group': { '_id': { 'level': '$level', 'trump': '$trump' },
+                          'games': { '$sum': 1 },
+                          'made': { '$sum': { '$cond': ['$made', 1, 0] } } } },
+        ],
+        'player': [
+            { '$project': { 'players': 1, 'winners': 1 } },
+            { '$unwind': { 'path': '$players', 'includeArrayIndex': 'seat' } },
+            { '$group': { '_id': '$players',
+                          'games': { '$sum': 1 },
+                          'wins': { '$sum': { '$cond': [
+                              { '$in': ['$seat', '$winners'] }, 1, 0] } } } },
+        ],
+        'redeals': [
+            { '$group': { '_id': None,
+                          'games': { '$sum': 1 },
+                          'redeals': { '$sum': '$redeals' } } },
+        ],
+        'tricks': [
+            { '$group': { '_id': '$declarer_sets', 'games': { '$sum': 1 } } },
+        ],
+    }
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def _summary_key(kind, group):
+        """ Returns the _id and identifying fields of a summary document. """
+        if kind == 'contract':
+            return f"contract:{group['level']}:{group['trump']}", group
+        if kind == 'player':
+            return f'player:{group}', { 'player': group }
+        if kind == 'tricks':
+            return f'tricks:{group}', { 'declarer_sets': group }
+        return kind, {}
+
+    @classmethod
+    def update(cls):
+        """
+        Counts the games finished since the last update into the summaries,
+        first finishing any batch an interrupted update left claimed.
+
+        Returns:
+            int: The number of games counted.
+        """
+        events_collection = GameLogModel.collection
+        games = 0
+        for batch in events_collection.distinct(
+                'reported', { 'type': events.GAME_OVER,
+                              'reported': { '$type': 'string' } }):
+            games += cls._count(events_collection, batch)
+        while True:
+            batch = cls._claim(events_collection)
+            if batch is None:
+                return games
+            games += cls._count(events_collection, batch)
+
+    @classmethod
+    def _claim(cls, events_collection):
+        """
+        Claims up to BATCH_SIZE unreported games for a new batch. Returns the
+        batch id, or None if every game is reported.
+        """
+        unreported = { 'type': events.GAME_OVER,
+                       'reported': { '$exists': False } }
+        ids = [ document['_id'] for document in events_collection.find(
+                    unreported, { '_id': True }).limit(cls.BATCH_SIZE) ]
+        if not ids:
+            return None
+        batch = str(ObjectId())
+        with metrics.timer('mongo_seconds', collection='game_events',
+                           op='update_many'):
+            #   Documents claimed meanwhile by another update are skipped
+            events_collection.update_many(
+                dict(unreported, _id={ '$in': ids }),
+                { '$set': { 'reported': batch } })
+        return batch
+
+    @classmethod
+    def _count(cls, events_collection, batch):
+        """ Counts the games of a claimed batch, and marks them reported. """
+        match = { 'type': events.GAME_OVER, 'reported': batch }
+        games = 0
+        with metrics.timer('mongo_seconds', collection='game_events',
+                           op='aggregate'):
+            for kind, pipeline in cls.PIPELINES.items():
+                cursor = events_collection.aggregate(
+                    [ { '$match': match } ] + pipeline,
+                    batchSize=cls.BATCH_SIZE)
+                requests = []
+                for row in cursor:
+                    if kind == 'redeals':
+                        games = row['games']
+                    requests.append(cls._increment(kind, row, batch))
+                    if len(requests) >= cls.BATCH_SIZE:
+                        cls._write(requests)
+                        requests = []
+                cls._write(requests)
+        events_collection.update_many(match,
+                                      { '$set': { 'reported': REPORTED } })
+        return games
+
+    @classmethod
+    def _increment(cls, kind, row, batch):
+        key, fields = cls._summary_key(kind, row.pop('_id'))
+        #   A summary that already counted the batch does not match, and its
+        #   upsert fails on the duplicate _id
+        return UpdateOne({ '_id': key, 'batches': { '$ne': batch } },
+                         { '$inc': row,
+                           '$push': { 'batches': {
+                               '$each': [batch],
+                               '$slice': -cls.RECENT_BATCHES } },
+                           '$setOnInsert': dict(fields, kind=kind) },
+                         upsert=True)
+
+    @classmethod
+    def _write(cls, requests):
+        if requests:
+            try:
+                with metrics.timer('mongo_seconds',
+                                   collection='game_reports',
+                                   op='bulk_write'):
+                    cls.collection.bulk_write(requests, ordered=False)
+            except BulkWriteError as error:
+                if any(e['code'] != DUPLICATE_KEY
+                       for e in error.details['writeErrors']):
+                    raise
+
+    @classmethod
+    def rebuild(cls):
+        """ Drops the summaries and counts every logged game again. """
+        cls.collection.delete_many({})
+        GameLogModel.collection.update_many(
+            { 'type': events.GAME_OVER, 'reported': { '$exists': True } },
+            { '$unset': { 'reported': '' } })
+        return cls.update()
+
+    @classmethod
+    def _summaries(cls, kind):
+        return cls.collection.find({ 'kind': kind }, { '_id': False,
+                                                       'kind': False,
+                                                       'batches': False })
+
+    @classmethod
+    def contract_success(cls):
+        """
+        Returns the success rate of contracts by level and trump suit.
+
+        Returns:
+            list of dict: The level, trump, games, made and rate of every
+            contract played, by level then trump.
+        """
+        rows = [ dict(row, rate=row['made'] / row['games'])
+                 for row in cls._summaries('contract') ]
+        return sorted(rows, key=lambda row: (row['level'], row['trump']))
+
+    @classmethod
+    def player_win_rates(cls):
+        """
+        Returns the win rate of every player.
+
+        Returns:
+            dict: A dictionary mapping telegram id to its games, wins and rate.
+        """
+        return { row['player']: { 'games': row['games'], 'wins': row['wins'],
+                                  'rate': row['wins'] / row['games'] }
+                 for row in cls._summaries('player') }
+
+    @classmethod
+    def average_redeals(cls):
+        """ Returns the average number of redeals per game, or None. """
+        row = cls.collection.find_one({ '_id': 'redeals' })
+        return row['redeals'] / row['games'] if row else None
+
+    @classmethod
+    def trick_distribution(cls):
+        """
+        Returns the distribution of the sets won by the declaring side.
+
+        Returns:
+            dict: A dictionary mapping a number of sets to its share of games.
+        """
+        rows = list(cls._summaries('tricks'))
+        total = sum( row['games'] for row in rows )
+        return { row['declarer_sets']: row['games'] / total
+                 for row in sorted(rows, key=lambda row: row['declarer_sets']) }
+
+    @classmethod
+    def report(cls):
+        """ Returns every statistic, as a JSON-serializable dict. """
+        return {
+            'contracts': cls.contract_success(),
+            'players': { str(player): rates for player, rates
+                         in cls.player_win_rates().items() },
+            'average_redeals': cls.average_redeals(),
+            'tricks': cls.trick_distribution(),
+        }
@@ -1,6 +1,12 @@
 #   models/__init__.py
 from .Card import CardModel
+from .GameLog import GameLogModel, GameLogger, replay
+from .Player import PlayerModel
+from .Report import ReportModel
 
 __all__ = [
-    'CardModel'
+    'CardModel',
+    'GameLogModel', 'GameLogger', 'replay',
+    'PlayerModel',
+    'ReportModel'
 ]
@@ -0,0 +1,14 @@
+#   server/__init__.py
+from .table import Table, Message
+from .render import Renderer
+from .outbound import OutboundQueue, TokenBucket
+from .server import GameServer
+from .fake import FakeTelegram, run_load
+from .cluster import Cluster, HashRing, run_cluster_load
+
+__all__ = [
+    'Table', 'Message',
+    'Renderer', 'OutboundQueue', 'TokenBucket', 'GameServer',
+    'FakeTelegram', 'run_load',
+    'Cluster', 'HashRing', 'run_cluster_load'
+]
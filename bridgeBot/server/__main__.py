@@ -0,0 +1,5 @@
+#   server/__main__.py
+from server.fake import main
+
+if __name__ == '__main__':
+    main()
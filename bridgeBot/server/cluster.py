@@ -0,0 +1,716 @@
+#   server/cluster.py
+"""
+Hosting of tables across worker processes, one GameServer each, behind a
+front process routing every update to the worker of its chat.
+
+Chats are placed on workers by consistent hashing of their id (see
+`HashRing`), and an open table stays on its worker, game state included,
+until it closes: the front remembers the worker of every chat with updates
+in flight or an open table. Workers can be added and removed while tables
+play. Tables either drain, finishing where they are while new tables go to
+the other workers, or migrate: the worker exports them as the journal of
+their game (see `Table.snapshot`) and the new worker replays it, while the
+front holds the updates of the moving chats.
+
+Workers do not talk to the Bot API themselves: they forward their calls to
+the front in batches, and the front makes them, translating the message ids
+of the prompt panels (see `server.render`), through one OutboundQueue for
+the whole cluster with `rate_limits`. The calls to a chat are made in order,
+each once the previous one was made, so a chat waiting on its rate limit
+holds up neither the other chats nor the reports of the workers. The front
+tells the workers which calls were made, so the idle timer of a player
+restarts while their prompt is still waiting, as in a single GameServer.
+"""
+import asyncio
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import threading
+import time
+from game import RandomAgent
+from .outbound import OutboundQueue
+from .render import lost
+from .server import GameServer
+
+#   The points of every worker on the ring.
+REPLICAS = 64
+
+
+def _point(key):
+    """ Returns the position of a key on the ring, the same in any process. """
+    return int.from_bytes(hashlib.blake2b(str(key).encode(),
+                                          digest_size=8).digest(), 'big')
+
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes: every node owns the arcs before
+    its REPLICAS points, so adding or removing a node only moves the keys of
+    the arcs it gains or loses, about 1/n of them.
+
+    Attributes:
+        nodes (set):    The nodes on the ring.
+    """
+    def __init__(self, nodes=(), replicas=REPLICAS):
+        self.replicas = replicas
+        self.nodes = set()
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        """ Places a node on the ring. """
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = _point(f'{node}#{replica}')
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        """ Takes a node off the ring. """
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [ (point, owner) for point, owner
+                 in zip(self._points, self._owners) if owner != node ]
+        self._points = [ point for point, _ in kept ]
+        self._owners = [ owner for _, owner in kept ]
+
+    def node_for(self, key):
+        """
+        Returns the node owning a key.
+
+        Raises:
+            LookupError: If the ring is empty.
+        """
+        if not self._points:
+            raise LookupError('The ring has no nodes.')
+        index = bisect.bisect(self._points, _point(key))
+        return self._owners[index % len(self._owners)]
+
+
+
+class ForwardingBot:
+    """
+    The outbound Bot API of a worker: queues its calls and forwards them to
+    the front once per event loop iteration, in one batch.
+
+    Message ids are not known in the worker, so the id returned by
+    `send_message` is a placeholder; the front keeps the real id of the
+    panel of every chat.
+
+    Attributes:
+        unsent (dict):  A dictionary mapping chat id to the number of its
+                        calls the front did not report made yet.
+    """
+    def __init__(self, name, queue):
+        self.name = name
+        self.queue = queue
+        self.unsent = {}
+        self._pending = []
+        self._ids = itertools.count(1)
+
+    def post(self, entry):
+        """ Queues an entry for the front. """
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self._pending.append(entry)
+
+    def flush(self):
+        """ Forwards the queued entries. """
+        if self._pending:
+            self.queue.put((self.name, self._pending))
+            self._pending = []
+
+    def call(self, entry):
+        """ Queues a Bot API call for the front, counting it until made. """
+        chat_id = entry[1]
+        self.unsent[chat_id] = self.unsent.get(chat_id, 0) + 1
+        self.post(entry)
+
+    def made(self, counts):
+        """ Counts the calls made by the front, given per chat id. """
+        for chat_id, count in counts.items():
+            left = self.unsent.get(chat_id, 0) - count
+            if left > 0:
+                self.unsent[chat_id] = left
+            else:
+                self.unsent.pop(chat_id, None)
+
+    def queued(self, chat_id):
+        """ Returns True if calls to a chat are still to be made. """
+        return chat_id in self.unsent
+
+    async def send_message(self, chat_id, text, keyboard=None):
+        self.call(('send', chat_id, text, keyboard))
+        return next(self._ids)
+
+    async def edit_message_text(self, chat_id, message_id, text,
+                                keyboard=None):
+        self.call(('edit_text', chat_id, text, keyboard))
+
+    async def edit_message_reply_markup(self, chat_id, message_id,
+                                        keyboard=None):
+        self.call(('edit_markup', chat_id, keyboard))
+
+
+
+def run_worker(name, inbox, outbox, options):
+    """
+    The main function of a worker process: hosts tables with a GameServer
+    built with `options`, serving the commands of the front from `inbox`
+    until told to stop.
+    """
+    asyncio.run(_serve(name, inbox, outbox, options))
+
+
+async def _serve(name, inbox, outbox, options):
+    loop = asyncio.get_running_loop()
+    bot = ForwardingBot(name, outbox)
+    commands = asyncio.Queue()
+    #   The updates taken up per chat since the front was last told, so the
+    #   front forgets the worker of a chat only with no update in flight
+    received = {}
+
+    def release(chat_id, finished=None):
+        bot.post(('released', chat_id, received.pop(chat_id, 0), finished))
+
+    def on_close(table):
+        release(table.chat_id, table.game is not None and table.game.finished)
+
+    if options.pop('log_events', False):
+        from models import GameLogModel
+        options['event_log'] = GameLogModel.buffer()
+    server = GameServer(bot, on_close=on_close, journal=True, **options)
+
+    def read():
+        while True:
+            command = inbox.get()
+            loop.call_soon_threadsafe(commands.put_nowait, command)
+            if command[0] == 'stop':
+                return
+    threading.Thread(target=read, daemon=True).start()
+
+    async def handle(token, update):
+        chat_id = update['chat_id']
+        received[chat_id] = received.get(chat_id, 0) + 1
+        try:
+            await server.handle_update(update)
+        finally:
+            bot.post(('handled', token))
+        if chat_id not in server.tables:
+            release(chat_id)
+
+    async def export(chat_ids):
+        snapshots = []
+        for chat_id in chat_ids:
+            snapshot = await server.export_table(chat_id)
+            snapshots.append((chat_id, received.pop(chat_id, 0), snapshot))
+        bot.post(('exported', snapshots))
+
+    bot.post(('ready',))
+    while True:
+        command = await commands.get()
+        kind = command[0]
+        if kind == 'updates':
+            for token, update in command[1]:
+                server._spawn(handle, token, update)
+        elif kind == 'export':
+            #   Queued behind the updates received before it
+            server._spawn(export, command[1])
+        elif kind == 'import':
+            for snapshot in command[1]:
+                await server.import_table(snapshot)
+        elif kind == 'made':
+            bot.made(command[1])
+        elif kind == 'stop':
+            break
+    await server.shutdown()
+    bot.post(('stopped', { 'updates': server.updates,
+                           'rejected': server.errors,
+                           'tables': len(server.tables) }))
+    bot.flush()
+
+
+
+class Worker:
+    """
+    The front's handle of a worker process.
+
+    Attributes:
+        name (str):         The name of the worker, its key on the ring.
+        process (Process):  The worker process.
+        inbox (Queue):      The commands to the worker.
+        draining (bool):    Whether the worker stops once its tables close.
+        updates (int):      The number of updates routed to it.
+        stats (dict):       The counts reported by the worker once stopped.
+    """
+    def __init__(self, name, process, inbox):
+        self.name = name
+        self.process = process
+        self.inbox = inbox
+        self.draining = False
+        self.updates = 0
+        self.stats = None
+        self.ready = None
+        self.stopped = None
+        self._updates = []
+        self._made = {}
+
+    def send(self, command):
+        """ Sends a command, after the updates routed before it. """
+        self.flush()
+        self.inbox.put(command)
+
+    def route(self, token, update):
+        """
+        Queues an update, sent with the others of this loop iteration. The
+        worker reports `token` once it handled it.
+        """
+        if not self._updates:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self._updates.append((token, update))
+        self.updates += 1
+
+    def made(self, chat_id, count):
+        """ Queues the report of `count` calls to a chat made by the front. """
+        if not self._updates and not self._made:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self._made[chat_id] = self._made.get(chat_id, 0) + count
+
+    def flush(self):
+        if self._updates:
+            self.inbox.put(('updates', self._updates))
+            self._updates = []
+        if self._made:
+            self.inbox.put(('made', self._made))
+            self._made = {}
+
+
+
+class Cluster:
+    """
+    The front process of a cluster of workers, each hosting tables with a
+    GameServer in its own process so games use every core. It serves the
+    update interface of GameServer, `handle_update`, so it can stand in for
+    one, e.g. behind FakeTelegram.
+
+    Attributes:
+        bot:                    The outbound Bot API, called by the front
+                                only (see `Renderer`).
+        outbound (OutboundQueue):   Paces the calls to `bot` within the rate
+                                limits, or None to call it directly.
+        ring (HashRing):        Places new chats on the workers accepting
+                                tables.
+        workers (dict):         A dictionary mapping name to Worker.
+        routes (dict):          A dictionary mapping chat id to the name of
+                                its worker, for chats with an open table or
+                                updates in flight.
+        in_flight (dict):       A dictionary mapping chat id to the number
+                                of its updates its worker did not report on.
+        held (dict):            A dictionary mapping the chat id of a moving
+                                table to the (token, update) pairs held until
+                                it moved.
+        panels (dict):          A dictionary mapping (worker name, chat id)
+                                to the future (message id, text) of the
+                                panel of the chat, once its last call was
+                                made.
+        options (dict):         The GameServer arguments of the workers, all
+                                picklable: 'idle_timeout', 'join_timeout',
+                                'max_timeouts', 'agent_factory',
+                                'bot_factory', and 'log_events' to log events
+                                through `GameLogModel.buffer()`.
+        on_close:               An optional callable receiving the chat id of
+                                every closed table and whether its game was
+                                finished.
+        updates (int):          The number of updates routed.
+        migrated (int):         The number of tables moved between workers.
+        failed (int):           The number of failed Bot API calls.
+    """
+    def __init__(self, bot, on_close=None, context='spawn', rate_limits=None,
+                 **options):
+        self.bot = bot
+        self.outbound = None
+        if rate_limits is not None:
+            self.outbound = OutboundQueue(bot, **rate_limits)
+            self.outbound.on_idle = self._idle
+        self._api = bot if self.outbound is None else self.outbound
+        self.ring = HashRing()
+        self.workers = {}
+        self.routes = {}
+        self.in_flight = {}
+        self.held = {}
+        self.panels = {}
+        self.options = dict(options, agent_factory=options.get(
+            'agent_factory', RandomAgent))
+        self.on_close = on_close
+        self.updates = 0
+        self.migrated = 0
+        self.failed = 0
+        self._context = multiprocessing.get_context(context)
+        self._outbox = self._context.Queue()
+        self._received = None
+        self._consumer = None
+        self._names = itertools.count(1)
+        self._exports = {}
+        self._tokens = itertools.count()
+        self._handled = {}
+        #   The calls to a chat of a worker not reported made yet
+        self._unsent = {}
+
+    async def start(self, n_workers=1):
+        """ Starts the front and `n_workers` workers. """
+        loop = asyncio.get_running_loop()
+        self._received = asyncio.Queue()
+
+        def read():
+            while True:
+                item = self._outbox.get()
+                loop.call_soon_threadsafe(self._received.put_nowait, item)
+                if item is None:
+                    return
+        threading.Thread(target=read, daemon=True).start()
+        self._consumer = asyncio.ensure_future(self._consume())
+        await asyncio.gather(*( self.add_worker() for _ in range(n_workers) ))
+        return self
+
+    async def add_worker(self, name=None, rebalance=False):
+        """
+        Starts a worker and places it on the ring, once it is ready.
+
+        Arguments:
+            name (str):         The name of the worker, by default numbered.
+            rebalance (bool):   Whether to move the open tables now owned by
+                                the new worker to it, rather than only the
+                                new tables.
+
+        Returns:
+            Worker: The new worker.
+        """
+        name = name or f'worker-{next(self._names)}'
+        if name in self.workers:
+            raise ValueError(f'Worker {name} already exists.')
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=run_worker, args=(name, inbox, self._outbox,
+                                     dict(self.options)),
+            name=name, daemon=True)
+        worker = Worker(name, process, inbox)
+        loop = asyncio.get_running_loop()
+        worker.ready = loop.create_future()
+        worker.stopped = loop.create_future()
+        self.workers[name] = worker
+        process.start()
+        await worker.ready
+        self.ring.add(name)
+        if rebalance:
+            self.migrate([ chat_id for chat_id, owner in self.routes.items()
+                           if owner != name
+                           and self.ring.node_for(chat_id) == name ])
+        return worker
+
+    async def remove_worker(self, name, migrate=True):
+        """
+        Takes a worker off the ring and stops it, once its tables moved to
+        the other workers or, without `migrate`, once they all closed. Waits
+        for the workers being added to be ready first.
+
+        Returns:
+            dict: The counts reported by the worker.
+        """
+        worker = self.workers[name]
+        #   A worker being added may be the one to take over
+        await asyncio.gather(*( other.ready for other in self.workers.values()
+                                if other is not worker ))
+        self.ring.remove(name)
+        if not self.ring.nodes:
+            self.ring.add(name)
+            raise ValueError('The last worker cannot be removed.')
+        worker.draining = True
+        if migrate:
+            self.migrate([ chat_id for chat_id, owner in self.routes.items()
+                           if owner == name ])
+        self._stop_drained(worker)
+        return await worker.stopped
+
+    def migrate(self, chat_ids):
+        """
+        Moves the tables of chats to the workers owning them on the ring.
+        Updates arriving meanwhile are held, then follow the table.
+        """
+        by_worker = {}
+        for chat_id in chat_ids:
+            if chat_id in self.held:
+                continue
+            self.held[chat_id] = []
+            by_worker.setdefault(self.routes[chat_id], []).append(chat_id)
+        for name, chats in by_worker.items():
+            self._exports[name] = self._exports.get(name, 0) + 1
+            self.workers[name].send(('export', chats))
+
+    async def handle_update(self, update):
+        """
+        Routes an update to the worker of its chat, and returns once the
+        worker handled it, as `GameServer.handle_update` does.
+        """
+        self.updates += 1
+        chat_id = update['chat_id']
+        token = next(self._tokens)
+        handled = self._handled[token] = \
+            asyncio.get_running_loop().create_future()
+        held = self.held.get(chat_id)
+        if held is not None:
+            held.append((token, update))
+        else:
+            self._route(chat_id, token, update)
+        await handled
+
+    def _route(self, chat_id, token, update):
+        name = self.routes.get(chat_id)
+        if name is None:
+            if not self.ring.nodes:
+                #   Shutting down: no worker takes new chats
+                self._handled.pop(token).set_result(None)
+                return
+            name = self.routes[chat_id] = self.ring.node_for(chat_id)
+        self.in_flight[chat_id] = self.in_flight.get(chat_id, 0) + 1
+        self.workers[name].route(token, update)
+
+    def _settle(self, chat_id, count):
+        """ Counts the updates a worker reported on, forgetting idle routes. """
+        left = self.in_flight.get(chat_id, 0) - count
+        if left > 0:
+            self.in_flight[chat_id] = left
+            return
+        self.in_flight.pop(chat_id, None)
+        name = self.routes.pop(chat_id, None)
+        if name in self.workers and chat_id not in self.held:
+            self._stop_drained(self.workers[name])
+
+    def _stop_drained(self, worker):
+        """ Stops a draining worker without tables or pending exports. """
+        if worker.draining and not self._exports.get(worker.name) and \
+                not any( owner == worker.name
+                         for owner in self.routes.values() ):
+            worker.draining = False
+            worker.send(('stop',))
+
+    async def _consume(self):
+        """ Makes the Bot API calls and handles the reports of the workers. """
+        while True:
+            item = await self._received.get()
+            if item is None:
+                return
+            name, entries = item
+            for entry in entries:
+                try:
+                    self._apply(name, entry)
+                except Exception:
+                    self.failed += 1
+
+    def _apply(self, name, entry):
+        kind = entry[0]
+        if kind in ('send', 'edit_text', 'edit_markup'):
+            #   Not awaited: a call waiting on the rate limit of its chat
+            #   must not hold up the other chats
+            key = name, entry[1]
+            self._unsent[key] = self._unsent.get(key, 0) + 1
+            call = self.panels[key] = asyncio.ensure_future(
+                self._call(self.panels.get(key), entry))
+            call.add_done_callback(lambda _: self._made(key))
+        elif kind == 'handled':
+            self._handled.pop(entry[1]).set_result(None)
+        elif kind == 'released':
+            _, chat_id, count, finished = entry
+            self._settle(chat_id, count)
+            if finished is not None and self.on_close:
+                self.on_close(chat_id, finished)
+        elif kind == 'exported':
+            self._imported(name, entry[1])
+        elif kind == 'ready':
+            self.workers[name].ready.set_result(None)
+        elif kind == 'stopped':
+            self._stopped(name, entry[1])
+
+    async def _call(self, panel, entry):
+        """
+        Makes a Bot API call to a chat, after the previous one, `panel`. The
+        edit of a panel which could not be sent sends it anew.
+
+        Returns:
+            tuple: The message id of the panel of the chat, or its handle from
+            the OutboundQueue, None if it could not be sent, and its text.
+        """
+        message_id, text = (None, None) if panel is None else await panel
+        kind, chat_id = entry[:2]
+        keyboard = entry[-1]
+        try:
+            if kind == 'send' and keyboard is None:
+                await self._api.send_message(chat_id, entry[2])
+            elif kind == 'send' or message_id is None or lost(message_id):
+                if kind != 'edit_markup':
+                    text = entry[2]
+                message_id = None
+                message_id = await self._api.send_message(chat_id, text,
+                                                          keyboard)
+            elif kind == 'edit_text':
+                text = entry[2]
+                await self._api.edit_message_text(chat_id, message_id, text,
+                                                  keyboard)
+            else:
+                await self._api.edit_message_reply_markup(chat_id, message_id,
+                                                          keyboard)
+        except Exception:
+            self.failed += 1
+        return message_id, text
+
+    def _made(self, key):
+        """
+        Tells a worker its calls to a chat were made, once the last one was,
+        through the OutboundQueue too.
+        """
+        panel = self.panels.get(key)
+        if panel is None or not panel.done() or \
+                self.outbound is not None and self.outbound.queued(key[1]):
+            return
+        count = self._unsent.pop(key, 0)
+        worker = self.workers.get(key[0])
+        if count and worker is not None:
+            worker.made(key[1], count)
+
+    def _idle(self, chat_id):
+        """ Reports the calls made once the OutboundQueue is done with a chat. """
+        for name in self.workers:
+            if (name, chat_id) in self._unsent:
+                self._made((name, chat_id))
+
+    def _imported(self, name, snapshots):
+        """ Hands the tables exported by a worker to their new workers. """
+        self._exports[name] -= 1
+        imports = {}
+        for chat_id, count, snapshot in snapshots:
+            self.in_flight[chat_id] = self.in_flight.get(chat_id, 0) - count
+            self.routes.pop(chat_id, None)
+            if not self.ring.nodes:
+                continue
+            owner = self.ring.node_for(chat_id)
+            if snapshot is not None:
+                self.routes[chat_id] = owner
+                imports.setdefault(owner, []).append(snapshot)
+                self.migrated += 1
+        for owner, tables in imports.items():
+            self.workers[owner].send(('import', tables))
+        for chat_id, _, _ in snapshots:
+            held = self.held.pop(chat_id)
+            for token, update in held:
+                self._route(chat_id, token, update)
+            if not held and self.in_flight.get(chat_id, 0) <= 0:
+                self.in_flight.pop(chat_id, None)
+        self._stop_drained(self.workers[name])
+
+    def _stopped(self, name, stats):
+        worker = self.workers.pop(name)
+        worker.stats = stats
+        for key in [ key for key, panel in self.panels.items()
+                     if key[0] == name and panel.done() ]:
+            del self.panels[key]
+            self._unsent.pop(key, None)
+        worker.process.join(timeout=5)
+        worker.stopped.set_result(stats)
+
+    async def shutdown(self):
+        """ Stops every worker and the front. """
+        stopping = []
+        for worker in list(self.workers.values()):
+            self.ring.remove(worker.name)
+            worker.send(('stop',))
+            stopping.append(worker.stopped)
+        stats = await asyncio.gather(*stopping)
+        self._outbox.put(None)
+        await self._consumer
+        for handled in self._handled.values():
+            handled.set_result(None)
+        self._handled.clear()
+        await asyncio.gather(*self.panels.values())
+        if self.outbound is not None:
+            await self.outbound.close()
+        return stats
+
+
+
+async def run_cluster_load(n_tables, n_workers, seed=0, latency=0.0,
+                           idle_rate=0.0, idle_timeout=0.5, bots=0,
+                           bot_factory=None, churn=False, rate_limits=None,
+                           limits=None):
+    """
+    Plays `n_tables` concurrent games between fake users on a cluster of
+    `n_workers` workers and returns the load test figures, as `run_load`.
+
+    With `churn`, a worker is added once a third of the tables closed, with
+    rebalancing, and the first one removed at two thirds, migrating its
+    tables.
+    """
+    from .fake import FakeTelegram, outbound_stats
+
+    telegram = FakeTelegram(seed, latency, idle_rate, limits)
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    closed = []
+    cluster = None
+    thirds = [ loop.create_future() for _ in range(2) ]
+
+    def on_close(chat_id, finished):
+        closed.append(finished)
+        for third, share in zip(thirds, (1, 2)):
+            if len(closed) >= share * n_tables // 3 and not third.done():
+                third.set_result(None)
+        if len(closed) == n_tables and not done.done():
+            done.set_result(None)
+
+    async def change():
+        #   One task, so the worker added is on the ring before the removal
+        await thirds[0]
+        first = min(cluster.workers)
+        await cluster.add_worker(rebalance=True)
+        await thirds[1]
+        await cluster.remove_worker(first)
+
+    options = { 'idle_timeout': idle_timeout }
+    if bot_factory is not None:
+        options['bot_factory'] = bot_factory
+    cluster = await Cluster(telegram, on_close, rate_limits=rate_limits,
+                            **options).start(n_workers)
+    telegram.server = cluster
+    start = time.perf_counter()
+    changes = asyncio.ensure_future(change()) if churn else None
+    telegram.open_tables(n_tables, bots=bots)
+    await done
+    elapsed = time.perf_counter() - start
+    if changes is not None:
+        await changes
+    stats = await cluster.shutdown()
+
+    latencies = sorted(telegram.latencies)
+    return {
+        'tables': n_tables,
+        'workers': n_workers,
+        'finished': sum(closed),
+        'updates': cluster.updates,
+        'rejected': sum( worker['rejected'] for worker in stats ),
+        'migrated': cluster.migrated,
+        'messages': telegram.sent,
+        'edits': telegram.edited,
+        'rate_limited': telegram.rate_limited,
+        'outbound': outbound_stats(cluster.outbound),
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(cluster.updates / elapsed, 1),
+        'tables_per_second': round(n_tables / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
@@ -0,0 +1,311 @@
+#   server/fake.py
+"""
+A local stand-in for the Telegram Bot API, for load tests of GameServer
+without a network: fake users join group chats and answer the prompts sent
+to their private chats by picking one of the offered commands.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from functools import partial
+from utils import metrics
+from .outbound import CHAT_RATE, TokenBucket
+from .server import GameServer
+
+#   The default idle timeout of the tables, and with an outbound queue,
+#   where a prompt may wait for the rate limit of its chat.
+IDLE_TIMEOUT = 0.5
+OUTBOUND_IDLE_TIMEOUT = 2 / CHAT_RATE
+
+
+class FakeTelegram:
+    """
+    Delivers the messages of a GameServer to fake users, and their replies
+    back to the server as updates.
+
+    Attributes:
+        server (GameServer):    The server under test.
+        rng (Random):           Chooses the replies of the users.
+        latency (float):        The maximum seconds a user takes to reply.
+        idle_rate (float):      The probability a user ignores a prompt, which
+                                leaves it to the idle timeout.
+        users (dict):           A dictionary mapping user id to its group chat.
+        sent (int):             The number of messages sent by the server.
+        edited (int):           The number of messages edited by the server.
+        messages (dict):        A dictionary mapping (chat id, message id) to
+                                the current (text, keyboard) of a message.
+        latencies (list):       The seconds spent handling each update.
+        limits (dict):          The rate limits to check, as the arguments of
+                                OutboundQueue: 'chat_rate', 'group_rate',
+                                'chat_burst', 'global_rate' and
+                                'global_burst'; None not to check them.
+        rate_limited (int):     The number of calls beyond the limits, which
+                                Telegram would refuse.
+    """
+    def __init__(self, seed=None, latency=0.0, idle_rate=0.0, limits=None):
+        self.server = None
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.idle_rate = idle_rate
+        self.users = {}
+        self.sent = 0
+        self.edited = 0
+        self.messages = {}
+        self.latencies = []
+        self.limits = limits
+        self.rate_limited = 0
+        self._buckets = {}
+        self._pending = set()
+
+    def _check(self, chat_id):
+        """ Counts a call beyond the limit of its chat or the global one. """
+        if self.limits is None:
+            return
+        now = time.monotonic()
+        limits = self.limits
+        if not self._buckets:
+            self._buckets[None] = TokenBucket(limits.get('global_rate', 30.0),
+                                              limits.get('global_burst', 30),
+                                              now)
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            rate = limits.get('group_rate', 20 / 60) if chat_id < 0 \
+                else limits.get('chat_rate', 1.0)
+            bucket = self._buckets[chat_id] = TokenBucket(
+                rate, limits.get('chat_burst', 3), now)
+        limited = False
+        for bucket in (bucket, self._buckets[None]):
+            if bucket.delay(now) > 0:
+                limited = True
+            else:
+                bucket.take(now)
+        self.rate_limited += limited
+
+    async def send_message(self, chat_id, text, keyboard=None):
+        """ Sends a message and returns its id. """
+        self._check(chat_id)
+        self.sent += 1
+        message_id = self.sent
+        self.messages[chat_id, message_id] = (text, keyboard)
+        self.show(chat_id, keyboard)
+        return message_id
+
+    async def edit_message_text(self, chat_id, message_id, text,
+                                keyboard=None):
+        """ Replaces the text and keyboard of a message. """
+        self._edit(chat_id, message_id, text, keyboard)
+
+    async def edit_message_reply_markup(self, chat_id, message_id,
+                                        keyboard=None):
+        """ Replaces the keyboard of a message. """
+        self._edit(chat_id, message_id,
+                   self.messages[chat_id, message_id][0], keyboard)
+
+    def _edit(self, chat_id, message_id, text, keyboard):
+        if (chat_id, message_id) not in self.messages:
+            raise ValueError(f'Message {message_id} not found in {chat_id}.')
+        if self.messages[chat_id, message_id] == (text, keyboard):
+            raise ValueError('Message is not modified.')
+        self._check(chat_id)
+        self.edited += 1
+        self.messages[chat_id, message_id] = (text, keyboard)
+        self.show(chat_id, keyboard)
+
+    def show(self, chat_id, keyboard):
+        """ Makes the user of a private chat press one of the buttons. """
+        if keyboard and chat_id in self.users:
+            if self.rng.random() < self.idle_rate:
+                return
+            row = keyboard[self.rng.randrange(len(keyboard))]
+            command = row[self.rng.randrange(len(row))]
+            self.post(self.users[chat_id], chat_id, command,
+                      self.rng.random() * self.latency)
+
+    def post(self, chat_id, user_id, text, delay=0.0):
+        """ Sends an update from a user to the server, after `delay` seconds. """
+        update = { 'chat_id': chat_id, 'user_id': user_id,
+                   'name': f'User {user_id}', 'text': text }
+        task = asyncio.ensure_future(self._deliver(update, delay))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _deliver(self, update, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        start = time.perf_counter()
+        await self.server.handle_update(update)
+        self.latencies.append(time.perf_counter() - start)
+
+    def open_tables(self, n_tables, first_chat=-1, bots=0):
+        """
+        Makes four fake users join each of `n_tables` new group chats, or
+        fewer and `bots` bots. Group chats have negative ids and users
+        positive ones, as on Telegram.
+        """
+        for table in range(n_tables):
+            chat_id = first_chat - table
+            for seat in range(4):
+                user_id = table * 4 + seat + 1
+                self.users[user_id] = chat_id
+                self.post(chat_id, user_id,
+                          '/join' if seat < 4 - bots else '/addbot')
+
+
+
+def outbound_stats(outbound):
+    """ Returns the counters of an OutboundQueue, or None. """
+    if outbound is None:
+        return None
+    return { 'calls': outbound.calls, 'merged': outbound.merged,
+             'folded': outbound.folded, 'unchanged': outbound.unchanged,
+             'waited': outbound.waited,
+             'failed': outbound.failed }
+
+
+def profile_stats(profiles):
+    """ Returns the counters of a player profile store, or None. """
+    if profiles is None:
+        return None
+    profiles.flush()
+    return { 'hits': profiles.hits, 'misses': profiles.misses,
+             'queries': profiles.queries,
+             'written': profiles.buffer().flushed,
+             'batches': profiles.buffer().batches }
+
+
+async def run_load(n_tables, seed=0, latency=0.0, idle_rate=0.0,
+                   idle_timeout=0.5, dealer=None, bots=0, bot_factory=None,
+                   rate_limits=None, limits=None, recommender=None,
+                   profiles=None):
+    """
+    Plays `n_tables` concurrent games between fake users and returns the
+    load test figures. With `rate_limits`, the server calls the fake Bot API
+    through an OutboundQueue; with `limits`, the fake counts the calls beyond
+    them; with a `recommender`, it hints the partner cards; with `profiles`,
+    it keeps the player profiles.
+    """
+    telegram = FakeTelegram(seed, latency, idle_rate, limits)
+    done = asyncio.get_running_loop().create_future()
+    closed = []
+
+    def on_close(table):
+        closed.append(table)
+        if len(closed) == n_tables and not done.done():
+            done.set_result(None)
+
+    server = GameServer(telegram, idle_timeout=idle_timeout, dealer=dealer,
+                        on_close=on_close, bot_factory=bot_factory,
+                        rate_limits=rate_limits, recommender=recommender,
+                        profiles=profiles)
+    telegram.server = server
+    start = time.perf_counter()
+    telegram.open_tables(n_tables, bots=bots)
+    await done
+    elapsed = time.perf_counter() - start
+    await server.shutdown()
+
+    latencies = sorted(telegram.latencies)
+    return {
+        'tables': n_tables,
+        'finished': sum(table.game is not None and table.game.finished
+                        for table in closed),
+        'updates': server.updates,
+        'rejected': server.errors,
+        'hints': server.hints,
+        'profiles': profile_stats(profiles),
+        'messages': telegram.sent,
+        'edits': telegram.edited,
+        'prompts_skipped': server.renderer.skipped,
+        'prompts_collapsed': server.renderer.collapsed,
+        'rate_limited': telegram.rate_limited,
+        'outbound': outbound_stats(server.outbound),
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(server.updates / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        'metrics': metrics.snapshot() if metrics.enabled else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load tests the game server '
+                                     'with fake Telegram users.')
+    parser.add_argument('--tables', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--idle-rate', type=float, default=0.0)
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help=f'By default {IDLE_TIMEOUT}, or '
+                        f'{OUTBOUND_IDLE_TIMEOUT} with --outbound.')
+    parser.add_argument('--bots', type=int, default=0,
+                        help='The seats of every table taken by bots.')
+    parser.add_argument('--bot-budget', type=float, default=None,
+                        help='Seats PIMC bots searching this many seconds '
+                        'per card, rather than random ones.')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Record and report the game metrics.')
+    parser.add_argument('--workers', default=None,
+                        help='Hosts the tables on a cluster of worker '
+                        'processes rather than in process, e.g. 1,2,4 for one '
+                        'run per cluster size.')
+    parser.add_argument('--churn', action='store_true',
+                        help='Adds and removes a worker during each cluster '
+                        'run, migrating tables.')
+    parser.add_argument('--outbound', action='store_true',
+                        help='Sends through an outbound queue keeping within '
+                        'the rate limits of Telegram.')
+    parser.add_argument('--check-limits', action='store_true',
+                        help='Counts the calls beyond the rate limits.')
+    parser.add_argument('--global-rate', type=float, default=30.0,
+                        help='The messages per second to every chat, as the '
+                        'limit of the bot.')
+    parser.add_argument('--hints', action='store_true',
+                        help='Hints the partner cards to the bid winners, in '
+                        'process runs.')
+    parser.add_argument('--profiles', action='store_true',
+                        help='Keeps the player profiles, in process runs.')
+    args = parser.parse_args()
+    if args.idle_timeout is None:
+        args.idle_timeout = OUTBOUND_IDLE_TIMEOUT if args.outbound \
+            else IDLE_TIMEOUT
+    metrics.enabled = metrics.enabled or args.metrics
+    limits = { 'global_rate': args.global_rate,
+               'global_burst': max(1, int(args.global_rate)) }
+    rate_limits = limits if args.outbound else None
+    if not args.check_limits:
+        limits = None
+
+    bot_factory = None
+    if args.bot_budget is not None:
+        from ai.pimc import PIMCAgent
+        #   Cluster workers search in process, as they use a core each
+        bot_factory = partial(PIMCAgent, budget=args.bot_budget,
+                              **({} if args.workers is None
+                                 else { 'workers': 0 }))
+    if args.workers is None:
+        recommender = None
+        if args.hints:
+            from ai.partner import PartnerRecommender
+            recommender = PartnerRecommender()
+        profiles = None
+        if args.profiles:
+            from models import PlayerModel
+            profiles = PlayerModel
+        result = asyncio.run(run_load(args.tables, args.seed, args.latency,
+                                      args.idle_rate, args.idle_timeout,
+                                      bots=args.bots, bot_factory=bot_factory,
+                                      rate_limits=rate_limits, limits=limits,
+                                      recommender=recommender,
+                                      profiles=profiles))
+        print(json.dumps(result, indent=2))
+        return
+
+    from .cluster import run_cluster_load
+    for n_workers in map(int, args.workers.split(',')):
+        result = asyncio.run(run_cluster_load(
+            args.tables, n_workers, args.seed, args.latency, args.idle_rate,
+            args.idle_timeout, args.bots, bot_factory, args.churn,
+            rate_limits, limits))
+        print(json.dumps(result))
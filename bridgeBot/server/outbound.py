@@ -0,0 +1,422 @@
+#   server/outbound.py
+"""
+The outbound queue between the server and the Bot API, keeping within the
+rate limits of Telegram.
+
+Every action of a game makes a burst of messages: the commentary of the
+group chat and the prompts of the players. Sent one call each, they run into
+the per-chat limits, so the queue merges them and paces the calls:
+
+*   Consecutive commentary messages to a chat are merged into one message,
+    up to the length limit of a message. Queued edits of a message are
+    folded into one edit with its latest text and keyboard, and an edit
+    leaving the message as it was last sent is dropped.
+*   Every chat has a token bucket, stricter for group chats, and every call
+    takes a token from a global bucket too.
+*   Chats with a prompt (a message with a keyboard, or an edit) are served
+    before chats with commentary only; within a chat, order is kept.
+*   A chat holds at most `max_pending` queued calls: a producer to a full
+    chat waits for room, while the other chats go on.
+"""
+import asyncio
+import time
+from collections import deque
+
+#   The longest text of a Telegram message.
+MAX_TEXT = 4096
+
+#   The messages per second Telegram allows to a private chat.
+CHAT_RATE = 1.0
+
+#   The kinds of queued calls.
+SEND = 'send'
+EDIT_TEXT = 'edit_text'
+EDIT_MARKUP = 'edit_markup'
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average, in bursts of up to
+    `capacity` events.
+
+    Attributes:
+        rate (float):       The tokens added per second.
+        capacity (float):   The most tokens held.
+        tokens (float):     The tokens held at `updated`.
+        updated (float):    The time of the last refill.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """ Returns the seconds to wait for a token, 0 if one is available. """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """ Takes a token, which must be available. """
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        """ Returns True if the bucket refilled completely. """
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+
+class Outgoing:
+    """
+    A queued Bot API call.
+
+    Attributes:
+        kind (str):         One of SEND, EDIT_TEXT and EDIT_MARKUP.
+        text (str):         The text of the message, None for EDIT_MARKUP.
+        keyboard (tuple):   Its keyboard, if any.
+        message_id:         The message edited, for edits: its id, or the
+                            Future of a prompt returned by `send_message`.
+        future (Future):    Receives the message id of a sent prompt, or
+                            None if sending it failed.
+    """
+    __slots__ = ('kind', 'text', 'keyboard', 'message_id', 'future')
+
+    def __init__(self, kind, text=None, keyboard=None, message_id=None,
+                 future=None):
+        self.kind = kind
+        self.text = text
+        self.keyboard = keyboard
+        self.message_id = message_id
+        self.future = future
+
+    @property
+    def is_prompt(self):
+        """ True for calls showing a keyboard, which are served first. """
+        return self.kind != SEND or self.keyboard is not None
+
+
+
+class ChatQueue:
+    """
+    The queued calls of one chat.
+
+    Attributes:
+        chat_id (int):          The chat.
+        items (deque):          The queued Outgoing calls, in order.
+        prompts (int):          The number of prompts among them.
+        bucket (TokenBucket):   The rate limit of the chat.
+        ready (bool):           Whether the chat waits for a sender.
+        busy (bool):            Whether a call to the chat is in progress.
+        room (Event):           Set while the chat has room for calls.
+        shown (dict):           A dictionary mapping the message id (as
+                                given to the edits) of every prompt sent to
+                                its last (text, keyboard) sent.
+    """
+    __slots__ = ('chat_id', 'items', 'prompts', 'bucket', 'ready', 'busy',
+                 'room', 'shown')
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.items = deque()
+        self.prompts = 0
+        self.bucket = bucket
+        self.ready = False
+        self.busy = False
+        self.room = asyncio.Event()
+        self.room.set()
+        self.shown = {}
+
+
+
+class OutboundQueue:
+    """
+    Queues the calls of a server to the Bot API and makes them within the
+    rate limits, with the interface of the bot, so it can stand in for it,
+    e.g. `Renderer(OutboundQueue(bot))`.
+
+    Calls return once queued, so a rate limited chat does not hold up its
+    caller. Sending a prompt returns a Future of its message id, which may be
+    given to the edits of the message before it is sent: calls to a chat are
+    made in order, so the id is known by the time the edits are made.
+
+    Attributes:
+        bot:                    The Bot API (see `Renderer`).
+        chat_rate (float):      The messages per second to a private chat.
+        group_rate (float):     The messages per second to a group chat, a
+                                chat with a negative id.
+        chat_burst (int):       The most messages sent to a chat at once.
+        global_rate (float):    The messages per second to every chat.
+        global_burst (int):     The most messages sent at once.
+        max_pending (int):      The most queued calls of a chat.
+        max_text (int):         The longest text a merge may produce.
+        concurrency (int):      The calls in progress at once, to as many
+                                different chats.
+        on_idle:                An optional callable receiving the chat id of
+                                a chat once its queued calls were all made.
+        chats (dict):           A dictionary mapping chat id to ChatQueue.
+        calls (int):            The number of Bot API calls made.
+        merged (int):           The number of messages merged into another.
+        folded (int):           The number of edits folded into another.
+        unchanged (int):        The number of edits dropped as they left
+                                their message as it was.
+        waited (int):           The number of times a producer waited for
+                                room in a full chat.
+        failed (int):           The number of failed calls.
+    """
+    def __init__(self, bot, chat_rate=CHAT_RATE, group_rate=20 / 60, chat_burst=3,
+                 global_rate=30.0, global_burst=30, max_pending=16,
+                 max_text=MAX_TEXT, concurrency=8, clock=time.monotonic):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_pending = max_pending
+        self.max_text = max_text
+        self.concurrency = concurrency
+        self.clock = clock
+        self.on_idle = None
+        self.chats = {}
+        self.calls = 0
+        self.merged = 0
+        self.folded = 0
+        self.unchanged = 0
+        self.waited = 0
+        self.failed = 0
+        self.bucket = TokenBucket(global_rate, global_burst, clock())
+        self._prompt_ready = deque()
+        self._ready = deque()
+        self._wake = None
+        self._senders = []
+        self._pending = 0
+        self._idle = None
+
+    def __len__(self):
+        """ The number of queued calls. """
+        return self._pending
+
+    def queued(self, chat_id):
+        """ Returns True if calls to a chat are queued or in progress. """
+        chat = self.chats.get(chat_id)
+        return chat is not None and (bool(chat.items) or chat.busy)
+
+    def _chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            chat = self.chats[chat_id] = ChatQueue(
+                chat_id, TokenBucket(rate, self.chat_burst, self.clock()))
+        return chat
+
+    async def send_message(self, chat_id, text, keyboard=None):
+        """
+        Queues a message. Returns the Future of the message id of a prompt,
+        or None for commentary.
+        """
+        chat = await self._room(chat_id)
+        if keyboard is None:
+            last = chat.items[-1] if chat.items else None
+            if last is not None and last.kind == SEND and \
+                    last.keyboard is None and \
+                    len(last.text) + 1 + len(text) <= self.max_text:
+                last.text += '\n' + text
+                self.merged += 1
+                return None
+            self._enqueue(chat, Outgoing(SEND, text))
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(chat, Outgoing(SEND, text, keyboard, future=future))
+        return future
+
+    async def edit_message_text(self, chat_id, message_id, text,
+                                keyboard=None):
+        """ Queues the edit of a message, folding a queued edit of it. """
+        chat = await self._room(chat_id)
+        item = self._queued_edit(chat, message_id)
+        if item is not None:
+            item.kind, item.text, item.keyboard = EDIT_TEXT, text, keyboard
+            self.folded += 1
+            return
+        self._enqueue(chat, Outgoing(EDIT_TEXT, text, keyboard, message_id))
+
+    async def edit_message_reply_markup(self, chat_id, message_id,
+                                        keyboard=None):
+        """ Queues the edit of a keyboard, folding a queued edit of it. """
+        chat = await self._room(chat_id)
+        item = self._queued_edit(chat, message_id)
+        if item is not None:
+            item.keyboard = keyboard
+            self.folded += 1
+            return
+        self._enqueue(chat, Outgoing(EDIT_MARKUP, None, keyboard, message_id))
+
+    @staticmethod
+    def _queued_edit(chat, message_id):
+        """ Returns the last queued call of a chat if it edits `message_id`. """
+        if chat.items:
+            item = chat.items[-1]
+            if item.kind != SEND and item.message_id == message_id:
+                return item
+        return None
+
+    async def _room(self, chat_id):
+        """ Returns the queue of a chat once it has room for a call. """
+        chat = self._chat(chat_id)
+        while len(chat.items) >= self.max_pending:
+            self.waited += 1
+            chat.room.clear()
+            await chat.room.wait()
+            #   The chat may have been dropped, empty, meanwhile
+            chat = self._chat(chat_id)
+        return chat
+
+    def _enqueue(self, chat, item):
+        chat.items.append(item)
+        self._pending += 1
+        if item.is_prompt:
+            chat.prompts += 1
+        self._start()
+        if not chat.busy:
+            self._make_ready(chat)
+
+    def _make_ready(self, chat):
+        """ Queues a chat with calls for the senders, prompts first. """
+        if chat.busy or not chat.items:
+            return
+        if chat.prompts:
+            self._prompt_ready.append(chat)
+        elif chat.ready:
+            return
+        else:
+            self._ready.append(chat)
+        chat.ready = True
+        self._wake.set()
+
+    def _next_chat(self):
+        """ Returns the next ready chat, or None. Stale entries are skipped. """
+        for ready in (self._prompt_ready, self._ready):
+            while ready:
+                chat = ready.popleft()
+                if chat.ready and not chat.busy:
+                    chat.ready = False
+                    return chat
+        return None
+
+    def _start(self):
+        """ Starts the senders on first use, in the running event loop. """
+        if self._senders:
+            return
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._senders = [ asyncio.ensure_future(self._sender())
+                          for _ in range(self.concurrency) ]
+
+    async def _sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat = self._next_chat()
+            if chat is None:
+                if not self._pending:
+                    self._idle.set()
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            delay = chat.bucket.delay(self.clock())
+            if delay > 0:
+                loop.call_later(delay, self._make_ready, chat)
+                continue
+            chat.busy = True
+            while True:
+                delay = self.bucket.delay(self.clock())
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            now = self.clock()
+            chat.bucket.take(now)
+            self.bucket.take(now)
+            item = chat.items.popleft()
+            self._pending -= 1
+            if item.is_prompt:
+                chat.prompts -= 1
+            chat.room.set()
+            await self._call(chat, item)
+            chat.busy = False
+            if chat.items:
+                self._make_ready(chat)
+            else:
+                loop.call_later(chat.bucket.capacity / chat.bucket.rate,
+                                self._forget, chat)
+                if self.on_idle is not None:
+                    self.on_idle(chat.chat_id)
+
+    async def _call(self, chat, item):
+        """ Makes one Bot API call, unless it is an edit changing nothing. """
+        chat_id = chat.chat_id
+        if item.kind != SEND:
+            shown = chat.shown.get(item.message_id)
+            text = item.text
+            if item.kind == EDIT_MARKUP:
+                text = None if shown is None else shown[0]
+            if shown == (text, item.keyboard):
+                self.unchanged += 1
+                return
+        self.calls += 1
+        try:
+            if item.kind == SEND:
+                message_id = await self.bot.send_message(chat_id, item.text,
+                                                         item.keyboard)
+                if item.future is not None:
+                    chat.shown[item.future] = (item.text, item.keyboard)
+                    item.future.set_result(message_id)
+                return
+            message_id = item.message_id
+            if isinstance(message_id, asyncio.Future):
+                #   Sent before, as the calls of a chat are made in order
+                message_id = message_id.result()
+                if message_id is None:
+                    raise ValueError('The message edited was not sent.')
+            if item.kind == EDIT_TEXT:
+                await self.bot.edit_message_text(chat_id, message_id,
+                                                 item.text, item.keyboard)
+            else:
+                await self.bot.edit_message_reply_markup(
+                    chat_id, message_id, item.keyboard)
+            if text is not None:
+                chat.shown[item.message_id] = (text, item.keyboard)
+        except Exception:
+            self.failed += 1
+            if item.future is not None and not item.future.done():
+                item.future.set_result(None)
+
+    def _forget(self, chat):
+        """ Drops the queue of an idle chat once its bucket refilled. """
+        if chat.items or chat.busy or self.chats.get(chat.chat_id) is not chat:
+            return
+        if chat.bucket.full(self.clock()):
+            del self.chats[chat.chat_id]
+            chat.room.set()
+
+    async def drain(self):
+        """ Waits until every queued call was made. """
+        while self._pending or any( chat.busy for chat in self.chats.values() ):
+            self._idle.clear()
+            await self._idle.wait()
+
+    async def close(self):
+        """ Makes the queued calls, then stops the senders. """
+        if self._senders:
+            await self.drain()
+        for sender in self._senders:
+            sender.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        self._senders = []
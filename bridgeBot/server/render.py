@@ -0,0 +1,179 @@
+#   server/render.py
+"""
+Rendering of the private prompts of a table, and the Renderer sending them.
+
+Keyboards are tuples of rows of commands. They are cached by the state they
+show: bid keyboards are built once for every point of the auction, and card
+keyboards and hand texts are cached by card mask, so a prompt shown again,
+e.g. the 39 partner cards, costs a dictionary lookup.
+"""
+import asyncio
+from functools import lru_cache
+from game import bits
+from game.auction import AVAILABLE, N_TRUMPS
+from utils import metrics
+
+#   The most buttons in a row of a card keyboard.
+ROW_WIDTH = 7
+
+
+def _bid_rows(bids):
+    rows = []
+    if bids and bids[0] == 'Pass':
+        rows.append(('/bid Pass',))
+        bids = bids[1:]
+    #   One row per level; the first row holds the rest of the lowest level
+    first = len(bids) % N_TRUMPS
+    if first:
+        rows.append(tuple( f'/bid {bid}' for bid in bids[:first] ))
+    for start in range(first, len(bids), N_TRUMPS):
+        rows.append(tuple( f'/bid {bid}'
+                           for bid in bids[start:start + N_TRUMPS] ))
+    return tuple(rows)
+
+#   BID_KEYBOARDS[pass allowed][highest bid id], as AVAILABLE.
+BID_KEYBOARDS = tuple( tuple( _bid_rows(bids) for bids in row )
+                       for row in AVAILABLE )
+
+
+def bid_keyboard(auction):
+    """ Returns the keyboard of the bids available in an AuctionState. """
+    return BID_KEYBOARDS[auction.can_pass()][auction.highest]
+
+
+@lru_cache(maxsize=65536)
+def card_keyboard(command, mask):
+    """
+    Returns the keyboard offering the cards of `mask` after `command`, e.g.
+    '/play': a row per suit, split in rows of at most ROW_WIDTH cards.
+    """
+    rows = []
+    for suit in range(bits.N_SUITS):
+        cards = [ f'{command} {bits.card_name(card)}'
+                  for card in bits.iter_cards(mask & bits.SUIT_MASKS[suit]) ]
+        for start in range(0, len(cards), ROW_WIDTH):
+            rows.append(tuple(cards[start:start + ROW_WIDTH]))
+    return tuple(rows)
+
+
+@lru_cache(maxsize=65536)
+def hand_text(mask):
+    """ Returns the text showing the hand `mask`, sorted. """
+    return 'Your hand: ' + ', '.join(map(bits.card_name, bits.iter_cards(mask)))
+
+
+def lost(message_id):
+    """
+    Returns True if `message_id` is the handle of a message which could not
+    be sent, as an OutboundQueue resolves it to None (see `Outgoing`).
+    """
+    return isinstance(message_id, asyncio.Future) and message_id.done() \
+        and message_id.result() is None
+
+
+def changed_rows(old, new):
+    """ Returns the number of rows differing between two keyboards. """
+    changed = abs(len(old) - len(new))
+    for old_row, new_row in zip(old, new):
+        if old_row != new_row:
+            changed += 1
+    return changed
+
+
+
+class Panel:
+    """
+    The message of a chat carrying its keyboard, as last rendered.
+
+    Attributes:
+        message_id (int):   The id of the message.
+        text (str):         Its text.
+        keyboard (tuple):   Its keyboard.
+    """
+    __slots__ = ('message_id', 'text', 'keyboard')
+
+    def __init__(self, message_id, text, keyboard):
+        self.message_id = message_id
+        self.text = text
+        self.keyboard = keyboard
+
+
+
+class Renderer:
+    """
+    Sends the messages of tables through the Bot API, keeping a single panel
+    message per chat for prompts.
+
+    Messages without a keyboard are sent as they are. A message with a
+    keyboard is shown on the panel of its chat: sent the first time, then
+    edited in place, with only its keyboard when the text is unchanged, and
+    not at all when nothing changed. A panel which could not be sent is sent
+    again. Of the prompts to one chat within a batch of messages, only the
+    last one is shown.
+
+    The bot must provide `send_message(chat_id, text, keyboard)` returning
+    the message id, or a handle of it its edits accept (see `OutboundQueue`),
+    `edit_message_text(chat_id, message_id, text, keyboard)` and
+    `edit_message_reply_markup(chat_id, message_id, keyboard)`.
+
+    Attributes:
+        bot:                The outbound Bot API.
+        panels (dict):      A dictionary mapping chat id to its Panel.
+        sent (int):         The number of messages sent.
+        edited (int):       The number of messages edited.
+        skipped (int):      The number of prompts needing no API call.
+        collapsed (int):    The number of prompts dropped for a later prompt
+                            to the same chat.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.panels = {}
+        self.sent = 0
+        self.edited = 0
+        self.skipped = 0
+        self.collapsed = 0
+
+    async def send(self, messages):
+        """ Sends a batch of messages, in order. """
+        last_prompt = { message.chat_id: i for i, message in enumerate(messages)
+                        if message.keyboard is not None }
+        for i, message in enumerate(messages):
+            if message.keyboard is None:
+                self.sent += 1
+                await self.bot.send_message(message.chat_id, message.text)
+            elif last_prompt[message.chat_id] != i:
+                self.collapsed += 1
+            else:
+                await self.show(message)
+
+    async def show(self, message):
+        """ Shows a prompt on the panel of its chat. """
+        chat_id, text, keyboard = message.chat_id, message.text, \
+            message.keyboard
+        panel = self.panels.get(chat_id)
+        if panel is None or lost(panel.message_id):
+            self.sent += 1
+            message_id = await self.bot.send_message(chat_id, text, keyboard)
+            self.panels[chat_id] = Panel(message_id, text, keyboard)
+            return
+        if panel.keyboard is keyboard or panel.keyboard == keyboard:
+            if panel.text == text:
+                self.skipped += 1
+                return
+        elif metrics.enabled:
+            metrics.observe('render_rows_changed',
+                            changed_rows(panel.keyboard, keyboard))
+        self.edited += 1
+        if panel.text == text:
+            await self.bot.edit_message_reply_markup(chat_id, panel.message_id,
+                                                     keyboard)
+        else:
+            await self.bot.edit_message_text(chat_id, panel.message_id, text,
+                                             keyboard)
+        panel.text = text
+        panel.keyboard = keyboard
+
+    def forget(self, chat_ids):
+        """ Drops the panels of chats, e.g. of the players of a closed table. """
+        for chat_id in chat_ids:
+            self.panels.pop(chat_id, None)
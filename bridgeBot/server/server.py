@@ -0,0 +1,330 @@
+#   server/server.py
+import asyncio
+from game import RandomAgent
+from models import GameLogModel
+from .outbound import OutboundQueue
+from .render import Renderer
+from .table import Table, JOINING, PARTNER, OVER, is_bot
+
+
+class GameServer:
+    """
+    Hosts the tables of many group chats in one asyncio event loop.
+
+    Updates are Telegram-style dicts with 'chat_id', 'user_id', 'name' and
+    'text'. Each table has its own lock, so updates of one table are applied
+    in order while tables proceed independently, and nothing blocks the loop
+    while a table waits on a player. A player who does not act within
+    `idle_timeout` seconds has their agent act for them; a table waiting for
+    players for `join_timeout` seconds, or acted for `max_timeouts` times in a
+    row, is closed. Bots seated with '/addbot' act as soon as it is their
+    turn, in a worker thread so a searching bot does not block other tables.
+
+    Messages are sent through a Renderer, which edits the prompt message of
+    a chat in place rather than sending a new one per prompt, and with
+    `rate_limits` through an OutboundQueue pacing the calls.
+
+    With a `recommender`, the bid winner choosing a partner card is sent a
+    hint of the best cards, computed in a worker thread once the prompt is
+    out, so the hint never delays the table.
+
+    With `profiles`, e.g. `models.PlayerModel`, a table starting announces
+    the ratings of its players, looked up together in a worker thread, and a
+    finished game is counted into their profiles; bots have no profile.
+
+    A server keeping journals can hand its tables over to another server,
+    e.g. in another process (see `server.cluster`), with `export_table` and
+    `import_table`.
+
+    Attributes:
+        bot:                    The outbound Bot API (see `Renderer`).
+        outbound (OutboundQueue):   Paces the calls to `bot` within the rate
+                                limits, or None to call it directly.
+        renderer (Renderer):    Sends the messages of every table.
+        tables (dict):          A dictionary mapping chat id to open Table.
+        idle_timeout (float):   Seconds a player may take to act.
+        join_timeout (float):   Seconds a table may wait for players.
+        max_timeouts (int):     Consecutive timeouts closing a table.
+        dealer (DealGenerator): The generator to deal from, by default
+                                `SetupPhase.DEALER`.
+        agent_factory:          Builds the agent acting for idle players.
+        bot_factory:            Builds the agent of every bot, by default
+                                `agent_factory`.
+        on_close:               An optional callable receiving every closed
+                                Table.
+        event_log:              The WriteBehindBuffer logging the decisions of
+                                every game, or None not to log them.
+        journal (bool):         Whether tables keep their events in memory,
+                                so they can be exported.
+        recommender (PartnerRecommender):   Hints the partner cards to human
+                                bid winners (see `ai.partner`), or None.
+        profiles:               The store of the player profiles, as
+                                `models.PlayerModel`, or None.
+        updates (int):          The number of updates handled.
+        errors (int):           The number of rejected commands.
+        hints (int):            The number of partner card hints sent.
+    """
+    def __init__(self, bot, idle_timeout=60.0, join_timeout=600.0,
+                 max_timeouts=8, dealer=None, agent_factory=RandomAgent,
+                 on_close=None, event_log=None, bot_factory=None,
+                 journal=False, rate_limits=None, recommender=None,
+                 profiles=None):
+        self.bot = bot
+        self.outbound = None
+        if rate_limits is not None:
+            self.outbound = OutboundQueue(bot, **rate_limits)
+        self.renderer = Renderer(bot if self.outbound is None
+                                 else self.outbound)
+        #   Knows the calls still to be made: the OutboundQueue, or a bot
+        #   making its calls elsewhere, as the ForwardingBot of a cluster
+        #   worker
+        self._unsent = self.outbound if self.outbound is not None \
+            else bot if hasattr(bot, 'queued') else None
+        self.tables = {}
+        self.idle_timeout = idle_timeout
+        self.join_timeout = join_timeout
+        self.max_timeouts = max_timeouts
+        self.dealer = dealer
+        self.agent_factory = agent_factory
+        self.bot_factory = bot_factory
+        self.on_close = on_close
+        self.event_log = event_log
+        self.journal = journal
+        self.recommender = recommender
+        self.profiles = profiles
+        self.updates = 0
+        self.errors = 0
+        self.hints = 0
+        self._tasks = set()
+        self._records = set()
+
+    def table(self, chat_id):
+        """ Returns the open table of a chat, opening one if needed. """
+        table = self.tables.get(chat_id)
+        if table is None:
+            table = Table(chat_id, self.dealer, self.agent_factory,
+                          self.event_log, self.bot_factory, self.journal)
+            table.lock = asyncio.Lock()
+            self.tables[chat_id] = table
+        return table
+
+    async def handle_update(self, update):
+        """ Applies one update to its table and sends the resulting messages. """
+        self.updates += 1
+        chat_id = update['chat_id']
+        text = update['text']
+        if chat_id not in self.tables and text not in ('/join', '/addbot'):
+            return
+        table = self.table(chat_id)
+        async with table.lock:
+            if table.stage == OVER:
+                return
+            joining = table.stage == JOINING
+            try:
+                if text == '/join':
+                    table.join(update['user_id'], update['name'])
+                elif text == '/addbot':
+                    table.add_bot()
+                else:
+                    table.handle(update['user_id'], text)
+            except ValueError as error:
+                self.errors += 1
+                table.say(str(error), chat_id=update['user_id'])
+            await self._flush(table)
+            self._reschedule(table)
+            if joining and table.stage != JOINING and \
+                    self.profiles is not None:
+                self._spawn(self._announce_ratings, table)
+
+    async def restore(self, chat_id, game_id):
+        """
+        Reopens the table of a chat from the logged events of its game, e.g.
+        on a new worker after the one hosting it crashed.
+        """
+        documents = await asyncio.get_running_loop().run_in_executor(
+            None, GameLogModel.get_events, game_id)
+        if not documents:
+            raise ValueError(f'No events are logged for game {game_id}.')
+        table = Table.restore(chat_id, game_id, documents, self.agent_factory,
+                              self.event_log, self.bot_factory, self.journal)
+        return await self._host(table)
+
+    async def export_table(self, chat_id):
+        """
+        Stops hosting the open table of a chat, to host it elsewhere.
+
+        Returns:
+            dict: The `Table.snapshot` of the table, or None if the chat has
+            no open table.
+        """
+        table = self.tables.get(chat_id)
+        if table is None:
+            return None
+        async with table.lock:
+            if self.tables.get(chat_id) is not table or table.stage == OVER:
+                return None
+            snapshot = table.snapshot()
+            #   A pending timeout or bot action sees the table moved on
+            if table.timer is not None:
+                table.timer.cancel()
+                table.timer = None
+            table.version += 1
+            del self.tables[chat_id]
+            self.renderer.forget( user_id for user_id, _ in table.members )
+        return snapshot
+
+    async def import_table(self, snapshot):
+        """ Hosts a table exported by `export_table`, and prompts it. """
+        return await self._host(Table.resume(snapshot, self.agent_factory,
+                                             self.event_log, self.bot_factory,
+                                             self.journal))
+
+    async def _host(self, table):
+        """ Opens a rebuilt table and sends its messages. """
+        table.lock = asyncio.Lock()
+        self.tables[table.chat_id] = table
+        async with table.lock:
+            await self._flush(table)
+            self._reschedule(table)
+        return table
+
+    async def _flush(self, table):
+        """ Sends the queued messages of a table, in order. """
+        await self.renderer.send(table.take_outbox())
+
+    def _reschedule(self, table):
+        """
+        Restarts the idle timer of a table, closes a finished one, or lets the
+        bot to act play.
+        """
+        if table.timer is not None:
+            table.timer.cancel()
+            table.timer = None
+        table.version += 1
+        if table.stage == OVER:
+            self._close(table)
+            return
+        if table.bot_to_act:
+            self._spawn(self._bot_act, table, table.version)
+            return
+        if table.stage == PARTNER and self.recommender is not None and \
+                not table.hinted:
+            table.hinted = True
+            self._spawn(self._hint, table, table.version)
+        delay = self.join_timeout if table.stage == JOINING \
+            else self.idle_timeout
+        table.timer = asyncio.get_running_loop().call_later(
+            delay, self._spawn, self._expire, table, table.version)
+
+    def _spawn(self, function, *args):
+        """ Runs a coroutine function as a task, keeping it until it is done. """
+        task = asyncio.ensure_future(function(*args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _expire(self, table, version):
+        """
+        Handles the idle timer of a table running out, unless the table moved
+        on while the timeout waited for the lock. While calls to its players
+        are still to be made, by the outbound queue or the front of a cluster,
+        the timer restarts instead, as they may not have seen their prompt
+        yet.
+        """
+        async with table.lock:
+            if table.version != version or table.stage == OVER:
+                return
+            if self._unsent is not None and \
+                    any( self._unsent.queued(user_id)
+                         for user_id, _ in table.members ):
+                table.timer = asyncio.get_running_loop().call_later(
+                    self.idle_timeout, self._spawn, self._expire, table,
+                    version)
+                return
+            if table.stage == JOINING or table.timeouts >= self.max_timeouts:
+                table.stage = OVER
+                table.say('The table was closed for inactivity.')
+            else:
+                table.auto_act()
+            await self._flush(table)
+            self._reschedule(table)
+
+    async def _bot_act(self, table, version):
+        """ Lets the bot to act play, unless the table moved on meanwhile. """
+        async with table.lock:
+            if table.version != version or not table.bot_to_act:
+                return
+            await asyncio.get_running_loop().run_in_executor(None,
+                                                             table.auto_act)
+            await self._flush(table)
+            self._reschedule(table)
+
+    async def _hint(self, table, version):
+        """
+        Sends the bid winner a hint of the best partner cards, unless the
+        table moved on while the hint was computed.
+        """
+        async with table.lock:
+            if table.version != version or table.stage != PARTNER:
+                return
+            player = table.to_act
+            situation = self.recommender.situation(table.bidding, player)
+        ranking = await asyncio.get_running_loop().run_in_executor(
+            None, self.recommender.rank, *situation)
+        async with table.lock:
+            if table.version != version or table.stage != PARTNER:
+                return
+            table.say(self.recommender.hint(ranking, table.bidding.cards),
+                      chat_id=player.telegram_id)
+            self.hints += 1
+            await self._flush(table)
+
+    async def _announce_ratings(self, table):
+        """ Tells a starting table the ratings of its players. """
+        members = [ (user_id, name) for user_id, name in table.members
+                    if not is_bot(user_id) ]
+        if not members:
+            return
+        profiles = await asyncio.get_running_loop().run_in_executor(
+            None, self.profiles.get_players,
+            [ user_id for user_id, _ in members ])
+        async with table.lock:
+            if table.stage == OVER:
+                return
+            table.say('Ratings: ' + ', '.join(
+                f"{name} {profile['rating']}"
+                for (_, name), profile in zip(members, profiles) ) + '.')
+            await self._flush(table)
+
+    async def _record(self, game):
+        """ Counts a finished game into the profiles of its players. """
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.profiles.record_game, game,
+            lambda user_id: not is_bot(user_id))
+
+    def _close(self, table):
+        """ Forgets a finished table, recording its game. """
+        if self.tables.get(table.chat_id) is table:
+            del self.tables[table.chat_id]
+        if self.profiles is not None and table.game is not None and \
+                table.game.finished:
+            task = asyncio.ensure_future(self._record(table.game))
+            self._records.add(task)
+            task.add_done_callback(self._records.discard)
+        self.renderer.forget( user_id for user_id, _ in table.members )
+        if self.on_close:
+            self.on_close(table)
+
+    async def shutdown(self):
+        """
+        Cancels every idle timer and pending timeout, records the finished
+        games, and makes the queued Bot API calls.
+        """
+        for table in self.tables.values():
+            if table.timer is not None:
+                table.timer.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*self._records, return_exceptions=True)
+        if self.outbound is not None:
+            await self.outbound.close()
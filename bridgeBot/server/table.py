@@ -0,0 +1,391 @@
+#   server/table.py
+from bson.objectid import ObjectId
+from game import SetupPhase, BiddingPhase, GamePhase, RandomAgent
+from game import bits, events
+from models import GameLogger, replay
+from . import render
+
+JOINING = 'joining'
+BIDDING = 'bidding'
+PARTNER = 'partner'
+PLAYING = 'playing'
+OVER = 'over'
+
+#   The user ids of bots seated with `Table.add_bot` start with this prefix.
+BOT_PREFIX = 'bot:'
+
+
+def is_bot(user_id):
+    """ Returns True if a member user id is one of a bot. """
+    return isinstance(user_id, str) and user_id.startswith(BOT_PREFIX)
+
+
+
+class Journal(list):
+    """
+    The event documents of one game kept in memory, in order, as the buffer
+    of a GameLogger; a table keeping one can be moved to another process
+    without reading the event log back.
+    """
+    def add(self, document):
+        self.append(document)
+
+
+
+class Message:
+    """
+    An outbound chat message.
+
+    Attributes:
+        chat_id (int):          The chat to send to: the group chat of the
+                                table, or the private chat of a player.
+        text (str):             The text of the message.
+        keyboard (tuple):       The rows of commands offered as buttons, if
+                                any (see `server.render`).
+    """
+    __slots__ = ('chat_id', 'text', 'keyboard')
+
+    def __init__(self, chat_id, text, keyboard=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.keyboard = keyboard
+
+    def __repr__(self):
+        return f'Message({self.chat_id}, {self.text!r})'
+
+
+
+class Table:
+    """
+    One game hosted in a group chat, advanced one command at a time.
+
+    A table only changes state through `join`, `handle` and `auto_act`, which
+    queue the messages to send in `outbox` rather than sending them, so the
+    server decides when and how they go out. Commands are not thread or task
+    safe; the server serializes them with `lock`.
+
+    Attributes:
+        chat_id (int):          The group chat of the table.
+        members (list):         The (user id, name) of the joined players, in
+                                seat order. Bots have string user ids starting
+                                with BOT_PREFIX.
+        stage (str):            One of JOINING, BIDDING, PARTNER, PLAYING and
+                                OVER.
+        setup (SetupPhase):     The setup phase, once four players joined.
+        bidding (BiddingPhase): The bidding phase, once four players joined.
+        game (GamePhase):       The game phase, once the partner is selected.
+        game_id (str):          The id of the game in the event log.
+        event_log:              The WriteBehindBuffer logging the decisions of
+                                the game (see `models.GameLogger`), or None.
+        outbox (list):          The Messages queued by the last commands.
+        timeouts (int):         The number of consecutive actions played by
+                                `auto_act` for idle players.
+        lock:                   The asyncio.Lock serializing the commands of
+                                the table, set by the server.
+        timer:                  The pending idle timeout handle, if any.
+        version (int):          Counts the idle timer restarts, so a stale
+                                timeout is ignored.
+        hinted (bool):          Whether the bid winner was sent a partner
+                                card hint, set by the server.
+        journal (Journal):      The event documents of the game, if kept for
+                                `snapshot`, or None.
+    """
+    SEATS = 4
+
+    def __init__(self, chat_id, dealer=None, agent_factory=RandomAgent,
+                 event_log=None, bot_factory=None, journal=False):
+        self.chat_id = chat_id
+        self.dealer = dealer
+        self.agent_factory = agent_factory
+        self.bot_factory = bot_factory or agent_factory
+        self.event_log = event_log
+        self.members = []
+        self.stage = JOINING
+        self.setup = None
+        self.bidding = None
+        self.game = None
+        self.game_id = None
+        self.outbox = []
+        self.timeouts = 0
+        self.lock = None
+        self.timer = None
+        self.version = 0
+        self.hinted = False
+        self.journal = Journal() if journal else None
+
+    def say(self, text, chat_id=None, keyboard=None):
+        """ Queues a message, to the group chat unless `chat_id` is given. """
+        self.outbox.append(Message(self.chat_id if chat_id is None
+                                   else chat_id, text, keyboard))
+
+    def take_outbox(self):
+        """ Returns and clears the queued messages. """
+        outbox, self.outbox = self.outbox, []
+        return outbox
+
+    @property
+    def to_act(self):
+        """ The Player expected to act next, or None. """
+        if self.stage in (BIDDING, PARTNER):
+            return self.bidding.to_act
+        if self.stage == PLAYING:
+            return self.game.to_act
+        return None
+
+    @property
+    def bot_to_act(self):
+        """ True if a bot is expected to act next. """
+        player = self.to_act
+        return player is not None and is_bot(player.telegram_id)
+
+    def player_of(self, user_id):
+        """ Returns the Player of a user, or None if they are not seated. """
+        if self.setup is None:
+            return None
+        for player in self.setup.players:
+            if player.telegram_id == user_id:
+                return player
+        return None
+
+    def join(self, user_id, name):
+        """
+        Seats a user, and deals once every seat is taken.
+
+        Raises:
+            ValueError: If the user is already seated or the table is full.
+        """
+        if self.stage != JOINING:
+            raise ValueError('The game has already started.')
+        if any(member[0] == user_id for member in self.members):
+            raise ValueError(f'{name} has already joined.')
+        self.members.append((user_id, name))
+        self.say(f'{name} joined ({len(self.members)}/{self.SEATS}).')
+        if len(self.members) == self.SEATS:
+            self.start()
+
+    def add_bot(self):
+        """
+        Seats a bot, which plays with the agents of `bot_factory` without
+        waiting for the idle timeout.
+
+        Raises:
+            ValueError: If the table is full.
+        """
+        if self.stage != JOINING:
+            raise ValueError('The game has already started.')
+        seat = len(self.members) + 1
+        self.join(f'{BOT_PREFIX}{seat}', f'Bot {seat}')
+
+    def listeners(self, logged=0):
+        """
+        Returns the listeners of the game; the first `logged` documents of the
+        game are not logged again.
+        """
+        listeners = [self.narrate]
+        if self.event_log is not None:
+            listeners.append(GameLogger(self.game_id, self.event_log,
+                                        logged=logged))
+        if self.journal is not None:
+            listeners.append(GameLogger(self.game_id, self.journal,
+                                        logged=logged))
+        return listeners
+
+    def start(self):
+        """ Deals, sends every player their hand and opens the bidding. """
+        self.game_id = str(ObjectId())
+        names = [ name for _, name in self.members ]
+        ids = [ user_id for user_id, _ in self.members ]
+        agents = self.agents()
+        self.setup = SetupPhase(names, agents, self.listeners(), self.dealer,
+                                ids)
+        for player in self.setup.players:
+            if is_bot(player.telegram_id):
+                continue
+            self.say(render.hand_text(player.mask),
+                     chat_id=player.telegram_id)
+        self.bidding = BiddingPhase(self.setup)
+        self.stage = BIDDING
+        self.prompt()
+
+    def agents(self):
+        """ Returns a new agent for every member, in seat order. """
+        return [ self.bot_factory() if is_bot(user_id) else
+                 self.agent_factory() for user_id, _ in self.members ]
+
+    def snapshot(self):
+        """
+        Returns what `resume` needs to host the table in another process: its
+        chat, members, game id and the documents of its journal.
+
+        Raises:
+            ValueError: If the game started without a journal.
+        """
+        if self.stage != JOINING and self.journal is None:
+            raise ValueError(f'The table of {self.chat_id} keeps no journal.')
+        return { 'chat_id': self.chat_id, 'members': list(self.members),
+                 'game_id': self.game_id,
+                 'documents': list(self.journal or ()) }
+
+    @classmethod
+    def resume(cls, snapshot, agent_factory=RandomAgent, event_log=None,
+               bot_factory=None, journal=False):
+        """
+        Rebuilds a table from its `snapshot`. The table carries on silently:
+        its players keep the prompts they were shown.
+        """
+        if snapshot['documents']:
+            table = cls.restore(snapshot['chat_id'], snapshot['game_id'],
+                                snapshot['documents'], agent_factory,
+                                event_log, bot_factory, journal)
+            table.take_outbox()
+            return table
+        #   Still joining: seat the members again, without announcing them
+        table = cls(snapshot['chat_id'], agent_factory=agent_factory,
+                    event_log=event_log, bot_factory=bot_factory,
+                    journal=journal)
+        table.members = list(snapshot['members'])
+        return table
+
+    @classmethod
+    def restore(cls, chat_id, game_id, documents, agent_factory=RandomAgent,
+                event_log=None, bot_factory=None, journal=False):
+        """
+        Rebuilds a table from the logged events of its game, e.g. after the
+        worker hosting it crashed, and prompts the player to act next.
+
+        Arguments:
+            chat_id (int):              The group chat of the table.
+            game_id (str):              The id of the game in the event log.
+            documents (list of dict):   The event documents of the game.
+        """
+        table = cls(chat_id, agent_factory=agent_factory, event_log=event_log,
+                    bot_factory=bot_factory, journal=journal)
+        table.game_id = game_id
+        if journal:
+            table.journal = Journal(documents)
+        table.members = [ (player['telegram_id'], player['name'])
+                          for player in documents[0]['players'] ]
+        agents = table.agents()
+        narrate, *loggers = table.listeners(len(documents))
+        #   The loggers follow the replay, so the game summary is complete
+        table.setup, table.bidding, table.game = replay(documents, agents,
+                                                        loggers)
+        #   Phases share their listener list; narrate only what follows
+        table.setup.listeners.insert(0, narrate)
+        table.stage = BIDDING if table.game is None else PLAYING
+        table.say('The game was restored.')
+        table.advance()
+        return table
+
+    def handle(self, user_id, text):
+        """
+        Applies a command sent by a seated user: '/bid <bid>',
+        '/partner <card>' or '/play <card>'.
+
+        Raises:
+            ValueError: If the command is unknown, out of turn or illegal.
+        """
+        player = self.player_of(user_id)
+        if player is None:
+            raise ValueError('You are not seated at this table.')
+        command, _, argument = text.partition(' ')
+        if player is not self.to_act:
+            raise ValueError(f'It is not your turn, {player.name}.')
+        if command == '/bid' and self.stage == BIDDING:
+            self.bidding.make_bid(player, argument)
+        elif command == '/partner' and self.stage == PARTNER:
+            self.bidding.choose_partner(player, self._pick(
+                argument, self.bidding.available_partner_cards(player)))
+        elif command == '/play' and self.stage == PLAYING:
+            self.game.play_card(player, self._pick(argument, player.hand))
+        else:
+            raise ValueError(f'{command} is not expected now.')
+        self.timeouts = 0
+        self.advance()
+
+    def auto_act(self):
+        """
+        Lets the agent of the idle player choose for them, or of the bot to
+        act.
+
+        Returns:
+            Player: The player acted for, or None if nobody was expected to.
+        """
+        player = self.to_act
+        if player is None:
+            return None
+        bot = is_bot(player.telegram_id)
+        if not bot:
+            self.say(f'{player.name} timed out.')
+        if self.stage == BIDDING:
+            self.bidding.collect_bid(player)
+        elif self.stage == PARTNER:
+            self.bidding.select_partner(player)
+        else:
+            self.game.play_card(player, self.game.prompt_player_for_card(
+                player, self.game.current_set))
+        if not bot:
+            self.timeouts += 1
+        self.advance()
+        return player
+
+    def advance(self):
+        """ Moves to the next stage once the current one is done. """
+        if self.stage == BIDDING and self.bidding.bidding_over:
+            if self.bidding.trump_bidder is None:
+                self.stage = OVER
+                self.say('Everyone passed, the game is cancelled.')
+                return
+            self.stage = PARTNER
+        if self.stage == PARTNER and self.bidding.partner_selected:
+            self.game = GamePhase(self.bidding)
+            self.stage = PLAYING
+        if self.stage == PLAYING and self.game.finished:
+            self.stage = OVER
+            return
+        self.prompt()
+
+    def prompt(self):
+        """
+        Asks the player to act, privately, with their legal choices. The
+        keyboards come from the caches of `server.render`.
+        """
+        player = self.to_act
+        if is_bot(player.telegram_id):
+            return
+        if self.stage == BIDDING:
+            keyboard = render.bid_keyboard(self.bidding.auction)
+            text = 'Your bid?'
+        elif self.stage == PARTNER:
+            #   Every card not held by the bid winner
+            keyboard = render.card_keyboard('/partner',
+                                            bits.FULL_MASK & ~player.mask)
+            text = 'Select a partner card.'
+        else:
+            keyboard = render.card_keyboard('/play',
+                                            self.game.legal_mask(player))
+            text = 'Your card?'
+        self.say(text, chat_id=player.telegram_id, keyboard=keyboard)
+
+    @staticmethod
+    def _pick(name, cards):
+        for card in cards:
+            if repr(card) == name:
+                return card
+        raise ValueError(f'{name} is not a card you may choose.')
+
+    def narrate(self, event, data):
+        """ Listener turning game events into group chat messages. """
+        if event == events.BID:
+            self.say(f"{data['player'].name}: {data['bid']}")
+        elif event == events.BIDDING_ENDED and data['player'] is not None:
+            self.say(f"{data['player'].name} won the bid with "
+                     f"{data['numeric_bid']} {data['trump_suit']}.")
+        elif event == events.PARTNER_SELECTED:
+            self.say(f"The partner card is {data['card']}.")
+        elif event == events.SET_WON:
+            self.say(f"{data['player'].name} wins the set: " + ', '.join(
+                repr(card) for _, card in data['cards']))
+        elif event == events.GAME_OVER:
+            self.say(f"{data['player'].name} and {data['partner'].name} "
+                     'have won!')
@@ -0,0 +1,6 @@
+#   sim/__init__.py
+from .tournament import Tournament, TournamentStats
+
+__all__ = [
+    'Tournament', 'TournamentStats'
+]
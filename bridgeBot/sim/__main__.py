@@ -0,0 +1,5 @@
+#   sim/__main__.py
+from sim.tournament import main
+
+if __name__ == '__main__':
+    main()
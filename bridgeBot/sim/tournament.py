@@ -0,0 +1,244 @@
+#   sim/tournament.py
+import argparse
+import json
+import os
+from multiprocessing import Pool
+from numpy.random import SeedSequence
+from game import SetupPhase, BiddingPhase, GamePhase, RandomAgent
+from game import RecordCollector, RecordWriter
+from game.dealer import DealGenerator
+from game.engine import DEFAULT_PLAYER_NAMES
+from models import CardModel
+
+class TournamentStats:
+    """
+    Aggregated results of a batch of games. Stats of separate batches are
+    combined with `merge`, so they can be streamed back chunk by chunk.
+
+    Attributes:
+        games (int):            The number of games played.
+        passed_out (int):       The number of games without a bid winner.
+        contracts (dict):       A dictionary mapping (level, trump suit) to a
+                                [played, made] pair of counts.
+        declarer_tricks (list): The number of games in which the declaring
+                                side took 0, 1, ..., 13 sets.
+        defender_tricks (list): As `declarer_tricks`, for the defending side.
+        redeals (int):          The total number of invalid deals discarded
+                                by `SetupPhase.setup`.
+        max_redeals (int):      The most invalid deals discarded for a game.
+        records (list):         The encoded GameRecords of the games, if
+                                recorded. They are not merged.
+    """
+    def __init__(self):
+        self.games = 0
+        self.passed_out = 0
+        self.contracts = {}
+        self.declarer_tricks = [0] * 14
+        self.defender_tricks = [0] * 14
+        self.redeals = 0
+        self.max_redeals = 0
+        self.records = []
+
+    def record(self, game_phase, redeals):
+        """
+        Records the result of a finished game.
+
+        Arguments:
+            game_phase (GamePhase | None):  The finished game phase, or None if
+                                            the game was passed out.
+            redeals (int):                  The invalid deals discarded before
+                                            the deal of the game.
+        """
+        self.games += 1
+        self.redeals += redeals
+        self.max_redeals = max(self.max_redeals, redeals)
+        if game_phase is None:
+            self.passed_out += 1
+            return
+        bidder = game_phase.trump_bidder
+        partner = game_phase.partnership[bidder]
+        declarer = len(bidder.sets_won) + len(partner.sets_won)
+        defender = len(game_phase.sets) - declarer
+        key = (bidder.sets_threshold - 6, game_phase.trump_suit)
+        counts = self.contracts.setdefault(key, [0, 0])
+        counts[0] += 1
+        counts[1] += declarer >= bidder.sets_threshold
+        self.declarer_tricks[declarer] += 1
+        self.defender_tricks[defender] += 1
+
+    def merge(self, other):
+        """ Adds the counts of another TournamentStats into this one. """
+        self.games += other.games
+        self.passed_out += other.passed_out
+        for key, (played, made) in other.contracts.items():
+            counts = self.contracts.setdefault(key, [0, 0])
+            counts[0] += played
+            counts[1] += made
+        for i in range(14):
+            self.declarer_tricks[i] += other.declarer_tricks[i]
+            self.defender_tricks[i] += other.defender_tricks[i]
+        self.redeals += other.redeals
+        self.max_redeals = max(self.max_redeals, other.max_redeals)
+        return self
+
+    def made_rates(self):
+        """
+        Returns a dictionary mapping (level, trump suit) to the fraction of
+        those contracts that were made.
+        """
+        return { key: made / played
+                 for key, (played, made) in sorted(self.contracts.items()) }
+
+    def to_dict(self):
+        """ Returns the stats as a JSON-serializable dictionary. """
+        return {
+            'games': self.games,
+            'passed_out': self.passed_out,
+            'contracts': { f'{level} {suit}': {'played': played, 'made': made}
+                           for (level, suit), (played, made)
+                           in sorted(self.contracts.items()) },
+            'declarer_tricks': self.declarer_tricks,
+            'defender_tricks': self.defender_tricks,
+            'redeals': self.redeals,
+            'max_redeals': self.max_redeals,
+            'mean_redeals': self.redeals / self.games if self.games else 0.0,
+        }
+
+
+
+def chunk_seeds(seed, index):
+    """
+    Derives the deal seed and the four agent seeds of a chunk. They depend
+    only on the tournament seed and the chunk index, not on the worker that
+    plays the chunk.
+    """
+    state = SeedSequence([seed, index]).generate_state(5)
+    return int(state[0]), [ int(s) for s in state[1:] ]
+
+
+def play_chunk(task):
+    """
+    Plays one chunk of games in a worker process.
+
+    Arguments:
+        task (tuple):   The (seed, chunk index, number of games, agent factory,
+                        record) of the chunk. The agent factory is called with
+                        a seed to build each of the four agents. If `record`
+                        is True, the encoded GameRecord of every game is kept
+                        in `records`.
+
+    Returns:
+        TournamentStats: The stats of the chunk.
+    """
+    seed, index, n_games, agent_factory, record = task
+    deal_seed, agent_seeds = chunk_seeds(seed, index)
+    dealer = DealGenerator(deal_seed)
+    agents = [ agent_factory(agent_seed) for agent_seed in agent_seeds ]
+    stats = TournamentStats()
+    for _ in range(n_games):
+        collector = RecordCollector() if record else None
+        setup_game = SetupPhase(DEFAULT_PLAYER_NAMES, agents,
+                                [collector] if record else (), dealer)
+        bidding_game = BiddingPhase(setup_game)
+        bidding_game.start_bidding()
+        if bidding_game.trump_bidder is None:
+            game_phase = None
+        else:
+            bidding_game.select_partner(bidding_game.trump_bidder)
+            game_phase = GamePhase(bidding_game)
+            game_phase.play_game()
+        stats.record(game_phase, setup_game.redeals)
+        if record:
+            stats.records.append(collector.record.encode())
+    return stats
+
+
+def _init_worker():
+    """ Loads the canonical deck once per worker process. """
+    CardModel.get_canonical_deck()
+
+
+
+class Tournament:
+    """
+    Plays many complete games across a process pool.
+
+    Games are split into chunks of `chunk_size` games. Each chunk is seeded
+    from (`seed`, chunk index), so results are reproducible for a given seed
+    and chunk size whatever the number of workers.
+
+    Attributes:
+        seed (int):             The tournament seed.
+        workers (int):          The number of worker processes.
+        chunk_size (int):       The number of games per chunk.
+        agent_factory:          A picklable callable building an agent from a
+                                seed, by default `RandomAgent`.
+    """
+    def __init__(self, seed=0, workers=None, chunk_size=1000,
+                 agent_factory=RandomAgent):
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.agent_factory = agent_factory
+
+    def tasks(self, n_games, record=False):
+        """ Yields the task of every chunk needed to play `n_games` games. """
+        for index, start in enumerate(range(0, n_games, self.chunk_size)):
+            size = min(self.chunk_size, n_games - start)
+            yield (self.seed, index, size, self.agent_factory, record)
+
+    def stream(self, n_games, record=False):
+        """
+        Plays `n_games` games, yielding the stats of each chunk as soon as it
+        is done, in chunk order.
+        """
+        if self.workers == 1:
+            _init_worker()
+            yield from map(play_chunk, self.tasks(n_games, record))
+            return
+        with Pool(self.workers, initializer=_init_worker) as pool:
+            yield from pool.imap(play_chunk, self.tasks(n_games, record))
+
+    def run(self, n_games, progress=None, writer=None):
+        """
+        Plays `n_games` games and returns the merged stats.
+
+        Arguments:
+            n_games (int):          The number of games to play.
+            progress:               An optional callable receiving the running
+                                    TournamentStats after every chunk.
+            writer (RecordWriter):  Receives the record of every game, in
+                                    order, if given.
+
+        Returns:
+            TournamentStats: The stats of all games.
+        """
+        total = TournamentStats()
+        for stats in self.stream(n_games, writer is not None):
+            for data in stats.records:
+                writer.write(data)
+            total.merge(stats)
+            if progress:
+                progress(total)
+        return total
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays games between random '
+                                     'agents and prints the merged stats.')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--records', default=None,
+                        help='A file to write the record of every game to.')
+    args = parser.parse_args()
+
+    tournament = Tournament(args.seed, args.workers, args.chunk_size)
+    if args.records:
+        with RecordWriter(open(args.records, 'wb')) as writer:
+            stats = tournament.run(args.games, writer=writer)
+    else:
+        stats = tournament.run(args.games)
+    print(json.dumps(stats.to_dict(), indent=2))
@@ -1,8 +1,16 @@
 #   utils/__init__.py
 from .config import Config
-from .db import get_collection
+from .db import get_client, use_client, get_database, get_collection, \
+    close_client
+from .metrics import Metrics, metrics
 
 __all__ = [
     'Config',
-    'get_collection'
+    'get_client',
+    'use_client',
+    'get_database',
+    'get_collection',
+    'close_client',
+    'Metrics',
+    'metrics'
 ]
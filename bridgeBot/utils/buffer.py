@@ -0,0 +1,113 @@
+#   utils/buffer.py
+import threading
+import time
+
+class WriteBehindBuffer:
+    """
+    Collects items to write and hands them to `flush_fn` in batches, once
+    `max_items` are pending or the oldest has waited `max_delay` seconds, so
+    many small writes become a few large ones.
+
+    Without `start`, flushes happen inline in `add` once a threshold is
+    reached. After `start`, a daemon thread does every flush, so `add` never
+    waits on the database; a failed flush keeps its items and is retried on
+    the next one.
+
+    Attributes:
+        flush_fn:           A callable writing a list of items, e.g. with
+                            `insert_many`.
+        max_items (int):    The pending items that trigger a flush.
+        max_delay (float):  The seconds an item may wait before a flush.
+        flushed (int):      The number of items written.
+        batches (int):      The number of successful `flush_fn` calls.
+        last_error:         The exception of the last failed flush, if any.
+    """
+    def __init__(self, flush_fn, max_items=500, max_delay=1.0):
+        self.flush_fn = flush_fn
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.flushed = 0
+        self.batches = 0
+        self.last_error = None
+        self._items = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        """ Queues one item. """
+        with self._lock:
+            if not self._items:
+                self._oldest = time.monotonic()
+            self._items.append(item)
+            due = self._due()
+        if due:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def _due(self):
+        return len(self._items) >= self.max_items or (
+            self._items and time.monotonic() - self._oldest >= self.max_delay)
+
+    def flush(self):
+        """
+        Writes every pending item now. Items added meanwhile wait for the next
+        flush; the items of a failed write are put back in front of them.
+        """
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, []
+                oldest, self._oldest = self._oldest, None
+            if not items:
+                return
+            try:
+                self.flush_fn(items)
+            except Exception as error:
+                self.last_error = error
+                with self._lock:
+                    self._items[:0] = items
+                    self._oldest = oldest
+                raise
+            self.flushed += len(items)
+            self.batches += 1
+
+    def start(self):
+        """ Starts the background flushing thread. """
+        if self._thread is None:
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='write-behind')
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._closed:
+            with self._lock:
+                wait = self.max_delay if not self._items else max(
+                    0.0, self._oldest + self.max_delay - time.monotonic())
+            self._wake.wait(wait)
+            self._wake.clear()
+            with self._lock:
+                due = self._due()
+            if due:
+                try:
+                    self.flush()
+                except Exception:
+                    pass    #   Kept in `last_error`; retried next round.
+
+    def close(self):
+        """ Stops the background thread and writes the pending items. """
+        self._closed = True
+        if self._thread is not None:
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
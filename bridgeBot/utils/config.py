@@ -3,3 +3,10 @@ import os
 
 class Config:
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/sg_bridgebot')
+    TRICK_TABLE_PATH = os.getenv('TRICK_TABLE_PATH', 'trick_table.bin')
+    EVENT_FLUSH_SIZE = int(os.getenv('EVENT_FLUSH_SIZE', '500'))
+    EVENT_FLUSH_SECONDS = float(os.getenv('EVENT_FLUSH_SECONDS', '1.0'))
+    PLAYER_CACHE_SIZE = int(os.getenv('PLAYER_CACHE_SIZE', '10000'))
+    PLAYER_FLUSH_SIZE = int(os.getenv('PLAYER_FLUSH_SIZE', '1000'))
+    PLAYER_FLUSH_SECONDS = float(os.getenv('PLAYER_FLUSH_SECONDS', '5.0'))
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
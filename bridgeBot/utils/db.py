@@ -2,8 +2,35 @@
 from pymongo import MongoClient
 from .config import Config
 
-client = MongoClient(Config.MONGO_URI)
-db = client.get_database()
+#   The client is created on first use, so importing modules that depend on
+#   the database never touches the network.
+_client = None
+
+def get_client():
+    """ Returns the process-wide MongoClient, creating it on first use. """
+    global _client
+    if _client is None:
+        _client = MongoClient(Config.MONGO_URI)
+    return _client
+
+def use_client(client):
+    """
+    Makes `client` the process-wide client, e.g. a local stand-in such as a
+    `mongomock.MongoClient` for benchmarks.
+    """
+    global _client
+    _client = client
+
+def get_database():
+    """ Returns the default database of `Config.MONGO_URI`. """
+    return get_client().get_database()
 
 def get_collection(name):
-    return db[name]
+    return get_database()[name]
+
+def close_client():
+    """ Closes the process-wide MongoClient, if one was created. """
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
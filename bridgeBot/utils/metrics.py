@@ -0,0 +1,143 @@
+#   utils/metrics.py
+import threading
+import time
+from contextlib import nullcontext
+from .config import Config
+
+#   Returned by `Metrics.timer` while disabled, so timing costs one call.
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    """ Context manager observing the seconds spent in its block. """
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start,
+                             **self.labels)
+
+
+
+class Metrics:
+    """
+    Process-wide counters and summaries of the game lifecycle.
+
+    A counter only goes up (`inc`); a summary keeps the count, sum and
+    maximum of observed values (`observe`, `timer`), e.g. durations in
+    seconds. Both may carry labels, e.g. `op='find'`. While `enabled` is
+    False every call returns at once, and hot paths check `enabled` first so
+    they do not even build their arguments.
+
+    Attributes:
+        enabled (bool):     Whether to record anything.
+        prefix (str):       Prepended to every metric name on export.
+    """
+    def __init__(self, enabled=False, prefix='bridgebot_'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._counters = {}
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """ Adds `value` to a counter. """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ Adds a value to a summary. """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value > summary[2]:
+                    summary[2] = value
+
+    def timer(self, name, **labels):
+        """
+        Returns a context manager observing the seconds spent in its block,
+        e.g. `with metrics.timer('mongo_seconds', op='find'): ...`.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        """ Forgets every recorded value. """
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    @staticmethod
+    def _label_text(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+    def snapshot(self):
+        """
+        Returns the recorded values as a plain dict, keyed by the metric name
+        with its labels, e.g. 'mongo_seconds{op="find"}'. Counters map to
+        their value, summaries to a dict of count, sum, mean and max.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = { key: list(value)
+                          for key, value in self._summaries.items() }
+        snapshot = {}
+        for (name, labels), value in sorted(counters.items()):
+            snapshot[name + self._label_text(labels)] = value
+        for (name, labels), (count, total, peak) in sorted(summaries.items()):
+            snapshot[name + self._label_text(labels)] = {
+                'count': count, 'sum': total, 'mean': total / count,
+                'max': peak,
+            }
+        return snapshot
+
+    def to_prometheus(self):
+        """ Returns the recorded values in the Prometheus text format. """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted( (key, list(value))
+                                for key, value in self._summaries.items() )
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            name = self.prefix + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{self._label_text(labels)} {value}')
+        for (name, labels), (count, total, peak) in summaries:
+            name = self.prefix + name
+            label_text = self._label_text(labels)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} summary')
+            lines.append(f'{name}_count{label_text} {count}')
+            lines.append(f'{name}_sum{label_text} {total}')
+            lines.append(f'{name}_max{label_text} {peak}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+
+metrics = Metrics(Config.METRICS_ENABLED)